@@ -1,13 +1,17 @@
 import streamlit as st
-from src.retriever import retrieve_top_k, load_faiss_retriever
-from src.generator import get_gemini_llm, generate_answer
-from src.chat_memory import get_memory, reset_memory
+from src.retriever import retrieve_top_k, get_resident_retriever, warm_up_in_background, SessionOverlay, COMMON_QUESTIONS
+from src.generator import FALLBACK_ANSWER
+from src.pipeline import get_pipeline, PipelineBusyError, BUSY_ANSWER
+from src.answer_cache import get_answer_cache
+from src.reranker import RERANK_ENABLED, RERANK_TOP_K
+from src.chat_memory import get_memory
+from src.stats import answer_stats_query
+from src.preload import preload_in_background
 from src.pdf_reader import extract_text_from_pdf, extract_text_from_txt
 from dotenv import load_dotenv
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 import streamlit.components.v1 as components
 import tempfile
+import functools
 import time
 import os
 import io
@@ -38,8 +42,8 @@ if "memory" not in st.session_state:
     st.session_state.memory = get_memory()
 if "bot_typing" not in st.session_state:
     st.session_state.bot_typing = False
-if "custom_vectorstore" not in st.session_state:
-    st.session_state.custom_vectorstore = None
+if "overlay" not in st.session_state:
+    st.session_state.overlay = None
 if "feedback" not in st.session_state:
     st.session_state.feedback = {}
 if "uploaded_docs" not in st.session_state:
@@ -61,20 +65,20 @@ st.session_state.theme = "dark" if mode else "light"
 
 if st.sidebar.button("🔄 Reset Chat"):
     st.session_state.chat_history = []
-    reset_memory()
-    st.session_state.memory = get_memory()
-    st.session_state.custom_vectorstore = None
+    st.session_state.memory.clear()
+    st.session_state.overlay = None
+    st.session_state.uploaded_docs = []
     st.rerun()
 
 if st.sidebar.button("🧼 Clear Memory"):
-    reset_memory()
-    st.session_state.memory = get_memory()
+    st.session_state.memory.clear()
     st.sidebar.success("Conversation memory cleared!")
 
 st.sidebar.markdown("---")
 st.sidebar.subheader("📥 Upload new document")
 uploaded_file = st.sidebar.file_uploader("Upload PDF or TXT", type=["pdf", "txt"])
-if uploaded_file:
+# The uploader keeps its file across reruns; only process each upload once
+if uploaded_file and uploaded_file.name not in st.session_state.uploaded_docs:
     with st.spinner("Processing uploaded file..."):
 
         suffix = ".pdf" if uploaded_file.type == "application/pdf" else ".txt"
@@ -86,13 +90,10 @@ if uploaded_file:
         else:
             new_text = extract_text_from_txt(tmp_path)
 
-      
-        embedding = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2", model_kwargs={'device': 'cpu'})
-        if st.session_state.custom_vectorstore is None:
-            base_retriever = load_faiss_retriever()
-            base_docs = [doc.page_content for doc in base_retriever.get_relevant_documents("")]
-            st.session_state.custom_vectorstore = FAISS.from_texts(base_docs, embedding=embedding)
-        st.session_state.custom_vectorstore.add_texts([new_text])
+        # Uploads go into a small per-session overlay searched alongside the shared index
+        if st.session_state.overlay is None:
+            st.session_state.overlay = SessionOverlay()
+        st.session_state.overlay.add_document(new_text, source=uploaded_file.name)
         st.session_state.uploaded_docs.append(uploaded_file.name)
         st.success("Document uploaded and added to knowledge base!")
         os.unlink(tmp_path)
@@ -108,6 +109,22 @@ if st.session_state.uploaded_docs:
 else:
     st.sidebar.markdown("_No docs uploaded this session._")
 st.sidebar.markdown(f"**Questions asked:** {len(st.session_state.chat_history)}")
+memory_stats = st.session_state.memory.stats()
+st.sidebar.markdown(f"**Memory:** {memory_stats['turns']} recent turns ({memory_stats['tokens']} tokens), "
+                    f"{memory_stats['summarized_turns']} summarized")
+if st.session_state.get("last_timing"):
+    timing = st.session_state.last_timing
+    ttft = timing.get("time_to_first_token")
+    if ttft is not None:
+        st.sidebar.markdown(f"**Last answer:** first token {ttft:.2f}s, total {timing['total_time']:.2f}s")
+    if "retrieval_time" in timing:
+        stages = ", ".join(f"{name} {timing[name + '_time'] * 1000:.0f}ms"
+                           for name in ("embed", "vector_search", "rescore", "lexical_search", "fusion", "fetch", "rerank")
+                           if name + "_time" in timing)
+        st.sidebar.markdown(f"**Retrieval ({timing['retrieval_mode']}):** {timing['retrieval_time'] * 1000:.0f}ms — {stages}")
+    if "prompt_tokens" in timing:
+        st.sidebar.markdown(f"**Prompt:** {timing['prompt_tokens']} tokens, {timing['context_chunks']} chunks, "
+                            f"{timing['history_turns']} turns")
 up_count = sum(1 for v in st.session_state.feedback.values() if v == "up")
 down_count = sum(1 for v in st.session_state.feedback.values() if v == "down")
 st.sidebar.markdown(f"**Feedback:** 👍 {up_count} &nbsp;&nbsp; 👎 {down_count}")
@@ -458,12 +475,12 @@ st.markdown("""
 
 # Example prompts
 with st.expander("💡 Example questions", expanded=False):
-    st.markdown("""
-    - What are the current home loan interest rates?
-    - Why was my loan rejected even with good income?
-    - Is credit history important for loan approval?
-    - What increases the chances of getting a home loan?
-    """)
+    st.markdown("\n".join(f"- {q}" for q in COMMON_QUESTIONS))
+
+# The index is a build artifact: without it there is nothing to retrieve from
+if not get_resident_retriever().index_built():
+    st.error("The knowledge base index has not been built yet. Run `python src/embedder.py`, then reload this page.")
+    st.stop()
 
 # ------------------------ CHAT WINDOW ------------------------ #
 with st.container():
@@ -476,6 +493,7 @@ with st.container():
         """, unsafe_allow_html=True)
     else:
         st.markdown("<div class='chat-box'>", unsafe_allow_html=True)
+        stream_slot = None
         for idx, (q, a) in enumerate(st.session_state.chat_history):
             st.markdown(f"<div class='user-msg fade-in'><span class='user-avatar'>🧑‍💼</span>{q}</div>", unsafe_allow_html=True)
             # Display bot response with proper markdown formatting
@@ -483,6 +501,11 @@ with st.container():
             with col1:
                 st.markdown("<div class='bot-avatar'>🤖</div>", unsafe_allow_html=True)
             with col2:
+                # The pending answer is streamed into this slot further below
+                if st.session_state.bot_typing and idx == len(st.session_state.chat_history) - 1:
+                    stream_slot = st.empty()
+                    stream_slot.markdown("_Typing..._")
+                    continue
                 st.markdown(a)
             # Feedback buttons for each bot answer
             fb_key = f"feedback_{idx}"
@@ -506,8 +529,6 @@ with st.container():
                             st.markdown(f"**Chunk {i+1}:**\n{chunk}")
                     else:
                         st.markdown("_No context retrieved for this answer._")
-        if st.session_state.bot_typing:
-            st.markdown("<div class='bot-msg typing-msg fade-in'><span class='bot-avatar'>🤖</span>Typing...</div>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
     # Download chat as TXT
@@ -552,14 +573,12 @@ with st.form(key="chat_form", clear_on_submit=True):
     user_input = input_col.text_input("Question", placeholder="Ask your loan-related question here...", label_visibility="collapsed", key="text_input")
     submitted = button_col.form_submit_button("➤")
 
-# ------------------------ HANDLE SUBMIT ------------------------ #
-def custom_retrieve_top_k(query, k=5):
-    if st.session_state.custom_vectorstore is not None:
-        docs = st.session_state.custom_vectorstore.similarity_search(query, k=k)
-        return [doc.page_content for doc in docs]
-    else:
-        return retrieve_top_k(query, k=k)
+# The page has rendered: load the model and index, pre-embed the example questions
+# and import the lazily loaded dependencies in the background (once per process)
+warm_up_in_background()
+preload_in_background()
 
+# ------------------------ HANDLE SUBMIT ------------------------ #
 if submitted and user_input:
     st.session_state.bot_typing = True
     st.session_state.chat_history.append((user_input, "..."))
@@ -567,17 +586,61 @@ if submitted and user_input:
     st.rerun()
 
 if st.session_state.bot_typing:
-    time.sleep(1.0)
-    with st.spinner("Generating answer..."):
-        context = custom_retrieve_top_k(user_input, k=5)
-        llm = get_gemini_llm()
-        chat_hist = st.session_state.chat_history[-4:] if len(st.session_state.chat_history) > 1 else []
-        
-        answer = generate_answer(llm=llm, question=user_input, context=context, chat_history=chat_hist, language=st.session_state.language)
-        final_answer = answer.strip() if answer else "I'm not sure based on that input. Could you try rephrasing your question or give more details?"
+    # The form is cleared on submit, so the pending question comes from the history
+    question = st.session_state.chat_history[-1][0]
+    timing = {}
+    language = st.session_state.language
+    cached, query_vector, request = None, None, None
+    # Uploaded documents change the context, so sessions with an overlay bypass the answer cache;
+    # so do questions asked before the embedding model has loaded (retrieval runs lexical-only).
+    # Answers are generated from the conversation so far, so only questions without history or
+    # summary are cached: a follow-up ("what about graduates?") means something else in another session
+    memory = st.session_state.memory
+    use_cache = (st.session_state.overlay is None and not memory.history() and not memory.summary
+                 and get_resident_retriever().embedding_loaded())
+    # Aggregate questions are answered exactly from the stats cube, without the LLM
+    stats_answer = answer_stats_query(question)
+    if stats_answer is not None and stats_answer.direct:
+        context = stats_answer.facts
+        answer_stream = iter([stats_answer.answer])
+        use_cache = False
+    else:
+        start = time.perf_counter()
+        if use_cache:
+            resident = get_resident_retriever()
+            index_version = resident.get_index_version()
+            answer_cache = get_answer_cache(index_version)
+            query_vector = resident.embed_query(question)
+            cached = answer_cache.lookup(query_vector, language, index_version)
+    if cached is not None:
+        context = cached.context
+        answer_stream = iter([cached.answer])
+    elif stats_answer is None or not stats_answer.direct:
+        # Retrieval and generation run on the shared async pipeline; this thread only streams the answer.
+        # Reranked context is more precise, so fewer chunks go into the prompt
+        retrieve = functools.partial(retrieve_top_k, k=RERANK_TOP_K if RERANK_ENABLED else 5,
+                                     overlay=st.session_state.overlay, timings=timing)
+        memory = st.session_state.memory
+        try:
+            request = get_pipeline().submit(question, retrieve=retrieve, chat_history=memory.history(),
+                                            language=language, summary=memory.summary, timing=timing,
+                                            extra_context=stats_answer.facts if stats_answer is not None else None)
+            answer_stream = request.stream()
+        except PipelineBusyError:
+            request, context = None, []
+            answer_stream = iter([BUSY_ANSWER])
+            use_cache = False
+    with stream_slot.container():
+        answer = st.write_stream(answer_stream)
+    if request is not None:
+        context = request.context
+    final_answer = answer.strip() if answer else "I'm not sure based on that input. Could you try rephrasing your question or give more details?"
+    st.session_state.last_timing = timing
+    if use_cache and cached is None and answer and FALLBACK_ANSWER not in final_answer:
+        answer_cache.put(question, query_vector, language, index_version, final_answer, context, cost_seconds=time.perf_counter() - start)
 
-    st.session_state.chat_history[-1] = (user_input, final_answer)
+    st.session_state.chat_history[-1] = (question, final_answer)
     st.session_state.context_history[-1] = context
-    st.session_state.memory.save_context({"input": user_input}, {"output": final_answer})
+    st.session_state.memory.save_context({"input": question}, {"output": final_answer})
     st.session_state.bot_typing = False
     st.rerun()
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+bench_ann.py
+------------
+Benchmarks the FAISS index types supported by src/embedder.py (flat, IVF-Flat,
+IVF-PQ, HNSW) on a synthetic corpus of MiniLM-sized vectors.
+- Clustered, unit-normalized 384-d vectors (--vectors), queries near the data
+- Recall@k of each configuration against the exact flat baseline
+- p50/p99 single-query latency, build time and serialized index size
+- Sweeps the query-time knobs (IVF nprobe, HNSW efSearch)
+
+Usage: python benchmarks/bench_ann.py --vectors 200000 --queries 500
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+from src.embedder import build_ann_index
+from src.retriever import configure_search
+
+DIM = 384
+NPROBES = (1, 8, 16, 64)
+EF_SEARCHES = (16, 64, 128)
+
+
+def synthetic_corpus(n_vectors: int, n_queries: int, dim: int = DIM, clusters: int = 1000, seed: int = 0):
+    """
+    Returns (corpus, queries): points scattered around random centers, like
+    sentence embeddings of related documents, normalized to unit length.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+
+    def sample(n):
+        points = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+    return sample(n_vectors), sample(n_queries)
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int):
+    """
+    Returns (recall@k, p50 ms, p99 ms) for one query at a time.
+    """
+    latencies, hits = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, found = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits.append(found[0])
+    found = np.array(hits)
+    recall = np.mean([len(np.intersect1d(row, expected)) / k for row, expected in zip(found, truth)])
+    return recall, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200_000, help="vectors in the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=500, help="number of queries")
+    parser.add_argument("-k", type=int, default=8, help="neighbours per query (retrieve_top_k default)")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    corpus, queries = synthetic_corpus(args.vectors, args.queries)
+    print(f"vectors: {len(corpus)}  dim: {DIM}  queries: {len(queries)}  k: {args.k}")
+    print(f"{'index':<10}{'knob':<14}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}{'build s':>10}{'size MB':>10}")
+
+    truth = None
+    for index_type in ("flat", "ivf_flat", "ivf_pq", "hnsw"):
+        start = time.perf_counter()
+        index = build_ann_index(corpus, index_type)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+        if index_type == "flat":
+            _, truth = index.search(queries, args.k)
+            knobs = [("exact", {})]
+        elif index_type == "hnsw":
+            knobs = [(f"efSearch={ef}", {"ef_search": ef}) for ef in EF_SEARCHES]
+        else:
+            knobs = [(f"nprobe={nprobe}", {"nprobe": nprobe}) for nprobe in NPROBES]
+        for label, params in knobs:
+            configure_search(index, **params)
+            recall, p50, p99 = measure(index, queries, truth, args.k)
+            print(f"{index_type:<10}{label:<14}{recall:>10.3f}{p50:>10.3f}{p99:>10.3f}{build_seconds:>10.1f}{size_mb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+bench_embeddings.py
+-------------------
+Compares the embedding backends of src/embedding_backend.py (torch,
+torch_int8, onnx, onnx_int8) on chunks of the built index.
+- Each backend runs in a fresh process, so startup (imports + model load)
+  and peak RSS are measured from a cold start
+- p50/p99 single-query latency and batch throughput (texts/s)
+- Cosine agreement of every backend with the torch reference
+  (min cosine must reach AGREEMENT_MIN_COSINE)
+
+Usage: python benchmarks/bench_embeddings.py --texts 512 --backends torch onnx onnx_int8
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+QUERIES = 50
+
+
+def run_backend(backend: str, model_name: str, texts_path: str, out_path: str) -> None:
+    """
+    Child process: loads one backend, times it and saves the embeddings of the texts.
+    """
+    start = time.perf_counter()
+    from src.embedding_backend import get_embeddings
+    embedding = get_embeddings(backend, model_name)
+    embedding.embed_query("warm up")
+    startup = time.perf_counter() - start
+
+    with open(texts_path) as f:
+        texts = json.load(f)
+    latencies = []
+    for text in texts[:QUERIES]:
+        query_start = time.perf_counter()
+        embedding.embed_query(text)
+        latencies.append(time.perf_counter() - query_start)
+    batch_start = time.perf_counter()
+    vectors = np.asarray(embedding.embed_documents(texts), dtype="float32")
+    batch_seconds = time.perf_counter() - batch_start
+    np.save(out_path, vectors)
+    print(json.dumps({
+        "impl": type(embedding).__name__,
+        "startup_s": startup,
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+        "texts_per_s": len(texts) / batch_seconds,
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=512, help="indexed chunks to embed")
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch_int8", "onnx", "onnx_int8"])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="model name or local directory")
+    parser.add_argument("--index", default="embeddings", help="index directory to take the chunks from")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--texts-path", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_backend(args.worker, args.model, args.texts_path, args.out)
+        return
+
+    from src.docstore import DOCSTORE_FILE, SQLiteDocstore
+    from src.embedding_backend import REFERENCE_BACKEND, cosine_agreement
+
+    docstore = SQLiteDocstore(os.path.join(args.index, DOCSTORE_FILE))
+    texts = [text for _, (_, _, text, _) in zip(range(args.texts), docstore.iter_rows())]
+    backends = [REFERENCE_BACKEND] + [backend for backend in args.backends if backend != REFERENCE_BACKEND]
+    print(f"texts: {len(texts)}  model: {args.model}")
+    print(f"{'backend':<12}{'startup s':>10}{'p50 ms':>9}{'p99 ms':>9}{'texts/s':>10}{'RSS MB':>9}{'mean cos':>10}{'min cos':>9}  ok   implementation")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        texts_path = os.path.join(tmp, "texts.json")
+        with open(texts_path, "w") as f:
+            json.dump(texts, f)
+        reference = None
+        for backend in backends:
+            out = os.path.join(tmp, f"{backend}.npy")
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", backend, "--model", args.model,
+                                     "--texts-path", texts_path, "--out", out], capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"{backend:<12} failed: {result.stderr.strip().splitlines()[-1:]}")
+                continue
+            metrics = json.loads(result.stdout.strip().splitlines()[-1])
+            vectors = np.load(out)
+            if backend == REFERENCE_BACKEND:
+                reference = vectors
+            agreement = cosine_agreement(reference, vectors) if reference is not None else None
+            cosines = (f"{agreement['mean_cosine']:>10.4f}{agreement['min_cosine']:>9.4f}  {'yes' if agreement['passed'] else 'NO ':<3}"
+                       if agreement else f"{'-':>10}{'-':>9}  {'-':<3}")
+            # A backend that could not be loaded (e.g. onnxruntime not installed) falls back to torch
+            print(f"{backend:<12}{metrics['startup_s']:>10.2f}{metrics['p50_ms']:>9.2f}{metrics['p99_ms']:>9.2f}"
+                  f"{metrics['texts_per_s']:>10.1f}{metrics['peak_rss_mb']:>9.0f}{cosines}  {metrics['impl']}")
+
+
+if __name__ == "__main__":
+    main()
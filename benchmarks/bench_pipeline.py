@@ -0,0 +1,135 @@
+"""
+bench_pipeline.py
+-----------------
+Measures answer throughput under N simulated concurrent users, against a fake
+Gemini model with configurable latency (no API key or network needed).
+- "sync": each question is answered by generate_answer_stream on a pool of
+  --sync-workers threads (one blocked thread per in-flight question)
+- "pipeline": questions go through src/pipeline.py (one event loop,
+  --concurrency requests in flight)
+- Retrieval is simulated by a sleep of --retrieval-ms
+- Reports throughput, p50/p99 latency, rejected requests and peak thread count
+
+Usage: python benchmarks/bench_pipeline.py --users 32 --questions 4 --llm-latency 1.0
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from src.generator import FakeGenerativeModel, generate_answer_stream
+from src.pipeline import AnswerPipeline, PipelineBusyError
+
+CONTEXT = ["Graduate applicants with a credit history have an approval rate of about 80%."]
+
+
+class ThreadPeak:
+    """
+    Samples threading.active_count() in the background and keeps the peak.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_users(users: int, questions: int, ask) -> tuple:
+    """
+    Runs `users` user threads asking `questions` questions each, one after the
+    other. Returns (latencies, rejected, wall seconds).
+    """
+    latencies, rejected, lock = [], [0], threading.Lock()
+
+    def user(u):
+        for q in range(questions):
+            start = time.perf_counter()
+            try:
+                "".join(ask(f"user {u} question {q}: what is the approval rate?"))
+            except PipelineBusyError:
+                with lock:
+                    rejected[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(u,)) for u in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, rejected[0], time.perf_counter() - start
+
+
+def report(name: str, latencies, rejected: int, wall: float, threads: int) -> None:
+    p50, p99 = (np.percentile(latencies, [50, 99]) if latencies else (0.0, 0.0))
+    print(f"{name:<22}{len(latencies) / wall:>10.2f}{p50:>10.2f}{p99:>10.2f}{rejected:>10}{threads:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=32, help="concurrent simulated users")
+    parser.add_argument("--questions", type=int, default=4, help="questions per user")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="fake Gemini latency before the first chunk (s)")
+    parser.add_argument("--chunk-latency", type=float, default=0.01, help="fake delay between streamed chunks (s)")
+    parser.add_argument("--retrieval-ms", type=float, default=20.0, help="simulated retrieval time (ms)")
+    parser.add_argument("--sync-workers", type=int, default=4, help="threads answering in sync mode")
+    parser.add_argument("--concurrency", type=int, default=32, help="pipeline requests in flight")
+    parser.add_argument("--queue-size", type=int, default=64, help="pipeline queue size")
+    args = parser.parse_args()
+
+    llm = FakeGenerativeModel(latency=args.llm_latency, chunk_latency=args.chunk_latency)
+
+    def retrieve(question):
+        time.sleep(args.retrieval_ms / 1000)
+        return CONTEXT
+
+    print(f"users: {args.users}  questions/user: {args.questions}  llm latency: {args.llm_latency}s")
+    print(f"{'mode':<22}{'q/s':>10}{'p50 s':>10}{'p99 s':>10}{'rejected':>10}{'threads':>10}")
+
+    workers = ThreadPoolExecutor(max_workers=args.sync_workers)
+
+    def ask_sync(question):
+        def answer():
+            return "".join(generate_answer_stream(llm, question, retrieve(question)))
+        return workers.submit(answer).result()
+
+    with ThreadPeak() as peak:
+        latencies, rejected, wall = run_users(args.users, args.questions, ask_sync)
+    workers.shutdown()
+    report(f"sync ({args.sync_workers} threads)", latencies, rejected, wall, peak.peak)
+
+    pipeline = AnswerPipeline(llm_factory=lambda: llm, max_concurrency=args.concurrency, queue_size=args.queue_size)
+
+    def ask_pipeline(question):
+        return pipeline.submit(question, retrieve=retrieve).stream()
+
+    with ThreadPeak() as peak:
+        latencies, rejected, wall = run_users(args.users, args.questions, ask_pipeline)
+    report(f"pipeline ({args.concurrency} in flight)", latencies, rejected, wall, peak.peak)
+    print(pipeline.stats())
+    pipeline.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+bench_startup.py
+----------------
+Startup profile of the app: what importing it costs and how long until the
+first page render.
+- Import breakdown from `python -X importtime` for the modules app.py imports:
+  total time, self time summed per top-level package, and which heavy
+  dependencies (torch, the Gemini SDK, the langchain FAISS vectorstore,
+  PyMuPDF, pandas) were imported eagerly
+- Time to first render: a fresh process runs app.py once with Streamlit's
+  AppTest (no browser), "lazy" as shipped and "eager" with the heavy
+  dependencies imported up front as before (src/preload.py PRELOAD_MODULES)
+- Each measurement is the median of --runs fresh processes
+
+Usage: python benchmarks/bench_startup.py --runs 5 --top 15
+"""
+
+import argparse
+from collections import defaultdict
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import numpy as np
+
+# What app.py imports at the top, in order
+APP_MODULES = ("streamlit", "src.retriever", "src.generator", "src.pipeline", "src.answer_cache", "src.reranker",
+               "src.chat_memory", "src.stats", "src.preload", "src.pdf_reader")
+HEAVY_MODULES = ("torch", "sentence_transformers", "langchain_huggingface", "langchain_community.vectorstores.faiss",
+                 "google.generativeai", "fitz", "pandas")
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)")
+
+
+def import_profile(modules) -> dict:
+    """
+    Runs `python -X importtime -c "import ..."` in a fresh process and returns
+    {"total_s", "packages": {package: self seconds}, "heavy": [imported heavy modules]}.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    packages, imported, total = defaultdict(float), set(), 0.0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        imported.add(name)
+        packages[name.split(".")[0]] += int(self_us) / 1e6
+        # Top-level imports (one space of indentation) add up to the whole import
+        if len(indent) == 1:
+            total += int(cumulative_us) / 1e6
+    return {"total_s": total, "packages": dict(packages), "heavy": [name for name in HEAVY_MODULES if name in imported]}
+
+
+def first_render(mode: str) -> None:
+    """
+    Child process: runs app.py once with AppTest and prints its timings as JSON.
+    """
+    start = time.perf_counter()
+    if mode == "eager":
+        import importlib
+        from src.preload import PRELOAD_MODULES
+        for name in PRELOAD_MODULES + ("langchain_huggingface",):
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    script_start = time.perf_counter()
+    app.run()
+    done = time.perf_counter()
+    print(json.dumps({"first_render_s": done - start, "script_s": done - script_start,
+                      "exception": bool(app.exception),
+                      # Background warm-up and preload threads may have started importing by now
+                      "heavy": [name for name in HEAVY_MODULES if name in sys.modules]}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--top", type=int, default=15, help="packages shown in the import breakdown")
+    parser.add_argument("--first-render", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.first_render:
+        first_render(args.first_render)
+        return
+
+    profiles = [import_profile(APP_MODULES) for _ in range(args.runs)]
+    print(f"import of app.py dependencies: {np.median([p['total_s'] for p in profiles]):.2f}s "
+          f"(median of {args.runs}, python -X importtime)")
+    packages = defaultdict(list)
+    for profile in profiles:
+        for package, seconds in profile["packages"].items():
+            packages[package].append(seconds)
+    print(f"{'package':<28}{'self s':>8}")
+    for package, seconds in sorted(packages.items(), key=lambda item: -np.median(item[1]))[:args.top]:
+        print(f"{package:<28}{np.median(seconds):>8.3f}")
+    print(f"heavy modules imported eagerly: {', '.join(profiles[0]['heavy']) or 'none'}")
+
+    print(f"\n{'mode':<8}{'process s':>11}{'in-process s':>14}{'script s':>10}  heavy modules loaded at first render")
+    for mode in ("lazy", "eager"):
+        walls, results = [], []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--first-render", mode],
+                                    cwd=ROOT, capture_output=True, text=True)
+            walls.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip().splitlines()[-1])
+            results.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        failed = " (app raised)" if any(r["exception"] for r in results) else ""
+        print(f"{mode:<8}{np.median(walls):>11.2f}{np.median([r['first_render_s'] for r in results]):>14.2f}"
+              f"{np.median([r['script_s'] for r in results]):>10.2f}  {', '.join(results[-1]['heavy']) or 'none'}{failed}")
+
+
+if __name__ == "__main__":
+    main()
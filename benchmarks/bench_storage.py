@@ -0,0 +1,90 @@
+"""
+bench_storage.py
+----------------
+Compares the vector storage options of src/embedder.py (float32, float16,
+int8 scalar quantization) on a synthetic corpus of MiniLM-sized vectors.
+- Serialized index size per storage, plus the exact float32 vectors file that
+  compact indexes keep on disk (memory-mapped, read only for rescoring)
+- Recall@k against the exact float32 flat baseline, with the quantized
+  distances alone and after exact rescoring of k * --rescore-factor candidates
+- p50/p99 single-query latency including rescoring
+
+Usage: python benchmarks/bench_storage.py --vectors 200000 --queries 500 --index-types flat hnsw
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+from bench_ann import synthetic_corpus
+from src.embedder import VECTOR_STORAGES, build_ann_index
+from src.retriever import RESCORE_FACTOR, rescore
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray, k: int) -> float:
+    return float(np.mean([len(np.intersect1d(row, expected)) / k for row, expected in zip(found, truth)]))
+
+
+def measure(index, exact: np.ndarray, queries: np.ndarray, k: int, factor: int):
+    """
+    Returns (plain hits, rescored hits, p50 ms, p99 ms) for one query at a time.
+    """
+    plain, rescored, latencies = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, found = index.search(query.reshape(1, -1), k * factor)
+        hits = found[0][found[0] >= 0]
+        if exact is not None:
+            _, hits_rescored = rescore(exact, query, hits, k)
+        else:
+            hits_rescored = hits[:k]
+        latencies.append((time.perf_counter() - start) * 1000)
+        plain.append(hits[:k])
+        rescored.append(hits_rescored)
+    return plain, rescored, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200_000, help="vectors in the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=500, help="number of queries")
+    parser.add_argument("-k", type=int, default=8, help="neighbours per query (retrieve_top_k default)")
+    parser.add_argument("--index-types", nargs="+", default=["flat", "hnsw"], help="flat, ivf_flat, hnsw")
+    parser.add_argument("--rescore-factor", type=int, default=RESCORE_FACTOR, help="candidates fetched per result")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    corpus, queries = synthetic_corpus(args.vectors, args.queries)
+    _, truth = build_ann_index(corpus, "flat").search(queries, args.k)
+    print(f"vectors: {len(corpus)}  queries: {len(queries)}  k: {args.k}  rescore factor: {args.rescore_factor}")
+    print(f"{'index':<10}{'storage':<10}{'index MB':>10}{'exact MB':>10}{'recall@k':>10}{'rescored':>10}"
+          f"{'p50 ms':>10}{'p99 ms':>10}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Compact indexes rescore from the memory-mapped vectors, as the retriever does
+        vectors_path = os.path.join(tmp, "vectors.npy")
+        np.save(vectors_path, corpus)
+        exact = np.load(vectors_path, mmap_mode="r")
+        exact_mb = os.path.getsize(vectors_path) / 1e6
+        for index_type in args.index_types:
+            for storage in VECTOR_STORAGES:
+                index = build_ann_index(corpus, index_type, storage=storage)
+                size_mb = faiss.serialize_index(index).nbytes / 1e6
+                compact = storage != "float32"
+                plain, rescored, p50, p99 = measure(index, exact if compact else None, queries, args.k,
+                                                    args.rescore_factor if compact else 1)
+                print(f"{index_type:<10}{storage:<10}{size_mb:>10.1f}{(exact_mb if compact else 0.0):>10.1f}"
+                      f"{recall_at_k(plain, truth, args.k):>10.3f}{recall_at_k(rescored, truth, args.k):>10.3f}"
+                      f"{p50:>10.3f}{p99:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+answer_cache.py
+---------------
+Semantic answer cache in front of answer generation.
+- Keyed on (normalized query embedding, language, index version)
+- The key holds no conversation state: callers only cache questions asked
+  without chat history or summary (app.py)
+- A hit is a cached query with cosine similarity above a threshold
+- LRU + TTL eviction in memory, optional SQLite store shared across processes
+  (capped at ANSWER_CACHE_DISK_MAX_ENTRIES, oldest pruned on insert; a lookup
+  compares only the ANSWER_CACHE_DISK_SCAN most recent matching rows)
+- Entries for other index versions are ignored and purged on rebuild
+- Exposes hit-rate and latency-saved counters
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = 512
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+# Set to a file path (e.g. .cache/answers.sqlite) to share the cache across processes
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH") or None
+ANSWER_CACHE_DISK_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_DISK_MAX_ENTRIES", "8192"))
+# Rows of the SQLite store compared on an in-memory miss (most recent first)
+ANSWER_CACHE_DISK_SCAN = int(os.getenv("ANSWER_CACHE_DISK_SCAN", "1024"))
+
+
+def normalize(vector) -> np.ndarray:
+    """
+    Returns the query embedding as a unit-length float32 vector.
+    """
+    vector = np.asarray(vector, dtype="float32").ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class CachedAnswer:
+    """
+    A cached answer with the context it was generated from.
+    """
+
+    def __init__(self, question: str, vector: np.ndarray, language: str, index_version: str,
+                 answer: str, context: List[str], cost_seconds: float, created: float):
+        self.question = question
+        self.vector = vector
+        self.language = language
+        self.index_version = index_version
+        self.answer = answer
+        self.context = context
+        self.cost_seconds = cost_seconds
+        self.created = created
+
+
+class SemanticAnswerCache:
+    """
+    Thread-safe semantic cache of final answers.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 ttl: float = ANSWER_CACHE_TTL, store_path: Optional[str] = ANSWER_CACHE_PATH,
+                 disk_max_entries: int = ANSWER_CACHE_DISK_MAX_ENTRIES, disk_scan: int = ANSWER_CACHE_DISK_SCAN):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store_path = store_path
+        self.disk_max_entries = disk_max_entries
+        self.disk_scan = disk_scan
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_id = 0
+        self.metrics = {"lookups": 0, "hits": 0, "disk_hits": 0, "misses": 0, "puts": 0,
+                        "evictions": 0, "disk_evictions": 0, "invalidations": 0, "seconds_saved": 0.0}
+        if store_path:
+            os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS answers (question TEXT, language TEXT, index_version TEXT, "
+                    "vector BLOB, answer TEXT, context TEXT, cost_seconds REAL, created REAL)")
+                conn.execute("DROP INDEX IF EXISTS answers_key")
+                conn.execute("CREATE INDEX IF NOT EXISTS answers_recent ON answers (language, index_version, created)")
+                conn.execute("CREATE INDEX IF NOT EXISTS answers_created ON answers (created)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.store_path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _expired(self, entry: CachedAnswer, now: float) -> bool:
+        return self.ttl > 0 and now - entry.created > self.ttl
+
+    def _best_index(self, candidates: List[CachedAnswer], vector: np.ndarray) -> Optional[int]:
+        """
+        Index of the candidate with the highest cosine similarity, if above the threshold.
+        """
+        if not candidates:
+            return None
+        similarities = np.stack([entry.vector for entry in candidates]) @ vector
+        best = int(np.argmax(similarities))
+        return best if similarities[best] >= self.threshold else None
+
+    def _insert(self, entry: CachedAnswer) -> None:
+        self._entries[self._next_id] = entry
+        self._next_id += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def _lookup_disk(self, vector: np.ndarray, language: str, index_version: str, now: float) -> Optional[CachedAnswer]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT question, vector, answer, context, cost_seconds, created FROM answers "
+                "WHERE language = ? AND index_version = ? AND created >= ? ORDER BY created DESC LIMIT ?",
+                (language, index_version, now - self.ttl if self.ttl > 0 else 0.0, self.disk_scan)).fetchall()
+        candidates = [CachedAnswer(question, np.frombuffer(blob, dtype="float32"), language, index_version,
+                                   answer, context.split("\x1e") if context else [], cost, created)
+                      for question, blob, answer, context, cost, created in rows]
+        best = self._best_index(candidates, vector)
+        return candidates[best] if best is not None else None
+
+    def lookup(self, query_vector, language: str, index_version: str) -> Optional[CachedAnswer]:
+        """
+        Returns the cached answer of the most similar query above the threshold, or None.
+        """
+        vector = normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            self.metrics["lookups"] += 1
+            for key in [key for key, entry in self._entries.items() if self._expired(entry, now)]:
+                del self._entries[key]
+                self.metrics["evictions"] += 1
+            keys = [key for key, entry in self._entries.items()
+                    if entry.language == language and entry.index_version == index_version]
+            best = self._best_index([self._entries[key] for key in keys], vector)
+            match = self._entries[keys[best]] if best is not None else None
+            if match is not None:
+                self._entries.move_to_end(keys[best])
+            elif self.store_path:
+                match = self._lookup_disk(vector, language, index_version, now)
+                if match is not None:
+                    self.metrics["disk_hits"] += 1
+                    self._insert(match)
+            if match is None:
+                self.metrics["misses"] += 1
+                return None
+            self.metrics["hits"] += 1
+            self.metrics["seconds_saved"] += match.cost_seconds
+            return match
+
+    def put(self, question: str, query_vector, language: str, index_version: str, answer: str,
+            context: Optional[List[str]] = None, cost_seconds: float = 0.0) -> None:
+        """
+        Caches an answer; cost_seconds (retrieval + generation time) feeds the latency-saved counter.
+        """
+        entry = CachedAnswer(question, normalize(query_vector), language, index_version, answer,
+                             list(context or []), cost_seconds, time.time())
+        with self._lock:
+            self._insert(entry)
+            self.metrics["puts"] += 1
+            if self.store_path:
+                with self._connect() as conn:
+                    conn.execute("INSERT INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (question, language, index_version, entry.vector.tobytes(), answer,
+                                  "\x1e".join(entry.context), cost_seconds, entry.created))
+                    self._prune_disk(conn, entry.created)
+
+    def _prune_disk(self, conn: sqlite3.Connection, now: float) -> None:
+        # Expired rows, then the oldest rows beyond the cap
+        pruned = 0
+        if self.ttl > 0:
+            pruned += conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,)).rowcount
+        pruned += conn.execute("DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers "
+                               "ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.disk_max_entries,)).rowcount
+        self.metrics["disk_evictions"] += pruned
+
+    def invalidate(self, keep_index_version: Optional[str] = None) -> None:
+        """
+        Drops every entry not built on keep_index_version (all entries if None).
+        """
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.index_version != keep_index_version]:
+                del self._entries[key]
+            self.metrics["invalidations"] += 1
+            if self.store_path:
+                with self._connect() as conn:
+                    if keep_index_version is None:
+                        conn.execute("DELETE FROM answers")
+                    else:
+                        conn.execute("DELETE FROM answers WHERE index_version != ?", (keep_index_version,))
+
+    def stats(self) -> Dict:
+        """
+        Returns counters plus hit rate and current size.
+        """
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["entries"] = len(self._entries)
+            stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+            return stats
+
+
+_cache = None
+_cache_version = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache(index_version: Optional[str] = None) -> SemanticAnswerCache:
+    """
+    Returns the process-wide answer cache (singleton). Passing the current index
+    version purges entries of older indexes the first time a rebuild is seen.
+    """
+    global _cache, _cache_version
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache()
+        if index_version is not None and index_version != _cache_version:
+            if _cache_version is not None:
+                _cache.invalidate(keep_index_version=index_version)
+            _cache_version = index_version
+        return _cache
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,115 @@
+"""
+batcher.py
+----------
+Request micro-batching for concurrent callers.
+- Callers submit single items and get a Future back (or block on __call__)
+- A worker thread collects items for up to MICROBATCH_WAIT_MS after the
+  first one (or until MICROBATCH_MAX_SIZE) and processes them in one call
+- Items queued while a batch runs join the next batch without extra waiting
+- Batch-size histogram and queueing delay exposed through stats()
+"""
+
+from concurrent.futures import Future
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+MICROBATCH_ENABLED = os.getenv("MICROBATCH", "1") == "1"
+# Longest time the first item of a batch waits for company
+MICROBATCH_WAIT_MS = float(os.getenv("MICROBATCH_WAIT_MS", "2"))
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "32"))
+
+
+class MicroBatcher:
+    """
+    Runs process(items) -> results (same length and order) over batches of
+    items submitted from many threads.
+    """
+
+    def __init__(self, process: Callable[[List], List], max_batch_size: int = MICROBATCH_MAX_SIZE,
+                 max_wait_ms: float = MICROBATCH_WAIT_MS, name: str = "microbatch"):
+        self.process = process
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.histogram: Dict[int, int] = {}
+        self.metrics = {"batches": 0, "items": 0, "errors": 0, "wait_seconds": 0.0, "process_seconds": 0.0}
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item) -> Future:
+        future: Future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        self._ensure_thread()
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _collect(self) -> List:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                # Take what is already queued, then wait out the rest of the window
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.process(items)
+                if len(results) != len(items):
+                    # zip() would leave the unmatched futures pending forever
+                    raise ValueError(f"{self.name} returned {len(results)} results for {len(items)} items.")
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.warning("%s batch of %d failed: %s", self.name, len(batch), e)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                with self._lock:
+                    self.metrics["errors"] += 1
+            with self._lock:
+                self.histogram[len(batch)] = self.histogram.get(len(batch), 0) + 1
+                self.metrics["batches"] += 1
+                self.metrics["items"] += len(batch)
+                self.metrics["wait_seconds"] += sum(start - submitted for _, _, submitted in batch)
+                self.metrics["process_seconds"] += time.perf_counter() - start
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["batch_sizes"] = dict(sorted(self.histogram.items()))
+        stats["avg_batch_size"] = stats["items"] / stats["batches"] if stats["batches"] else 0.0
+        stats["avg_wait_ms"] = 1000 * stats["wait_seconds"] / stats["items"] if stats["items"] else 0.0
+        return stats
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,154 @@
+"""
+bm25.py
+-------
+Okapi BM25 lexical index over the same chunks as the FAISS index.
+- Built by src/embedder.py and saved next to the FAISS index (bm25.npz, no pickle)
+- Documents are FAISS vector positions, so results fuse directly with vector hits
+- Postings stored as flat NumPy arrays (CSR: term offsets, doc ids, term frequencies)
+- Query scoring is vectorized per term; supports restricting to a subset of positions
+- Identifier metadata (loan_id) is indexed too, so "LP001003" finds its row
+"""
+
+import os
+import re
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BM25_FILE = "bm25.npz"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Metadata values added to a chunk's indexed text (not part of page_content)
+LEXICAL_METADATA_FIELDS = ("loan_id",)
+
+# Words, ids (lp001003) and numbers with decimals (8.75), lowercased
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def lexical_text(text: str, metadata: Optional[Dict] = None) -> str:
+    """
+    Text indexed for a chunk: its content plus identifier metadata values.
+    """
+    extra = [str(metadata[field]) for field in LEXICAL_METADATA_FIELDS if metadata and metadata.get(field) is not None]
+    return " ".join([text] + extra)
+
+
+class BM25Index:
+    """
+    Immutable BM25 index. Term ids are positions in the sorted vocabulary, so
+    lookups use a binary search instead of a Python dict.
+    """
+
+    def __init__(self, vocabulary: np.ndarray, offsets: np.ndarray, doc_ids: np.ndarray,
+                 term_freqs: np.ndarray, doc_lengths: np.ndarray, k1: float = BM25_K1, b: float = BM25_B):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.size = len(doc_lengths)
+        doc_freqs = np.diff(offsets).astype("float32")
+        self.idf = np.log1p((self.size - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype("float32")
+        average_length = float(doc_lengths.mean()) if self.size else 0.0
+        # Per-document length normalization, precomputed once
+        self.norms = (k1 * (1 - b + b * doc_lengths / average_length)).astype("float32") if self.size else doc_lengths
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        """
+        Builds the index; the i-th text is document (vector position) i.
+        """
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((doc_id, count))
+        vocabulary = sorted(postings)
+        offsets = np.zeros(len(vocabulary) + 1, dtype="int64")
+        offsets[1:] = np.cumsum([len(postings[term]) for term in vocabulary])
+        pairs = np.array([pair for term in vocabulary for pair in postings[term]], dtype="int64").reshape(-1, 2)
+        return cls(np.array(vocabulary, dtype=str), offsets, pairs[:, 0].astype("int32"),
+                   np.minimum(pairs[:, 1], 65535).astype("uint16"), np.array(lengths, dtype="int32"), k1, b)
+
+    def term_id(self, term: str) -> int:
+        """
+        Returns the term's id, or -1 if it is not in the vocabulary.
+        """
+        i = int(np.searchsorted(self.vocabulary, term))
+        return i if i < len(self.vocabulary) and self.vocabulary[i] == term else -1
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Returns the BM25 score of every document for the query.
+        """
+        scores = np.zeros(self.size, dtype="float32")
+        for term in set(tokenize(query)):
+            term_id = self.term_id(term)
+            if term_id < 0:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end].astype("float32")
+            # Each document appears once per term, so fancy-index += is safe
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.norms[docs])
+        return scores
+
+    def search(self, query: str, k: int = 8, positions: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (scores, positions) of the top-k matching documents, best first,
+        optionally restricted to a subset of positions. Documents without any
+        query term are never returned.
+        """
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores) if positions is None else positions[scores[positions] > 0]
+        if len(candidates) == 0 or k <= 0:
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return scores[top], top.astype("int64")
+
+    def save(self, path: str) -> None:
+        np.savez(path, vocabulary=self.vocabulary, offsets=self.offsets, doc_ids=self.doc_ids,
+                 term_freqs=self.term_freqs, doc_lengths=self.doc_lengths, params=np.array([self.k1, self.b]))
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            k1, b = data["params"].tolist()
+            return cls(data["vocabulary"], data["offsets"], data["doc_ids"], data["term_freqs"],
+                       data["doc_lengths"], k1, b)
+
+
+def build_from_vectorstore(vectorstore) -> BM25Index:
+    """
+    Builds the BM25 index over a FAISS vectorstore's documents, in vector position order.
+    """
+    def texts():
+        for position in range(vectorstore.index.ntotal):
+            doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+            yield lexical_text(doc.page_content, doc.metadata)
+    return BM25Index.build(texts())
+
+if __name__ == "__main__":
+    # Builds bm25.npz for an existing index directory (e.g. one migrated by src/docstore.py)
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.docstore import DOCSTORE_FILE, SQLiteDocstore
+
+    target = sys.argv[1] if len(sys.argv) > 1 else "embeddings"
+    docstore = SQLiteDocstore(os.path.join(target, DOCSTORE_FILE))
+    index = BM25Index.build(lexical_text(text, metadata) for _, _, text, metadata in docstore.iter_rows())
+    index.save(os.path.join(target, BM25_FILE))
+    print(f"Indexed {index.size} documents, {len(index.vocabulary)} terms in {os.path.join(target, BM25_FILE)}")
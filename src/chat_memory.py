@@ -1,31 +1,225 @@
 """
 chat_memory.py
 --------------
-Sets up chat memory for contextual conversations using LangChain.
-- Uses ConversationBufferMemory
-- Easy to get/reset memory for RAG chain
+Bounded per-session chat memory for contextual conversations.
+- One SessionMemory per Streamlit session (no process-wide singleton)
+- Keeps at most MEMORY_MAX_TURNS recent turns and MEMORY_MAX_TOKENS tokens;
+  past answers are stored truncated, as plain (question, answer) tuples
+- Turns pushed out are folded into a bounded running summary on a
+  background thread, off the request path
+- Summaries are extractive by default; MEMORY_SUMMARIZER=gemini asks the LLM
+- Per-session stats (turns, tokens, stored bytes, summarized turns)
 """
 
-from langchain.memory import ConversationBufferMemory
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import re
+import sys
+import threading
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+import weakref
 
-# Singleton memory instance
-_memory = None
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def get_memory(memory_key: str = "chat_history", return_messages: bool = True):
+from src.prompt_builder import HISTORY_ANSWER_TOKENS, HISTORY_TURNS, PROMPT_TOKENIZER, cached_token_counter, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Defaults to the number of turns the prompt builder uses
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", str(HISTORY_TURNS)))
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "1200"))
+SUMMARY_MAX_TOKENS = 300
+# Tokens of each answer kept in the extractive summary
+SUMMARY_ANSWER_TOKENS = 30
+MEMORY_SUMMARIZER = os.getenv("MEMORY_SUMMARIZER", "extractive")
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s")
+MARKDOWN_RE = re.compile(r"[#*•]+")
+
+Turn = Tuple[str, str]
+
+
+def _trim_summary(summary: str, count: Callable[[str], int], max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    # Oldest lines go first
+    lines = summary.splitlines()
+    while lines and count("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def extractive_summary(summary: str, turns: List[Turn]) -> str:
+    """
+    Appends one line per turn (the question and the answer's first sentence)
+    to the summary, dropping the oldest lines beyond SUMMARY_MAX_TOKENS.
+    """
+    count = cached_token_counter(PROMPT_TOKENIZER)
+    lines = [summary] if summary else []
+    for question, answer in turns:
+        body = "\n".join(line for line in answer.splitlines() if not line.lstrip().startswith("#")) or answer
+        plain = " ".join(MARKDOWN_RE.sub(" ", body).split())
+        first = truncate_tokens(SENTENCE_RE.split(plain, maxsplit=1)[0], SUMMARY_ANSWER_TOKENS, count)
+        lines.append(f"User asked: {question.strip()} — Bot: {first}")
+    return _trim_summary("\n".join(lines), count)
+
+
+def gemini_summary(summary: str, turns: List[Turn]) -> str:
+    """
+    Asks Gemini to update the summary; falls back to extractive_summary.
+    """
+    from src.generator import get_gemini_llm
+    conversation = "\n".join(f"User: {q}\nBot: {a}" for q, a in turns)
+    prompt = (
+        f"Update this summary of a loan assistant conversation with the new turns. "
+        f"Keep the facts the user gave and the key answers, under {SUMMARY_MAX_TOKENS // 2} words, plain text.\n\n"
+        f"Summary so far:\n{summary or '(empty)'}\n\nNew turns:\n{conversation}\n\nUpdated summary:"
+    )
+    try:
+        text = get_gemini_llm().generate_content(prompt).text.strip()
+        return _trim_summary(text, cached_token_counter(PROMPT_TOKENIZER))
+    except Exception as e:
+        logger.warning("Summarizing with Gemini failed (%s); using the extractive summary", e)
+        return extractive_summary(summary, turns)
+
+
+SUMMARIZERS: Dict[str, Callable[[str, List[Turn]], str]] = {"extractive": extractive_summary, "gemini": gemini_summary}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# Live memories, for process-wide reporting
+_sessions: "weakref.WeakSet[SessionMemory]" = weakref.WeakSet()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+        return _executor
+
+
+class SessionMemory:
     """
-    Returns a ConversationBufferMemory instance (singleton).
+    Recent turns plus a running summary of older ones, bounded in turns and tokens.
     """
-    global _memory
-    if _memory is None:
-        _memory = ConversationBufferMemory(memory_key=memory_key, return_messages=return_messages)
-    return _memory
 
-def reset_memory():
+    def __init__(self, max_turns: int = MEMORY_MAX_TURNS, max_tokens: int = MEMORY_MAX_TOKENS,
+                 summarizer: Optional[Callable[[str, List[Turn]], str]] = None, background: bool = True):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer or SUMMARIZERS.get(MEMORY_SUMMARIZER, extractive_summary)
+        self.background = background
+        self._count = cached_token_counter(PROMPT_TOKENIZER)
+        self._lock = threading.Lock()
+        self._turns: Deque[Tuple[str, str, int]] = deque()  # (question, answer, tokens)
+        self._tokens = 0
+        self._pending: List[Turn] = []
+        self._summary = ""
+        self._summarized_turns = 0
+        self._generation = 0  # bumped by clear() so in-flight summaries are discarded
+        _sessions.add(self)
+
+    def add_turn(self, question: str, answer: str) -> None:
+        """
+        Records a turn; turns beyond the caps are queued for summarization.
+        """
+        answer = truncate_tokens(answer, HISTORY_ANSWER_TOKENS, self._count)
+        tokens = self._count(question) + self._count(answer)
+        with self._lock:
+            self._turns.append((question, answer, tokens))
+            self._tokens += tokens
+            # The newest turn is always kept, even if it alone exceeds max_tokens
+            while len(self._turns) > 1 and (len(self._turns) > self.max_turns or self._tokens > self.max_tokens):
+                q, a, t = self._turns.popleft()
+                self._tokens -= t
+                self._pending.append((q, a))
+            submit = bool(self._pending)
+            generation = self._generation
+        if submit:
+            if self.background:
+                _get_executor().submit(self._summarize, generation)
+            else:
+                self._summarize(generation)
+
+    def save_context(self, inputs: Dict, outputs: Dict) -> None:
+        """
+        LangChain-style alias of add_turn({"input": q}, {"output": a}).
+        """
+        self.add_turn(inputs["input"], outputs["output"])
+
+    def _summarize(self, generation: int) -> None:
+        with self._lock:
+            turns, summary = list(self._pending), self._summary
+        if not turns:
+            return
+        try:
+            summary = self.summarizer(summary, turns)
+        except Exception as e:
+            logger.warning("Summarizing chat memory failed: %s", e)
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            del self._pending[:len(turns)]
+            self._summary = summary
+            self._summarized_turns += len(turns)
+
+    def history(self) -> List[Turn]:
+        """
+        Returns the recent turns as (question, answer) pairs, oldest first.
+        """
+        with self._lock:
+            return [(q, a) for q, a, _ in self._turns]
+
+    @property
+    def summary(self) -> str:
+        with self._lock:
+            return self._summary
+
+    def clear(self) -> None:
+        with self._lock:
+            self._turns.clear()
+            self._tokens = 0
+            self._pending = []
+            self._summary = ""
+            self._summarized_turns = 0
+            self._generation += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "turns": len(self._turns),
+                "tokens": self._tokens,
+                "pending_turns": len(self._pending),
+                "summarized_turns": self._summarized_turns,
+                "summary_tokens": self._count(self._summary) if self._summary else 0,
+                "stored_bytes": sum(len(q.encode("utf-8")) + len(a.encode("utf-8")) for q, a, _ in self._turns)
+                                + len(self._summary.encode("utf-8")),
+            }
+
+
+def get_memory(**kwargs) -> SessionMemory:
+    """
+    Returns a new SessionMemory; keep one per session (e.g. in st.session_state).
+    """
+    return SessionMemory(**kwargs)
+
+
+def reset_memory(memory: SessionMemory) -> None:
+    """
+    Resets a session's conversation memory.
+    """
+    memory.clear()
+
+
+def memory_stats() -> Dict:
     """
-    Resets the conversation memory.
+    Process-wide totals over all live session memories.
     """
-    global _memory
-    _memory = None
+    sessions = [memory.stats() for memory in list(_sessions)]
+    return {"sessions": len(sessions), "turns": sum(s["turns"] for s in sessions),
+            "tokens": sum(s["tokens"] for s in sessions), "stored_bytes": sum(s["stored_bytes"] for s in sessions)}
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,200 @@
+"""
+chunker.py
+----------
+Token-aware, sentence/heading-aware chunking for documents.
+- Measures chunk size in model tokens (MiniLM tokenizer or tiktoken, with a
+  regex estimator fallback) instead of characters or words
+- Never splits mid-sentence unless a single sentence exceeds the budget
+- Starts a new chunk at each section heading and prefixes chunks with it
+- Supports token overlap between consecutive chunks
+- Streams multi-page documents page by page (iter_chunks)
+- Single linear pass with precompiled regexes; reports the token distribution
+"""
+
+from functools import lru_cache
+import logging
+import os
+import re
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# all-MiniLM-L6-v2 truncates inputs at 256 word pieces; leave room for the section prefix
+CHUNK_TOKENS = 200
+CHUNK_OVERLAP_TOKENS = 30
+TOKENIZER = "minilm"
+MINILM_TOKENIZER = "sentence-transformers/all-MiniLM-L6-v2"
+TIKTOKEN_ENCODING = "cl100k_base"
+
+# "1. Loan Basics", "2. CURRENT INTEREST RATES (2024)", "## Heading", "LOAN TYPES"
+HEADING_RE = re.compile(r"^(#{1,6}\s+\S.*|\d+(\.\d+)*[.)]\s+[A-Z][^.!?:]{0,60}|[A-Z][A-Z0-9 &/()\-]{3,100})$")
+BULLET_RE = re.compile(r"^([-*•]|\d+[.)])\s+")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local estimator: counts words and punctuation marks (close to WordPiece counts for English).
+    """
+    return len(WORD_RE.findall(text))
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(name: str = TOKENIZER) -> Callable[[str], int]:
+    """
+    Returns a text -> token count function for "minilm", "tiktoken" or "estimate".
+    Falls back to the next option when a tokenizer cannot be loaded.
+    """
+    if name == "minilm":
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(MINILM_TOKENIZER)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        except Exception as e:
+            logger.warning("MiniLM tokenizer unavailable (%s); falling back to tiktoken", e)
+            name = "tiktoken"
+    if name == "tiktoken":
+        try:
+            import tiktoken
+            encoding = tiktoken.get_encoding(TIKTOKEN_ENCODING)
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception as e:
+            logger.warning("tiktoken unavailable (%s); falling back to the estimator", e)
+    return estimate_tokens
+
+
+def _units(text: str) -> Iterable[Tuple[str, str]]:
+    """
+    Yields ("heading" | "text", content) units line by line; paragraphs are
+    split into sentences, bullets and list captions ("Home Loan Rates:") are kept whole.
+    """
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if HEADING_RE.match(line):
+            yield "heading", line.lstrip("#").strip()
+        elif BULLET_RE.match(line) or line.endswith(":"):
+            yield "text", line
+        else:
+            for sentence in SENTENCE_RE.split(line):
+                if sentence:
+                    yield "text", sentence
+
+
+def _split_long(sentence: str, max_tokens: int, count: Callable[[str], int]) -> List[Tuple[str, int]]:
+    """
+    Splits a single over-long sentence on word boundaries.
+    """
+    pieces, words, tokens = [], [], 0
+    for word in sentence.split():
+        word_tokens = count(word)
+        if words and tokens + word_tokens > max_tokens:
+            pieces.append((" ".join(words), tokens))
+            words, tokens = [], 0
+        words.append(word)
+        tokens += word_tokens
+    if words:
+        pieces.append((" ".join(words), tokens))
+    return pieces
+
+
+def iter_chunks(pages: Iterable[str], max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                tokenizer: str = TOKENIZER, counter: Optional[Callable[[str], int]] = None) -> Iterator[str]:
+    """
+    Streaming chunk_document over a document given as consecutive pieces (e.g. PDF pages).
+    Sections and overlap carry across piece boundaries, so the chunks equal those of
+    chunk_document("\n".join(pages)); only the current chunk is held in memory.
+    """
+    count = counter or get_token_counter(tokenizer)
+    heading, budget = "", max_tokens
+    current: List[Tuple[str, int]] = []
+    current_tokens = 0
+    fresh = 0  # units in current not carried over as overlap
+
+    def flush() -> Optional[str]:
+        nonlocal current, current_tokens, fresh
+        chunk = None
+        if fresh:
+            body = "\n".join(unit for unit, _ in current)
+            chunk = f"{heading}\n{body}" if heading else body
+        # Keep trailing units as overlap for the next chunk
+        carried, carried_tokens = [], 0
+        for unit, tokens in reversed(current):
+            if carried_tokens + tokens > overlap_tokens:
+                break
+            carried.insert(0, (unit, tokens))
+            carried_tokens += tokens
+        current, current_tokens, fresh = carried, carried_tokens, 0
+        return chunk
+
+    for page in pages:
+        for kind, content in _units(page):
+            if kind == "heading":
+                chunk = flush()
+                if chunk:
+                    yield chunk
+                current, current_tokens = [], 0
+                heading = content
+                # The heading prefix counts against every chunk of its section
+                budget = max(1, max_tokens - count(heading))
+                continue
+            tokens = count(content)
+            pieces = [(content, tokens)] if tokens <= budget else _split_long(content, budget, count)
+            for piece, piece_tokens in pieces:
+                if fresh and current_tokens + piece_tokens > budget:
+                    chunk = flush()
+                    if chunk:
+                        yield chunk
+                    # Drop overlap that would not leave room for the new unit
+                    while current and current_tokens + piece_tokens > budget:
+                        current_tokens -= current.pop(0)[1]
+                current.append((piece, piece_tokens))
+                current_tokens += piece_tokens
+                fresh += 1
+    chunk = flush()
+    if chunk:
+        yield chunk
+
+
+def chunk_document(text: str, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                   tokenizer: str = TOKENIZER, counter: Optional[Callable[[str], int]] = None) -> List[str]:
+    """
+    Splits a document into chunks of at most ~max_tokens model tokens.
+    Chunks end at sentence/bullet boundaries and restart at headings; each chunk
+    is prefixed with its section title and repeats up to overlap_tokens of
+    trailing sentences from the previous chunk of the same section.
+    """
+    return list(iter_chunks([text], max_tokens, overlap_tokens, tokenizer, counter))
+
+
+def chunk_stats(chunks: List[str], tokenizer: str = TOKENIZER,
+                counter: Optional[Callable[[str], int]] = None) -> Dict[str, float]:
+    """
+    Returns chunk count and token distribution (total, min, mean, p50, p95, max).
+    """
+    count = counter or get_token_counter(tokenizer)
+    sizes = sorted(count(chunk) for chunk in chunks)
+    if not sizes:
+        return {"chunks": 0, "tokens_total": 0, "min": 0, "mean": 0.0, "p50": 0, "p95": 0, "max": 0}
+    return {
+        "chunks": len(sizes),
+        "tokens_total": sum(sizes),
+        "min": sizes[0],
+        "mean": sum(sizes) / len(sizes),
+        "p50": sizes[len(sizes) // 2],
+        "p95": sizes[min(len(sizes) - 1, int(len(sizes) * 0.95))],
+        "max": sizes[-1],
+    }
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.pdf_reader import extract_texts_from_folder
+
+    folder = sys.argv[1] if len(sys.argv) > 1 else "docs/"
+    all_chunks = []
+    for doc_text in extract_texts_from_folder(folder):
+        all_chunks.extend(chunk_document(doc_text))
+    print(chunk_stats(all_chunks))
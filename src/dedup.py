@@ -0,0 +1,167 @@
+"""
+dedup.py
+--------
+Near-duplicate chunk detection with MinHash, used at index time.
+- Chunks are compared as sets of word 3-gram shingles (Jaccard similarity)
+- 64-permutation MinHash signatures computed with vectorized NumPy
+  multiply-shift hashing
+- LSH banding (16 bands x 4 rows) finds candidates; a candidate is a
+  duplicate if its estimated Jaccard similarity reaches the threshold
+- Streaming: documents are checked against everything kept so far, up to
+  DEDUP_MAX_ENTRIES remembered chunks (about 1.5 KB each: the signature in a
+  NumPy array plus one bucket entry per band); later chunks are still checked
+  against those but no longer remembered
+- Only chunks with the same dedup key (e.g. the same filterable metadata)
+  are compared, so metadata filters keep matching a representative chunk
+"""
+
+import hashlib
+import logging
+import os
+import re
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+# Estimated Jaccard similarity of shingle sets at which a chunk counts as a duplicate
+DEDUP_THRESHOLD = 0.8
+# Kept chunks remembered for comparison (bounds the index at ~1.5 GB)
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "1000000"))
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+")
+_rng = np.random.default_rng(1)
+# Odd multipliers and offsets of the hash family (fixed seed: signatures are stable across runs)
+_MULTIPLIERS = _rng.integers(1, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_OFFSETS = _rng.integers(0, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    words = WORD_RE.findall(text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def minhash(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """
+    Returns the MinHash signature (MINHASH_PERMUTATIONS uint32 values) of the text's shingles.
+    """
+    digest = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest()
+                      for shingle in shingles(text, size))
+    hashes = np.frombuffer(digest, dtype="<u4").astype(np.uint64)
+    if len(hashes) == 0:
+        return np.zeros(MINHASH_PERMUTATIONS, dtype=np.uint32)
+    # Multiply-shift hashing: the high 32 bits of (a * h + b) mod 2^64
+    with np.errstate(over="ignore"):
+        permuted = (hashes[:, None] * _MULTIPLIERS[None, :] + _OFFSETS[None, :]) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Estimated Jaccard similarity of two signatures.
+    """
+    return float(np.mean(a == b))
+
+
+class MinHashIndex:
+    """
+    Kept signatures, searchable for near-duplicates by LSH banding.
+    Signatures live in one growing uint32 array; each band bucket holds the
+    row number(s) of its signatures, keyed by a hash of (band, group, band values).
+    At most max_entries signatures are kept; add() returns False beyond that.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, bands: int = MINHASH_BANDS,
+                 max_entries: int = DEDUP_MAX_ENTRIES):
+        if MINHASH_PERMUTATIONS % bands:
+            raise ValueError(f"bands must divide {MINHASH_PERMUTATIONS}.")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = MINHASH_PERMUTATIONS // bands
+        self.max_entries = max_entries
+        self.size = 0
+        self._signatures = np.empty((1024, MINHASH_PERMUTATIONS), dtype=np.uint32)
+        self._groups = np.empty(1024, dtype=np.int64)
+        self._group_ids: Dict[Hashable, int] = {}
+        self._buckets: Dict[int, Union[int, List[int]]] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _bucket_keys(self, signature: np.ndarray, group_id: int) -> List[int]:
+        return [hash((band, group_id, signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+                for band in range(self.bands)]
+
+    def find(self, signature: np.ndarray, group: Hashable = None) -> Optional[np.ndarray]:
+        """
+        Returns a kept signature of the same group at or above the threshold, or None.
+        """
+        group_id = self._group_ids.get(group)
+        if group_id is None:
+            return None
+        for key in self._bucket_keys(signature, group_id):
+            entry = self._buckets.get(key)
+            if entry is None:
+                continue
+            for row in entry if isinstance(entry, list) else (entry,):
+                # Buckets are keyed by hash: check the group, then the similarity
+                if self._groups[row] == group_id and similarity(signature, self._signatures[row]) >= self.threshold:
+                    return self._signatures[row]
+        return None
+
+    def add(self, signature: np.ndarray, group: Hashable = None) -> bool:
+        """
+        Remembers a signature; returns False (and does nothing) once max_entries are kept.
+        """
+        if self.size >= self.max_entries:
+            return False
+        group_id = self._group_ids.setdefault(group, len(self._group_ids))
+        if self.size == len(self._signatures):
+            capacity = min(2 * self.size, self.max_entries)
+            self._signatures = np.resize(self._signatures, (capacity, MINHASH_PERMUTATIONS))
+            self._groups = np.resize(self._groups, capacity)
+        row = self.size
+        self._signatures[row] = signature
+        self._groups[row] = group_id
+        self.size += 1
+        for key in self._bucket_keys(signature, group_id):
+            entry = self._buckets.get(key)
+            if entry is None:
+                self._buckets[key] = row
+            elif isinstance(entry, list):
+                entry.append(row)
+            else:
+                self._buckets[key] = [entry, row]
+        return True
+
+
+def dedup_documents(documents: Iterable[Tuple[str, Dict]], key: Optional[Callable[[Dict], Hashable]] = None,
+                    threshold: float = DEDUP_THRESHOLD, stats: Optional[Dict] = None,
+                    max_entries: int = DEDUP_MAX_ENTRIES) -> Iterator[Tuple[str, Dict]]:
+    """
+    Yields (text, metadata) documents, dropping near-duplicates of documents
+    already yielded. key(metadata) restricts comparisons to documents with the
+    same key. Only the first max_entries kept documents are compared against.
+    stats, if given, receives kept/dropped counts.
+    """
+    index = MinHashIndex(threshold, max_entries=max_entries)
+    counts = stats if stats is not None else {}
+    counts.setdefault("kept", 0)
+    counts.setdefault("dropped", 0)
+    for text, metadata in documents:
+        group = key(metadata) if key else None
+        signature = minhash(text)
+        if index.find(signature, group) is not None:
+            counts["dropped"] += 1
+            continue
+        if not index.add(signature, group) and len(index) == counts["kept"]:
+            logger.warning("Deduplication index full (%d chunks); later chunks are only compared with those", len(index))
+        counts["kept"] += 1
+        yield text, metadata
+
+if __name__ == "__main__":
+    pass
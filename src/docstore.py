@@ -0,0 +1,284 @@
+"""
+docstore.py
+-----------
+Pickle-free persistence for the FAISS vectorstore.
+- Vectors: index.faiss (faiss.write_index), served memory-mapped and read-only
+- Chunk texts and metadata: docstore.sqlite, one row per vector position,
+  read on demand instead of unpickling the whole docstore into RAM
+- Processes serving the same index share its pages through the OS page cache
+- Exact float32 vectors of compact (quantized) indexes: vectors.npy, memory-mapped
+- Incremental writers (DocstoreWriter, VectorFileWriter) let full builds
+  stream each embedded batch to disk
+- One-off migration of legacy index.pkl directories written by FAISS.save_local
+- The langchain FAISS vectorstore module (slow to import) is only imported
+  when an index is loaded
+"""
+
+from collections.abc import Mapping
+import io
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+# Exact float32 vectors (position order), written next to scalar-quantized indexes
+VECTORS_FILE = "vectors.npy"
+
+
+class SQLiteDocstore(Docstore):
+    """
+    Read-only docstore over docstore.sqlite. Documents are fetched per lookup;
+    one connection is shared by all threads behind a lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        uri = pathlib.Path(path).absolute().as_uri() + "?mode=ro"
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def _fetchone(self, sql: str, args: Tuple):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchone()
+
+    def search(self, search: str):
+        """
+        Returns the Document stored under this id, or an error string (as InMemoryDocstore does).
+        """
+        row = self._fetchone("SELECT text, metadata FROM docs WHERE id = ?", (search,))
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def id_at(self, position: int) -> Optional[str]:
+        row = self._fetchone("SELECT id FROM docs WHERE position = ?", (position,))
+        return row[0] if row else None
+
+    def count(self) -> int:
+        return self._fetchone("SELECT COUNT(*) FROM docs", ())[0]
+
+    def iter_rows(self) -> Iterator[Tuple[int, str, str, Dict]]:
+        """
+        Yields (position, id, text, metadata) in position order.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT position, id, text, metadata FROM docs ORDER BY position").fetchall()
+        for position, doc_id, text, metadata in rows:
+            yield position, doc_id, text, json.loads(metadata)
+
+    def iter_metadata(self) -> Iterator[Tuple[int, Dict]]:
+        """
+        Yields (position, metadata) for every vector, without loading texts.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT position, metadata FROM docs ORDER BY position").fetchall()
+        for position, metadata in rows:
+            yield position, json.loads(metadata)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class PositionMap(Mapping):
+    """
+    Lazy vector position -> docstore id mapping (FAISS.index_to_docstore_id) backed by SQLite.
+    """
+
+    def __init__(self, docstore: SQLiteDocstore):
+        self.docstore = docstore
+
+    def __getitem__(self, position: int) -> str:
+        doc_id = self.docstore.id_at(int(position))
+        if doc_id is None:
+            raise KeyError(position)
+        return doc_id
+
+    def __iter__(self) -> Iterator[int]:
+        return (position for position, _ in self.docstore.iter_metadata())
+
+    def __len__(self) -> int:
+        return self.docstore.count()
+
+
+class DocstoreWriter:
+    """
+    Writes a new docstore.sqlite incrementally, e.g. one embedded batch at a
+    time, so a build never needs every chunk text in memory.
+    """
+
+    def __init__(self, path: str):
+        if os.path.exists(path):
+            os.remove(path)
+        self.path = path
+        self.count = 0
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute("CREATE TABLE docs (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+                               "text TEXT NOT NULL, metadata TEXT NOT NULL)")
+
+    def add(self, rows: Iterable[Tuple[int, str, str, Optional[Dict]]]) -> None:
+        """
+        Inserts (position, id, text, metadata) rows and commits.
+        """
+        rows = [(position, doc_id, text, json.dumps(metadata or {})) for position, doc_id, text, metadata in rows]
+        with self._conn:
+            self._conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", rows)
+        self.count += len(rows)
+
+    def iter_documents(self) -> Iterator[Tuple[str, Dict]]:
+        """
+        Streams (text, metadata) back in position order.
+        """
+        for text, metadata in self._conn.execute("SELECT text, metadata FROM docs ORDER BY position"):
+            yield text, json.loads(metadata)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def write_docstore(path: str, docstore: Docstore, index_to_docstore_id: Dict[int, str]) -> None:
+    """
+    Writes every (position, id, text, metadata) to a new SQLite file.
+    """
+    writer = DocstoreWriter(path)
+    try:
+        writer.add((position, doc_id, doc.page_content, doc.metadata)
+                   for position, doc_id in sorted(index_to_docstore_id.items())
+                   for doc in [docstore.search(doc_id)])
+    finally:
+        writer.close()
+
+
+class VectorFileWriter:
+    """
+    Appends float32 vectors to a .npy file whose row count is only known at
+    the end, so a build can spill its vectors to disk batch by batch.
+    """
+
+    # Space reserved for the .npy header, written once the shape is known
+    HEADER_BYTES = 128
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self.dim = None
+        self._file = open(path, "wb")
+        self._file.write(b"\0" * self.HEADER_BYTES)
+
+    def append(self, vectors) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d vectors, got {vectors.shape[1]}-d.")
+        self._file.write(vectors.tobytes())
+        self.rows += len(vectors)
+
+    def finish(self) -> np.ndarray:
+        """
+        Writes the header and returns the vectors, memory-mapped read-only.
+        """
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {"descr": np.lib.format.dtype_to_descr(np.dtype("float32")),
+                                                      "fortran_order": False, "shape": (self.rows, self.dim or 0)})
+        if len(header.getvalue()) != self.HEADER_BYTES:
+            raise ValueError(f"The .npy header for {self.rows} vectors does not fit in {self.HEADER_BYTES} bytes.")
+        self._file.seek(0)
+        self._file.write(header.getvalue())
+        self.close()
+        return np.load(self.path, mmap_mode="r")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def save_vectorstore(vectorstore: "FAISS", directory: str) -> None:
+    """
+    Saves the index and docstore into directory (no pickle).
+    """
+    os.makedirs(directory, exist_ok=True)
+    faiss.write_index(vectorstore.index, os.path.join(directory, INDEX_FILE))
+    write_docstore(os.path.join(directory, DOCSTORE_FILE), vectorstore.docstore, vectorstore.index_to_docstore_id)
+
+
+def read_index_mmap(path: str):
+    """
+    Reads a FAISS index memory-mapped and read-only. The index must not be modified.
+    """
+    with open(path, "rb") as f:
+        fourcc = f.read(4)
+    # IVF indexes map their inverted lists; flat/HNSW indexes map their vector codes
+    flags = faiss.IO_FLAG_MMAP if fourcc.startswith(b"Iw") else faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+    return faiss.read_index(path, flags)
+
+
+def load_vectorstore(directory: str, embedding, mmap: bool = True) -> "FAISS":
+    """
+    Loads a vectorstore saved by save_vectorstore.
+    mmap=True (serving): memory-mapped read-only index, documents read from SQLite on demand.
+    mmap=False (updating): index and docstore fully in memory, so vectors can be added/deleted.
+    """
+    index_path = os.path.join(directory, INDEX_FILE)
+    docstore_path = os.path.join(directory, DOCSTORE_FILE)
+    if not os.path.exists(docstore_path):
+        if os.path.exists(os.path.join(directory, LEGACY_DOCSTORE_FILE)):
+            raise FileNotFoundError(f"{directory} uses the legacy pickle docstore. Run 'python src/docstore.py {directory}' "
+                                    f"to migrate it or 'python src/embedder.py' to rebuild the index.")
+        raise FileNotFoundError(f"FAISS index not found at {directory}. Please run 'python src/embedder.py' to build the index.")
+    from langchain_community.vectorstores import FAISS
+
+    docstore = SQLiteDocstore(docstore_path)
+    if mmap:
+        return FAISS(embedding_function=embedding, index=read_index_mmap(index_path),
+                     docstore=docstore, index_to_docstore_id=PositionMap(docstore))
+    documents, index_to_docstore_id = {}, {}
+    for position, doc_id, text, metadata in docstore.iter_rows():
+        documents[doc_id] = Document(id=doc_id, page_content=text, metadata=metadata)
+        index_to_docstore_id[position] = doc_id
+    docstore.close()
+    return FAISS(embedding_function=embedding, index=faiss.read_index(index_path),
+                 docstore=InMemoryDocstore(documents), index_to_docstore_id=index_to_docstore_id)
+
+
+def load_exact_vectors(directory: str) -> Optional[np.ndarray]:
+    """
+    Returns the exact vectors saved next to a compact index, memory-mapped
+    read-only, or None if the index stores exact vectors itself.
+    """
+    path = os.path.join(directory, VECTORS_FILE)
+    return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+
+def migrate_legacy_index(directory: str) -> int:
+    """
+    Converts a trusted index.pkl (FAISS.save_local) into docstore.sqlite and removes
+    the pickle. Returns the number of documents migrated.
+    """
+    import pickle
+
+    legacy_path = os.path.join(directory, LEGACY_DOCSTORE_FILE)
+    with open(legacy_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    write_docstore(os.path.join(directory, DOCSTORE_FILE), docstore, index_to_docstore_id)
+    os.remove(legacy_path)
+    return len(index_to_docstore_id)
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else "embeddings"
+    print(f"Migrated {migrate_legacy_index(target)} documents in {target}")
@@ -2,51 +2,615 @@
 embedder.py
 -----------
 Embeds all text data (CSV + docs) and builds a FAISS index for semantic retrieval.
-- Uses all-MiniLM-L6-v2 (sentence-transformers)
+- Uses all-MiniLM-L6-v2 (sentence-transformers, or its ONNX / int8
+  variants via EMBED_BACKEND, see src/embedding_backend.py)
 - Saves FAISS index for later use
+- Incremental rebuilds: a manifest of chunk content hashes -> vector ids
+  lets only new/changed chunks be embedded and deleted ones be removed
+- Persists atomically (temp dir + rename), without pickle (src/docstore.py)
+- Streams chunks through the model in bounded batches, optionally on a
+  multiprocessing pool of embedding workers, with progress/throughput logs
+- Full builds write each embedded batch straight to the new docstore and
+  index (or a vector file on disk for indexes that need training), so memory
+  holds one batch plus the final index, not every chunk text and vector
+- CSV rows are indexed as structured documents with typed metadata
+- Documents are chunked by model tokens at sentence/heading boundaries
+- Drops near-duplicate chunks (MinHash, src/dedup.py) before embedding
+- Builds a BM25 lexical index over the same chunks for hybrid retrieval
+- Index type is configurable: exact flat L2 (default), IVF-Flat, IVF-PQ or
+  HNSW, with IVF/PQ trained on a sample of the embedded vectors
+- Optional compact vector storage (float16 / int8 scalar quantization), with
+  the exact float32 vectors saved for rescoring (VECTOR_STORAGE)
 """
 
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from collections import Counter, deque
+from itertools import groupby, islice
+import faiss
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
 import os
+import shutil
 import sys
-from typing import List
+import tempfile
+import time
+import uuid
+import numpy as np
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.preprocess import load_and_clean_csv, dataframe_to_chunks
-from src.pdf_reader import extract_texts_from_folder
+from src.preprocess import iter_csv_documents
+from src.pdf_reader import ExtractionCache, iter_folder_pages
+from src.chunker import chunk_stats, iter_chunks
+from src.stats import build_stats_cube, save_stats_cube
+from src.docstore import (DOCSTORE_FILE, INDEX_FILE, VECTORS_FILE, DocstoreWriter, VectorFileWriter,
+                          load_vectorstore, save_vectorstore)
+from src.bm25 import BM25_FILE, BM25Index, build_from_vectorstore, lexical_text
+from src.dedup import dedup_documents
+from src.embedding_backend import (EMBED_BACKEND, REFERENCE_BACKEND, embedding_id, embedding_id_of, get_embeddings,
+                                   loaded_backend)
 
 
 DATA_CSV = "data/loan_data.csv.csv"
 DOCS_FOLDER = "docs/"
 FAISS_INDEX_PATH = "embeddings"
+EMBED_MODEL = "all-MiniLM-L6-v2"
+MANIFEST_FILE = "manifest.json"
+# Max words per CSV row chunk (document chunks are sized by src.chunker.CHUNK_TOKENS)
 CHUNK_SIZE = 300
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+# 0 = embed in this process; N > 0 = pool of N embedding worker processes
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))
+# Skip chunks that near-duplicate an already indexed chunk with the same metadata
+DEDUP_CHUNKS = os.getenv("DEDUP_CHUNKS", "1") == "1"
+# Identifier metadata ignored when grouping chunks for deduplication
+DEDUP_IGNORED_FIELDS = ("loan_id", "path")
+# "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw"; query-time knobs live in src.retriever
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# Inverted lists for IVF; 0 = about 4 * sqrt(number of vectors)
+IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))
+# PQ sub-quantizers (must divide the embedding dimension, 384) and bits per code
+PQ_M = 16
+PQ_NBITS = 8
+# Training points per k-means centroid (IVF lists, PQ codebooks) below which faiss warns
+MIN_TRAIN_POINTS = 39
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+# Max vectors used to train IVF centroids / PQ codebooks
+TRAIN_SAMPLE_SIZE = 50000
+# Vector codes in the index: "float32" (exact), "float16" or "int8" (scalar quantized).
+# Compact storage also writes the exact vectors (VECTORS_FILE) for rescoring at query time
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float32")
+VECTOR_STORAGES = ("float32", "float16", "int8")
+SQ_TYPES = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+# Vectors spilled to disk during a full build of an index that needs training
+SPILL_FILE = "vectors.spill.npy"
+
+logger = logging.getLogger(__name__)
+
+
+# A chunk to index: plain text, or (text, metadata)
+Document = Union[str, Tuple[str, Dict]]
+
+
+def dedup_key(metadata: Dict) -> Tuple:
+    """
+    Chunks are only deduplicated against chunks with the same filterable metadata.
+    """
+    return tuple(sorted((field, value) for field, value in metadata.items() if field not in DEDUP_IGNORED_FIELDS))
+
+
+def iter_documents(dedup: bool = DEDUP_CHUNKS) -> Iterator[Tuple[str, Dict]]:
+    """
+    Yields all (text, metadata) chunks from CSV and docs, one at a time.
+    CSV rows carry typed loan metadata (see preprocess.METADATA_FIELDS).
+    With dedup, near-duplicates of earlier chunks are skipped.
+    """
+    if not dedup:
+        yield from _iter_all_documents()
+        return
+    stats = {}
+    yield from dedup_documents(_iter_all_documents(), key=dedup_key, stats=stats)
+    logger.info("deduplication: kept %d chunks, dropped %d near-duplicates", stats["kept"], stats["dropped"])
+
+
+def _iter_all_documents() -> Iterator[Tuple[str, Dict]]:
+    yield from iter_csv_documents(DATA_CSV, exclude=["loan_id"], max_length=CHUNK_SIZE)
+    doc_chunks = []
+    records = iter_folder_pages(DOCS_FOLDER, cache=ExtractionCache())
+    for path, pages in groupby(records, key=lambda record: record[0]):
+        # Pages stream into one chunker per file, so sections and overlap carry across page breaks
+        metadata = {"source": "docs", "path": os.path.relpath(path, DOCS_FOLDER)}
+        for chunk in iter_chunks(page_text for _, _, page_text in pages):
+            doc_chunks.append(chunk)
+            yield chunk, metadata
+    logger.info("document chunks: %s", chunk_stats(doc_chunks))
+
+
+def iter_text_chunks() -> Iterator[str]:
+    """
+    Yields all text chunks from CSV and docs, one at a time.
+    """
+    for text, _ in iter_documents():
+        yield text
 
 
 def get_all_text_chunks() -> List[str]:
     """
     Loads and combines all text chunks from CSV and docs.
     """
-    df = load_and_clean_csv(DATA_CSV)
-    fields = [col for col in df.columns if col != "loan_id"]
-    csv_chunks = dataframe_to_chunks(df, fields, max_length=CHUNK_SIZE)
-    doc_texts = extract_texts_from_folder(DOCS_FOLDER)
-    doc_chunks = []
-    for text in doc_texts:
-        doc_chunks.extend([text[i:i+CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)])
-    return csv_chunks + doc_chunks
+    return list(iter_text_chunks())
+
+
+def get_embedding_model(model_name: str = EMBED_MODEL, backend: str = EMBED_BACKEND) -> Embeddings:
+    """
+    Returns the embedding model used for indexing (EMBED_BACKEND, see src/embedding_backend.py).
+    """
+    return get_embeddings(backend, model_name)
+
+
+def as_document(item: Document) -> Tuple[str, Dict]:
+    """
+    Normalizes a plain text chunk to (text, {}).
+    """
+    if isinstance(item, str):
+        return item, {}
+    return item[0], item[1] or {}
+
+
+def chunk_hash(text: str, metadata: Optional[Dict] = None) -> str:
+    """
+    Content hash identifying a chunk (text and metadata) across rebuilds.
+    """
+    payload = text if not metadata else text + "\0" + json.dumps(metadata, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    """
+    Groups any iterable into lists of at most batch_size items.
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+# Embedding model of a pool worker process, loaded once by _init_embed_worker
+_worker_embedding = None
+
+
+def _init_embed_worker(model_name: str) -> None:
+    global _worker_embedding
+    _worker_embedding = get_embedding_model(model_name)
+
+
+def _embed_batch_in_worker(texts: List[str]) -> Tuple[str, List[List[float]]]:
+    return loaded_backend(_worker_embedding), _worker_embedding.embed_documents(texts)
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def log_progress(progress: Dict) -> None:
+    """
+    Default progress reporter for embed_in_batches.
+    """
+    logger.info("embedded %d chunks (%d batches) in %.1fs: %.1f chunks/sec, peak RSS %s MB",
+                progress["chunks"], progress["batches"], progress["seconds"],
+                progress["chunks_per_sec"], progress["peak_rss_mb"])
+
+
+def embed_in_batches(items: Iterable, batch_size: int = EMBED_BATCH_SIZE, workers: int = EMBED_WORKERS,
+                     embedding: Optional[Embeddings] = None, model_name: str = EMBED_MODEL,
+                     progress: Optional[Callable[[Dict], None]] = log_progress,
+                     key: Optional[Callable[[object], str]] = None,
+                     backends: Optional[set] = None) -> Iterator[Tuple[List, List[List[float]]]]:
+    """
+    Embeds a (possibly lazy) stream of texts in batches of batch_size and yields
+    (items, vectors) per batch, in input order. key(item) extracts the text when
+    items are not plain strings.
+    With workers > 0 batches are embedded by a process pool, with at most
+    2 * workers batches in flight, so memory stays bounded by the batch size
+    rather than the corpus size.
+    backends, if given, receives the backend each model actually loaded
+    (see loaded_backend), e.g. to record it in the index manifest.
+    """
+    start = time.perf_counter()
+    backends = backends if backends is not None else set()
+    totals = {"chunks": 0, "batches": 0}
+
+    def texts_of(batch: List) -> List[str]:
+        return [key(item) for item in batch] if key else batch
 
+    def report(batch: List) -> None:
+        totals["chunks"] += len(batch)
+        totals["batches"] += 1
+        if progress is not None:
+            seconds = time.perf_counter() - start
+            progress({
+                "chunks": totals["chunks"],
+                "batches": totals["batches"],
+                "seconds": seconds,
+                "chunks_per_sec": totals["chunks"] / seconds if seconds else 0.0,
+                "peak_rss_mb": _peak_rss_mb(),
+            })
 
-def build_and_save_faiss_index(texts: List[str], index_path: str = FAISS_INDEX_PATH):
+    if workers <= 0:
+        embedding = embedding or get_embedding_model(model_name)
+        backends.add(loaded_backend(embedding))
+        for batch in iter_batches(items, batch_size):
+            vectors = embedding.embed_documents(texts_of(batch))
+            report(batch)
+            yield batch, vectors
+        return
+
+    # spawn: forking a process that already holds torch threads is unsafe
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(workers, initializer=_init_embed_worker, initargs=(model_name,)) as pool:
+        pending = deque()
+        for batch in iter_batches(items, batch_size):
+            pending.append((batch, pool.apply_async(_embed_batch_in_worker, (texts_of(batch),))))
+            if len(pending) >= 2 * workers:
+                done, result = pending.popleft()
+                backend, vectors = result.get()
+                backends.add(backend)
+                report(done)
+                yield done, vectors
+        while pending:
+            done, result = pending.popleft()
+            backend, vectors = result.get()
+            backends.add(backend)
+            report(done)
+            yield done, vectors
+
+
+def add_texts_in_batches(documents: Iterable[Document], ids: Optional[Iterable[str]] = None, vectorstore: Optional[FAISS] = None,
+                         embedding: Optional[Embeddings] = None, batch_size: int = EMBED_BATCH_SIZE,
+                         workers: int = EMBED_WORKERS,
+                         on_batch: Optional[Callable[[List[Tuple[str, Dict]], List[str]], None]] = None) -> Optional[FAISS]:
+    """
+    Streams texts or (text, metadata) documents through embed_in_batches into a
+    FAISS vectorstore (created on the first batch if none is given). ids are
+    consumed in step with documents; random ids are generated when omitted.
+    on_batch(documents, ids) is called after each batch.
+    """
+    id_iter = iter(ids) if ids is not None else None
+    if workers <= 0 and embedding is None:
+        embedding = get_embedding_model()
+    documents = (as_document(item) for item in documents)
+    for batch, vectors in embed_in_batches(documents, batch_size=batch_size, workers=workers, embedding=embedding,
+                                           key=lambda doc: doc[0]):
+        if id_iter is not None:
+            batch_ids = list(islice(id_iter, len(batch)))
+        else:
+            batch_ids = [str(uuid.uuid4()) for _ in batch]
+        if vectorstore is None:
+            vectorstore = FAISS(embedding_function=embedding, index=faiss.IndexFlatL2(len(vectors[0])),
+                                docstore=InMemoryDocstore(), index_to_docstore_id={})
+        vectorstore.add_embeddings([(text, vector) for (text, _), vector in zip(batch, vectors)],
+                                   metadatas=[metadata for _, metadata in batch], ids=batch_ids)
+        if on_batch is not None:
+            on_batch(batch, batch_ids)
+    return vectorstore
+
+
+def check_index_config(index_type: str, storage: str) -> None:
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported index type: {index_type}. Use one of {INDEX_TYPES}.")
+    if storage not in VECTOR_STORAGES:
+        raise ValueError(f"Unsupported vector storage: {storage}. Use one of {VECTOR_STORAGES}.")
+
+
+def make_faiss_index(index_type: str, dim: int, n_vectors: int, storage: str = "float32"):
     """
-    Embeds texts and saves a FAISS index to disk.
+    Returns an empty (untrained) L2 index of index_type sized for n_vectors,
+    storing vectors as storage (IVF-PQ codes are compact regardless).
     """
+    check_index_config(index_type, storage)
+    sq_type = SQ_TYPES.get(storage)
+    if index_type == "flat":
+        return faiss.IndexScalarQuantizer(dim, sq_type, faiss.METRIC_L2) if sq_type is not None else faiss.IndexFlatL2(dim)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWSQ(dim, sq_type, HNSW_M) if sq_type is not None else faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+    # k-means wants ~39 training points per centroid
+    if n_vectors < MIN_TRAIN_POINTS:
+        logger.warning("Only %d vectors, too few to train %s; using flat", n_vectors, index_type)
+        return make_faiss_index("flat", dim, n_vectors, storage)
+    nlist = IVF_NLIST or int(4 * math.sqrt(n_vectors))
+    nlist = max(1, min(nlist, n_vectors // MIN_TRAIN_POINTS))
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf_pq":
+        if dim % PQ_M:
+            raise ValueError(f"PQ_M={PQ_M} must divide the embedding dimension {dim}.")
+        # Each sub-quantizer is a k-means over 2 ** PQ_NBITS centroids
+        if n_vectors >= MIN_TRAIN_POINTS * 2 ** PQ_NBITS:
+            return faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_M, PQ_NBITS)
+        logger.warning("Only %d vectors, too few to train PQ codebooks (%d needed); using ivf_flat",
+                       n_vectors, MIN_TRAIN_POINTS * 2 ** PQ_NBITS)
+    if sq_type is not None:
+        return faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, sq_type, faiss.METRIC_L2)
+    return faiss.IndexIVFFlat(quantizer, dim, nlist)
+
+
+def build_ann_index(vectors: np.ndarray, index_type: str = FAISS_INDEX_TYPE,
+                    sample_size: int = TRAIN_SAMPLE_SIZE, seed: int = 0, storage: str = "float32"):
+    """
+    Builds an index of index_type over vectors (row i -> position i), training
+    it first on a random sample of at most sample_size rows if needed.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n_vectors, dim = vectors.shape
+    index = make_faiss_index(index_type, dim, n_vectors, storage)
+    if not index.is_trained:
+        start = time.perf_counter()
+        sample = vectors
+        if n_vectors > sample_size:
+            sample = vectors[np.sort(np.random.default_rng(seed).choice(n_vectors, sample_size, replace=False))]
+        index.train(sample)
+        logger.info("Trained %s index on %d vectors in %.1fs", index_type, len(sample), time.perf_counter() - start)
+    for offset in range(0, n_vectors, 65536):
+        index.add(vectors[offset:offset + 65536])
+    return index
+
+
+def index_vectors(index) -> np.ndarray:
+    """
+    Reads all vectors back from an index, in position order.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def convert_index(vectorstore: FAISS, index_type: str = FAISS_INDEX_TYPE, storage: str = "float32") -> FAISS:
+    """
+    Replaces the vectorstore's index with an index_type index holding the same
+    vectors at the same positions (the docstore mapping stays valid). Vectors
+    are read back from the current index, so the source must be exact
+    (float32 flat, HNSW or IVF-Flat), not PQ or scalar quantized.
+    """
+    vectorstore.index = build_ann_index(index_vectors(vectorstore.index), index_type, storage=storage)
+    return vectorstore
+
+
+def load_exact_index(index_path: str = FAISS_INDEX_PATH) -> faiss.IndexFlatL2:
+    """
+    Returns a flat index of the exact vectors saved next to a compact index.
+    """
+    vectors = np.load(os.path.join(index_path, VECTORS_FILE))
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(np.ascontiguousarray(vectors, dtype="float32"))
+    return index
+
+
+def load_manifest(index_path: str = FAISS_INDEX_PATH) -> Optional[Dict]:
+    """
+    Loads the chunk manifest ({"model": ..., "chunks": {hash: [vector ids]}}), or None.
+    """
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_index_atomic(vectorstore: FAISS, manifest: Dict, index_path: str = FAISS_INDEX_PATH,
+                      exact_vectors: Optional[np.ndarray] = None) -> None:
+    """
+    Writes index, BM25 index, manifest and (for compact indexes) the exact
+    vectors into a temp dir next to index_path, then swaps it in by rename.
+    Readers never see a half-written index.faiss/docstore.sqlite pair.
+    """
+    tmp_dir = make_index_tmp_dir(index_path)
+    try:
+        save_vectorstore(vectorstore, tmp_dir)
+        build_from_vectorstore(vectorstore).save(os.path.join(tmp_dir, BM25_FILE))
+        if exact_vectors is not None:
+            np.save(os.path.join(tmp_dir, VECTORS_FILE), np.ascontiguousarray(exact_vectors, dtype="float32"))
+        publish_index_dir(tmp_dir, manifest, index_path)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def make_index_tmp_dir(index_path: str = FAISS_INDEX_PATH) -> str:
+    """
+    Creates the temp dir a new index is written to (next to index_path, same filesystem).
+    """
+    return tempfile.mkdtemp(prefix=".embeddings-", dir=os.path.dirname(os.path.abspath(index_path)))
+
+
+def publish_index_dir(tmp_dir: str, manifest: Dict, index_path: str = FAISS_INDEX_PATH) -> None:
+    """
+    Writes the manifest into a finished temp dir and swaps it in for index_path by rename.
+    """
+    index_path = os.path.abspath(index_path)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    old_dir = None
+    if os.path.exists(index_path):
+        old_dir = tmp_dir + ".old"
+        os.rename(index_path, old_dir)
+    os.rename(tmp_dir, index_path)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def build_and_save_faiss_index(texts: Iterable[Document], index_path: str = FAISS_INDEX_PATH,
+                               batch_size: int = EMBED_BATCH_SIZE, workers: int = EMBED_WORKERS,
+                               index_type: str = FAISS_INDEX_TYPE, storage: str = VECTOR_STORAGE):
+    """
+    Embeds texts (or (text, metadata) documents) and saves a FAISS index to disk
+    (full rebuild). texts may be a lazy iterator; it is embedded batch by batch
+    and each batch is written straight to the new docstore.sqlite. Flat and
+    HNSW float32 indexes take the vectors directly; other indexes need the
+    whole corpus to size and train them, so vectors are appended to a .npy
+    file and the index is trained and filled from it, memory-mapped. With
+    compact storage that file is kept as the exact vectors, for rescoring.
+    Returns the number of chunks indexed.
+    """
+    check_index_config(index_type, storage)
+    manifest = {"model": None, "index_type": index_type, "storage": storage, "chunks": {}}
+    backends = set()
+    compact = storage != "float32"
+    direct = not compact and index_type in ("flat", "hnsw")
+    tmp_dir = make_index_tmp_dir(index_path)
+    docstore, spill = None, None
+    try:
+        docstore = DocstoreWriter(os.path.join(tmp_dir, DOCSTORE_FILE))
+        if not direct:
+            spill = VectorFileWriter(os.path.join(tmp_dir, VECTORS_FILE if compact else SPILL_FILE))
+        index = None
+        documents = (as_document(item) for item in texts)
+        for batch, vectors in embed_in_batches(documents, batch_size=batch_size, workers=workers,
+                                               key=lambda doc: doc[0], backends=backends):
+            batch_ids = [str(uuid.uuid4()) for _ in batch]
+            start = docstore.count
+            docstore.add((start + i, vector_id, text, metadata)
+                         for i, ((text, metadata), vector_id) in enumerate(zip(batch, batch_ids)))
+            for (text, metadata), vector_id in zip(batch, batch_ids):
+                manifest["chunks"].setdefault(chunk_hash(text, metadata), []).append(vector_id)
+            vectors = np.asarray(vectors, dtype="float32")
+            if direct:
+                if index is None:
+                    index = make_faiss_index(index_type, vectors.shape[1], 0, storage)
+                index.add(vectors)
+            else:
+                spill.append(vectors)
+        if docstore.count == 0:
+            raise ValueError("No text chunks to index.")
+        if len(backends) > 1:
+            raise ValueError(f"Embedding workers loaded different backends ({', '.join(sorted(backends))}).")
+        # A backend that failed to load fell back to the reference one; record what embedded the vectors
+        manifest["model"] = embedding_id(EMBED_MODEL, backends.pop())
+        if not direct:
+            vectors = spill.finish()
+            index = build_ann_index(vectors, index_type, storage=storage)
+            del vectors
+            if not compact:
+                os.remove(spill.path)
+        faiss.write_index(index, os.path.join(tmp_dir, INDEX_FILE))
+        BM25Index.build(lexical_text(text, metadata)
+                        for text, metadata in docstore.iter_documents()).save(os.path.join(tmp_dir, BM25_FILE))
+        docstore.close()
+        publish_index_dir(tmp_dir, manifest, index_path)
+    except Exception:
+        for writer in (docstore, spill):
+            if writer is not None:
+                writer.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return docstore.count
+
+
+def build_incremental_faiss_index(texts: Iterable[Document], index_path: str = FAISS_INDEX_PATH,
+                                  index_type: str = FAISS_INDEX_TYPE, storage: str = VECTOR_STORAGE) -> Dict[str, int]:
+    """
+    Updates the FAISS index in place of a full rebuild: embeds only chunks whose
+    content hash is new, deletes vectors of chunks that disappeared.
+    Falls back to a full build when there is no manifest or the model, index
+    type or vector storage changed. New vectors are added to a trained IVF index without retraining.
+    Returns counts of added/removed/unchanged chunks.
+    """
+    manifest = load_manifest(index_path)
+    embedding, model = None, embedding_id(EMBED_MODEL, EMBED_BACKEND)
+    if manifest is not None and manifest.get("model") != model and EMBED_BACKEND != REFERENCE_BACKEND:
+        # Built after a fallback to the reference backend: still current if the backend still falls back
+        embedding = get_embedding_model()
+        model = embedding_id_of(embedding, EMBED_MODEL)
+    if (manifest is None or manifest.get("model") != model
+            or manifest.get("index_type", "flat") != index_type or manifest.get("storage", "float32") != storage):
+        added = build_and_save_faiss_index(texts, index_path, index_type=index_type, storage=storage)
+        return {"added": added, "removed": 0, "unchanged": 0, "full_rebuild": 1}
+
+    wanted = Counter()
+    doc_by_hash = {}
+    for item in texts:
+        text, metadata = as_document(item)
+        h = chunk_hash(text, metadata)
+        wanted[h] += 1
+        doc_by_hash.setdefault(h, (text, metadata))
+
+    old_chunks = manifest["chunks"]
+    new_chunks = {}
+    to_delete, add_docs, add_ids = [], [], []
+    unchanged = 0
+    for h, ids in old_chunks.items():
+        keep = ids[:wanted.get(h, 0)]
+        to_delete.extend(ids[len(keep):])
+        unchanged += len(keep)
+        if keep:
+            new_chunks[h] = list(keep)
+    for h, count in wanted.items():
+        missing = count - len(new_chunks.get(h, []))
+        for _ in range(missing):
+            vector_id = str(uuid.uuid4())
+            add_docs.append(doc_by_hash[h])
+            add_ids.append(vector_id)
+            new_chunks.setdefault(h, []).append(vector_id)
+
+    stats = {"added": len(add_docs), "removed": len(to_delete), "unchanged": unchanged, "full_rebuild": 0}
+    if not add_docs and not to_delete:
+        return stats
+
+    # Only flat indexes compact positions on removal (IVF keeps the old ids, HNSW
+    # cannot remove): delete from an exact flat copy and rebuild the ANN index.
+    # PQ codes cannot be turned back into exact vectors, so IVF-PQ re-embeds.
+    if to_delete and index_type == "ivf_pq":
+        documents = [doc_by_hash[h] for h, count in wanted.items() for _ in range(count)]
+        added = build_and_save_faiss_index(documents, index_path, index_type=index_type, storage=storage)
+        return {"added": added, "removed": 0, "unchanged": 0, "full_rebuild": 1}
 
-    embedding = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2", model_kwargs={'device': 'cpu'})
-    vectorstore = FAISS.from_texts(texts, embedding=embedding)
-    vectorstore.save_local(index_path)
+    embedding = embedding or get_embedding_model()
+    if embedding_id_of(embedding, EMBED_MODEL) != manifest["model"]:
+        # The configured backend failed to load this time: new vectors would not match the index
+        documents = [doc_by_hash[h] for h, count in wanted.items() for _ in range(count)]
+        added = build_and_save_faiss_index(documents, index_path, index_type=index_type, storage=storage)
+        return {"added": added, "removed": 0, "unchanged": 0, "full_rebuild": 1}
+    vectorstore = load_vectorstore(index_path, embedding, mmap=False)
+    # Compact indexes are always updated on the exact vectors and re-quantized
+    compact = storage != "float32"
+    rebuild = compact or (index_type != "flat" and bool(to_delete))
+    if compact:
+        vectorstore.index = load_exact_index(index_path)
+    elif rebuild:
+        convert_index(vectorstore, "flat")
+    if to_delete:
+        vectorstore.delete(to_delete)
+    if add_docs:
+        add_texts_in_batches(add_docs, add_ids, vectorstore=vectorstore, embedding=embedding)
+    exact_vectors = index_vectors(vectorstore.index) if compact else None
+    if rebuild:
+        convert_index(vectorstore, index_type, storage)
+    save_index_atomic(vectorstore, {"model": embedding_id_of(embedding, EMBED_MODEL), "index_type": index_type,
+                                    "storage": storage, "chunks": new_chunks}, index_path, exact_vectors)
+    return stats
 
 if __name__ == "__main__":
-    all_chunks = get_all_text_chunks()
-    build_and_save_faiss_index(all_chunks)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    print(build_incremental_faiss_index(iter_documents()))
+    # The index swap replaces the embeddings/ directory; precompute the stats cube after it
+    save_stats_cube(build_stats_cube(DATA_CSV))
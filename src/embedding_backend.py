@@ -0,0 +1,207 @@
+"""
+embedding_backend.py
+--------------------
+Pluggable embedding backends for all-MiniLM-L6-v2, shared by the embedder
+and the retriever (EMBED_BACKEND).
+- "torch": sentence-transformers via langchain_huggingface (reference)
+- "torch_int8": the same model with dynamically int8-quantized Linear layers
+- "onnx": ONNX Runtime with the model's ONNX export, tokenized with
+  `tokenizers` and mean-pooled in NumPy (no PyTorch import)
+- "onnx_int8": ONNX Runtime with the int8-quantized export
+- A backend that cannot be loaded falls back to "torch" with a warning;
+  loaded_backend() / embedding_id_of() name what was actually loaded
+- check_agreement() reports cosine similarity against the reference backend
+"""
+
+import logging
+import os
+import sys
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBED_MODEL = "all-MiniLM-L6-v2"
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+REFERENCE_BACKEND = "torch"
+# ONNX exports published with the sentence-transformers model
+ONNX_FILE = os.getenv("ONNX_FILE", "onnx/model.onnx")
+ONNX_INT8_FILE = os.getenv("ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+# The model's max_seq_length; longer inputs are truncated like sentence-transformers does
+EMBED_MAX_LENGTH = 256
+BACKEND_BATCH_SIZE = 32
+# Backends below this cosine similarity to the reference should not share an index with it
+AGREEMENT_MIN_COSINE = 0.99
+
+
+def embedding_id(model_name: str = EMBED_MODEL, backend: str = EMBED_BACKEND) -> str:
+    """
+    Identifies the vectors a backend produces (e.g. for caches of embeddings).
+    """
+    return model_name if backend == REFERENCE_BACKEND else f"{model_name}+{backend}"
+
+
+def loaded_backend(embedding: Embeddings) -> str:
+    """
+    The backend an embedding model returned by get_embeddings actually runs
+    (the reference backend after a fallback).
+    """
+    return getattr(embedding, "backend", REFERENCE_BACKEND)
+
+
+def embedding_id_of(embedding: Embeddings, model_name: str = EMBED_MODEL) -> str:
+    """
+    embedding_id of a loaded embedding model, for manifests and caches.
+    """
+    return embedding_id(model_name, loaded_backend(embedding))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+class QuantizedTorchEmbeddings(Embeddings):
+    """
+    sentence-transformers model with torch dynamic int8 quantization of its Linear layers.
+    """
+
+    backend = "torch_int8"
+
+    def __init__(self, model_name: str = EMBED_MODEL, batch_size: int = BACKEND_BATCH_SIZE):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(model_name, device="cpu")
+        self.model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                    normalize_embeddings=True, show_progress_bar=False)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    ONNX Runtime inference of a sentence-transformers export: tokenization,
+    the transformer, then attention-masked mean pooling and L2 normalization.
+    """
+
+    backend = "onnx"
+
+    def __init__(self, model_name: str = EMBED_MODEL, file_name: str = ONNX_FILE,
+                 max_length: int = EMBED_MAX_LENGTH, batch_size: int = BACKEND_BATCH_SIZE,
+                 threads: Optional[int] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(self._resolve(model_name, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]")
+        self.tokenizer.enable_padding(pad_id=pad_id if pad_id is not None else 0, pad_token="[PAD]")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self._resolve(model_name, file_name), options,
+                                            providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    @staticmethod
+    def _resolve(model_name: str, file_name: str) -> str:
+        # A local model directory, or the model's files on the Hugging Face Hub (cached)
+        if os.path.isdir(model_name):
+            return os.path.join(model_name, file_name)
+        from huggingface_hub import hf_hub_download
+        repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        return hf_hub_download(repo_id, file_name)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Returns the (len(texts), dim) float32 matrix of unit-length embeddings.
+        """
+        batches = []
+        for offset in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[offset:offset + self.batch_size]))
+            mask = np.array([encoding.attention_mask for encoding in encodings], dtype="int64")
+            feeds = {"input_ids": np.array([encoding.ids for encoding in encodings], dtype="int64"),
+                     "attention_mask": mask}
+            if "token_type_ids" in self._input_names:
+                feeds["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype="int64")
+            hidden = self.session.run(None, feeds)[0]
+            weights = mask[:, :, None].astype("float32")
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            batches.append(_normalize(pooled).astype("float32"))
+        return np.vstack(batches) if batches else np.empty((0, 0), dtype="float32")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed([text])[0].tolist()
+
+
+def _load(backend: str, model_name: str) -> Embeddings:
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': 'cpu'})
+    if backend == "torch_int8":
+        return QuantizedTorchEmbeddings(model_name)
+    if backend == "onnx":
+        return OnnxEmbeddings(model_name, ONNX_FILE)
+    if backend == "onnx_int8":
+        embeddings = OnnxEmbeddings(model_name, ONNX_INT8_FILE)
+        embeddings.backend = backend
+        return embeddings
+    raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}.")
+
+
+def get_embeddings(backend: str = EMBED_BACKEND, model_name: str = EMBED_MODEL) -> Embeddings:
+    """
+    Returns the embedding model for a backend. Falls back to the reference
+    backend when the requested one cannot be loaded (e.g. onnxruntime missing).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}.")
+    if backend != REFERENCE_BACKEND:
+        try:
+            return _load(backend, model_name)
+        except Exception as e:
+            logger.warning("Embedding backend %s unavailable (%s); falling back to %s", backend, e, REFERENCE_BACKEND)
+    return _load(REFERENCE_BACKEND, model_name)
+
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> Dict:
+    """
+    Row-wise cosine similarity of two embedding matrices of the same texts.
+    """
+    cosines = (_normalize(np.asarray(reference, dtype="float32")) *
+               _normalize(np.asarray(candidate, dtype="float32"))).sum(axis=1)
+    return {"mean_cosine": float(cosines.mean()), "min_cosine": float(cosines.min()),
+            "passed": bool(cosines.min() >= AGREEMENT_MIN_COSINE)}
+
+
+def check_agreement(candidate: Embeddings, texts: List[str], reference: Optional[Embeddings] = None) -> Dict:
+    """
+    Embeds texts with both backends and reports their cosine agreement
+    (passed: every text at or above AGREEMENT_MIN_COSINE).
+    """
+    reference = reference or get_embeddings(REFERENCE_BACKEND)
+    return cosine_agreement(np.array(reference.embed_documents(texts)), np.array(candidate.embed_documents(texts)))
+
+if __name__ == "__main__":
+    # Agreement of a backend with the reference on the indexed chunks: python src/embedding_backend.py onnx_int8
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.docstore import DOCSTORE_FILE, SQLiteDocstore
+
+    backend = sys.argv[1] if len(sys.argv) > 1 else "onnx"
+    docstore = SQLiteDocstore(os.path.join("embeddings", DOCSTORE_FILE))
+    sample = [text for _, (_, _, text, _) in zip(range(256), docstore.iter_rows())]
+    print(backend, check_agreement(get_embeddings(backend), sample))
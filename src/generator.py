@@ -2,103 +2,442 @@
 generator.py
 ------------
 Gemini LLM integration for answer generation in the RAG pipeline.
-- Uses official Google GenerativeAI SDK
+- Uses official Google GenerativeAI SDK, imported when the first client is built
 - Reads API key from environment variable
+- Caches the Gemini client per process with a background health check
+  and a circuit breaker (exponential backoff) instead of a per-call test
 - Enhanced RAG + LLM integration with structured formatting
+- Prompts are fitted to a token budget (src/prompt_builder.py)
+- Async streaming variant for the answer pipeline (src/pipeline.py)
 """
 
+import asyncio
 import os
+import random
+import threading
+import time
 from dotenv import load_dotenv
-import google.generativeai as genai
-from typing import List
-import requests
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional
+
+from src.prompt_builder import build_prompt as build_budgeted_prompt
 
 load_dotenv()
 
-def get_gemini_llm():
+GEMINI_MODEL = "gemini-1.5-flash"
+# Seconds between two background health checks of a cached client
+HEALTH_CHECK_INTERVAL = float(os.getenv("GEMINI_HEALTH_CHECK_INTERVAL", "60"))
+# Circuit breaker backoff: BREAKER_BASE_BACKOFF * 2**(failures - 1), capped
+BREAKER_BASE_BACKOFF = 2.0
+BREAKER_MAX_BACKOFF = 300.0
+FALLBACK_ANSWER = "I apologize, but I'm having trouble generating a response right now. Please try again in a moment."
+
+
+class CircuitOpenError(ValueError):
     """
-    Instantiates the Gemini LLM using the API key from the environment.
-    Uses GOOGLE_API_KEY for the chatbot functionality.
+    Raised when the Gemini circuit breaker is open and calls are refused.
+    """
+
+
+def _build_gemini_model(model_name: str = GEMINI_MODEL):
+    """
+    Configures the SDK from GOOGLE_API_KEY and builds the GenerativeModel.
     """
     api_key = os.getenv("GOOGLE_API_KEY")
-    
+
     if not api_key:
         raise ValueError("GOOGLE_API_KEY environment variable not set. Please set GOOGLE_API_KEY in your .env file.")
-    
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content("test")
-        return model
-    except Exception as e:
-        raise ValueError(f"Google API connection failed: {str(e)}")
 
-def generate_answer(llm, question: str, context: list, chat_history: list = None, language: str = "English") -> str:
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+def _default_health_check(model) -> None:
+    """
+    Cheap liveness probe: token counting instead of a full generation.
+    """
+    model.count_tokens("ping")
+
+
+class GeminiClient:
+    """
+    Builds a Gemini model once and keeps it healthy in the background.
+    - Health check runs on a daemon thread every `health_check_interval` seconds;
+      while the breaker is open it probes as soon as the backoff has elapsed
+    - Consecutive failures (generations, health checks, builds) open a circuit
+      breaker with exponential backoff; a success closes it
+    - Counts the per-call "test" generations (and their time) it avoids
+    """
+
+    def __init__(self, model_factory: Callable[[], object],
+                 health_check: Callable[[object], None] = _default_health_check,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL,
+                 base_backoff: float = BREAKER_BASE_BACKOFF,
+                 max_backoff: float = BREAKER_MAX_BACKOFF):
+        self.model_factory = model_factory
+        self.health_check = health_check
+        self.health_check_interval = health_check_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._model = None
+        self._failures = 0
+        self._open_until = 0.0
+        self._last_error = None
+        self._stop = threading.Event()
+        # Set when the breaker opens or the client closes, so the health loop reschedules
+        self._wake = threading.Event()
+        self._thread = None
+        self.metrics = {
+            "builds": 0,
+            "calls": 0,
+            "health_checks": 0,
+            "health_check_failures": 0,
+            "health_check_seconds": 0.0,
+            "breaker_trips": 0,
+            "rejected_calls": 0,
+        }
+
+    @property
+    def state(self) -> str:
+        """
+        'closed' (healthy), 'open' (refusing calls) or 'half-open' (next call is a trial).
+        """
+        if self._failures == 0:
+            return "closed"
+        return "open" if time.monotonic() < self._open_until else "half-open"
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._open_until = 0.0
+            self._last_error = None
+
+    def record_failure(self, error: Exception) -> None:
+        """
+        Registers a failed call or health check and (re)opens the breaker.
+        """
+        with self._lock:
+            self._failures += 1
+            self._last_error = error
+            backoff = min(self.max_backoff, self.base_backoff * (2 ** (self._failures - 1)))
+            self._open_until = time.monotonic() + backoff
+            self.metrics["breaker_trips"] += 1
+        self._wake.set()
+
+    def check_health(self) -> bool:
+        """
+        Runs one health check against the cached model and updates the breaker.
+        """
+        model = self._model
+        if model is None:
+            return False
+        start = time.perf_counter()
+        try:
+            self.health_check(model)
+        except Exception as e:
+            with self._lock:
+                self.metrics["health_check_failures"] += 1
+            self.record_failure(e)
+            return False
+        finally:
+            with self._lock:
+                self.metrics["health_checks"] += 1
+                self.metrics["health_check_seconds"] += time.perf_counter() - start
+        self.record_success()
+        return True
+
+    def _next_check_delay(self) -> float:
+        with self._lock:
+            if self._failures and self._model is not None:
+                return max(0.0, self._open_until - time.monotonic())
+        return self.health_check_interval
+
+    def _health_loop(self) -> None:
+        while not self._stop.is_set():
+            woken = self._wake.wait(self._next_check_delay())
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if woken:
+                # The breaker (re)opened: wait out the new backoff, then probe
+                continue
+            self.check_health()
+
+    def _ensure_health_thread(self) -> None:
+        if self.health_check_interval > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._health_loop, name="gemini-health-check", daemon=True)
+            self._thread.start()
+
+    def get(self):
+        """
+        Returns the cached model, building it on first use.
+        Raises CircuitOpenError while the breaker is open.
+        """
+        with self._lock:
+            if self._failures and time.monotonic() < self._open_until:
+                self.metrics["rejected_calls"] += 1
+                raise CircuitOpenError(f"Google API unavailable, retrying after backoff: {self._last_error}")
+            self.metrics["calls"] += 1
+            if self._model is not None:
+                return self._model
+        try:
+            model = self.model_factory()
+        except Exception as e:
+            self.record_failure(e)
+            raise ValueError(f"Google API connection failed: {str(e)}")
+        with self._lock:
+            if self._model is None:
+                self._model = model
+                self.metrics["builds"] += 1
+            self._ensure_health_thread()
+            return self._model
+
+    def close(self) -> None:
+        """
+        Stops the background health check.
+        """
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> Dict:
+        """
+        Returns call/health metrics, breaker state and the estimated savings
+        versus building and probing the model on every call.
+        """
+        with self._lock:
+            stats = dict(self.metrics)
+            checks = stats["health_checks"]
+            avg_check = stats["health_check_seconds"] / checks if checks else 0.0
+            stats["state"] = self.state
+            stats["consecutive_failures"] = self._failures
+            # Every get() used to configure the SDK and run a generate_content("test")
+            stats["test_calls_saved"] = stats["calls"]
+            stats["builds_saved"] = max(0, stats["calls"] - stats["builds"])
+            # Lower bound: a generate_content("test") round trip costs more than a health check
+            stats["seconds_saved_estimate"] = stats["test_calls_saved"] * avg_check
+            return stats
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """
+    Local stand-in for genai.GenerativeModel for offline tests.
+    Injects latency and errors (random `error_rate` or the first `fail_times` calls).
+    With stream=True the reply is yielded word by word, `chunk_latency` apart.
+    """
+
+    def __init__(self, reply: str = "## Answer\n• This is a fake answer.", latency: float = 0.0,
+                 error_rate: float = 0.0, fail_times: int = 0, seed: Optional[int] = None,
+                 chunk_latency: float = 0.0):
+        self.reply = reply
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.error_rate = error_rate
+        self.fail_times = fail_times
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _count_call(self) -> int:
+        with self._lock:
+            self.calls += 1
+            return self.calls
+
+    def _check_error(self, calls: int) -> None:
+        if calls <= self.fail_times or self._rng.random() < self.error_rate:
+            raise RuntimeError("FakeGenerativeModel injected error")
+
+    def _maybe_fail(self) -> None:
+        calls = self._count_call()
+        if self.latency:
+            time.sleep(self.latency)
+        self._check_error(calls)
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        self._maybe_fail()
+        if stream:
+            return self._stream()
+        return _FakeResponse(self.reply)
+
+    def _stream(self) -> Iterator[_FakeResponse]:
+        for word in self.reply.split(" "):
+            if self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            yield _FakeResponse(word + " ")
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        calls = self._count_call()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._check_error(calls)
+        if stream:
+            return self._stream_async()
+        return _FakeResponse(self.reply)
+
+    async def _stream_async(self) -> AsyncIterator[_FakeResponse]:
+        for word in self.reply.split(" "):
+            if self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+            yield _FakeResponse(word + " ")
+
+    def count_tokens(self, contents) -> Dict:
+        self._maybe_fail()
+        return {"total_tokens": len(str(contents).split())}
+
+
+# Process-wide registry of Gemini clients, keyed by model name
+_clients: Dict[str, GeminiClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_gemini_client(model_name: str = GEMINI_MODEL) -> GeminiClient:
+    """
+    Returns the process-wide GeminiClient for a model (singleton).
+    """
+    with _clients_lock:
+        client = _clients.get(model_name)
+        if client is None:
+            client = GeminiClient(lambda: _build_gemini_model(model_name))
+            _clients[model_name] = client
+        return client
+
+
+def _client_of(llm) -> Optional[GeminiClient]:
+    """
+    Returns the registered client that built llm (None for e.g. fake models).
+    """
+    with _clients_lock:
+        return next((client for client in _clients.values() if client._model is llm), None)
+
+
+def get_gemini_llm():
+    """
+    Returns the cached Gemini LLM using the API key from the environment.
+    Uses GOOGLE_API_KEY for the chatbot functionality.
+    The model is built once per process; health is checked in the background.
+    """
+    return get_gemini_client().get()
+
+def build_prompt(question: str, context: list, chat_history: list = None, language: str = "English",
+                 stats: Optional[Dict] = None, summary: str = "") -> str:
+    """
+    Builds the RAG prompt from retrieved context, recent turns and the question,
+    fitted to PROMPT_TOKEN_BUDGET (see src/prompt_builder.py).
+    Falls back to a general-knowledge prompt when the context is weak.
+    """
+    return build_budgeted_prompt(question, context, chat_history, language, stats=stats, summary=summary)
+
+def generate_answer(llm, question: str, context: list, chat_history: list = None, language: str = "English",
+                    client: Optional[GeminiClient] = None) -> str:
     """
     Enhanced RAG + LLM answer generation with structured formatting.
     Combines retrieved context with LLM's knowledge for concise, 
     well-structured responses with clear sections and bullet points.
+    The outcome is reported to the circuit breaker of `client` (by default the
+    client that built llm).
     """
-    chat_history = chat_history or []
-    history_str = ""
-    if chat_history:
-        history_str = "\n".join([
-            f"User: {q}\nBot: {a}" for q, a in chat_history[-4:]
-        ])
-    
-    context_str = "\n\n".join(context).strip()
-    context_is_weak = not context_str or len(context_str) < 30
-    
-    lang_instruction = f"Please answer in {language}."
-    
-    # Enhanced RAG + LLM prompt engineering with concise formatting
-    if context_is_weak:
-        # Fallback to LLM's general knowledge when RAG context is insufficient
-        prompt = (
-            f"You are an expert loan advisor. {lang_instruction}\n\n"
-            f"IMPORTANT: Keep responses CONCISE and FOCUSED. Maximum 150-200 words.\n\n"
-            f"FORMATTING REQUIREMENTS:\n"
-            f"1. Use clear headings with ##\n"
-            f"2. Use bullet points (•) for lists\n"
-            f"3. Use bold text (**text**) for emphasis\n"
-            f"4. Keep sections short and to the point\n"
-            f"5. Avoid unnecessary explanations\n\n"
-            f"Recent conversation:\n{history_str}\n\n"
-            f"User Question: {question}\n\n"
-            f"Provide a CONCISE, well-structured response:"
-        )
-    else:
-        # Enhanced RAG + LLM integration with concise formatting
-        prompt = (
-            f"You are a knowledgeable loan assistant. Use the provided context information "
-            f"AND your own expertise to give comprehensive but CONCISE answers. {lang_instruction}\n\n"
-            f"IMPORTANT: Keep responses CONCISE and FOCUSED. Maximum 150-200 words.\n\n"
-            f"FORMATTING REQUIREMENTS:\n"
-            f"1. Use clear headings with ##\n"
-            f"2. Use bullet points (•) for lists\n"
-            f"3. Use bold text (**text**) for emphasis\n"
-            f"4. Keep sections short and to the point\n"
-            f"5. Avoid unnecessary explanations\n"
-            f"6. Focus on the most important information\n\n"
-            f"Retrieved Context:\n{context_str}\n\n"
-            f"Recent conversation:\n{history_str}\n\n"
-            f"User Question: {question}\n\n"
-            f"Instructions:\n"
-            f"1. Use the context information as your primary source\n"
-            f"2. Supplement with your own knowledge if needed\n"
-            f"3. Be specific and concise\n"
-            f"4. Focus on the most relevant information\n"
-            f"5. Keep the response under 200 words\n"
-            f"6. Use clear, structured formatting\n\n"
-            f"Provide a CONCISE, well-structured answer:"
-        )
-    
+    client = client or _client_of(llm)
+    prompt = build_prompt(question, context, chat_history, language)
     try:
         response = llm.generate_content(prompt)
-        return response.text.strip()
+        text = response.text.strip()
     except Exception as e:
+        if client is not None:
+            client.record_failure(e)
         # Fallback response if LLM fails
-        return f"I apologize, but I'm having trouble generating a response right now. Please try again in a moment."
+        return FALLBACK_ANSWER
+    if client is not None:
+        client.record_success()
+    return text
+
+def _chunk_text(chunk) -> Optional[str]:
+    try:
+        return chunk.text
+    except ValueError:
+        # Chunks without text parts (e.g. safety metadata) raise on .text
+        return None
+
+def generate_answer_stream(llm, question: str, context: list, chat_history: list = None,
+                           language: str = "English", timing: Optional[Dict] = None,
+                           summary: str = "", client: Optional[GeminiClient] = None) -> Iterator[str]:
+    """
+    Streaming variant of generate_answer: yields text chunks as Gemini produces them
+    (generate_content(..., stream=True)). If `timing` is given it is filled with
+    time_to_first_token, total_time and chunks (seconds, seconds, count) and
+    the prompt statistics of build_prompt (prompt_tokens, ...). summary is the
+    chat memory's summary of older turns. The outcome is reported to the
+    circuit breaker as in generate_answer.
+    """
+    client = client or _client_of(llm)
+    timing = timing if timing is not None else {}
+    timing.update({"time_to_first_token": None, "total_time": None, "chunks": 0})
+    prompt = build_prompt(question, context, chat_history, language, stats=timing, summary=summary)
+    start = time.perf_counter()
+    try:
+        for chunk in llm.generate_content(prompt, stream=True):
+            text = _chunk_text(chunk)
+            if not text:
+                continue
+            if timing["time_to_first_token"] is None:
+                timing["time_to_first_token"] = time.perf_counter() - start
+            timing["chunks"] += 1
+            yield text
+    except Exception as e:
+        if client is not None:
+            client.record_failure(e)
+        # Fallback response if LLM fails before or during streaming
+        if timing["chunks"] == 0:
+            yield FALLBACK_ANSWER
+        else:
+            yield "\n\n" + FALLBACK_ANSWER
+    else:
+        if client is not None:
+            client.record_success()
+    finally:
+        timing["total_time"] = time.perf_counter() - start
+
+async def generate_answer_stream_async(llm, question: str, context: list, chat_history: list = None,
+                                       language: str = "English", timing: Optional[Dict] = None,
+                                       summary: str = "", client: Optional[GeminiClient] = None) -> AsyncIterator[str]:
+    """
+    Async variant of generate_answer_stream using generate_content_async, so
+    one event loop can wait on many Gemini calls at once. Fills `timing` and
+    reports to the circuit breaker the same way.
+    """
+    client = client or _client_of(llm)
+    timing = timing if timing is not None else {}
+    timing.update({"time_to_first_token": None, "total_time": None, "chunks": 0})
+    prompt = build_prompt(question, context, chat_history, language, stats=timing, summary=summary)
+    start = time.perf_counter()
+    try:
+        response = await llm.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            text = _chunk_text(chunk)
+            if not text:
+                continue
+            if timing["time_to_first_token"] is None:
+                timing["time_to_first_token"] = time.perf_counter() - start
+            timing["chunks"] += 1
+            yield text
+    except Exception as e:
+        if client is not None:
+            client.record_failure(e)
+        # Fallback response if LLM fails before or during streaming
+        if timing["chunks"] == 0:
+            yield FALLBACK_ANSWER
+        else:
+            yield "\n\n" + FALLBACK_ANSWER
+    else:
+        if client is not None:
+            client.record_success()
+    finally:
+        timing["total_time"] = time.perf_counter() - start
 
 def execute_code_judge0(source_code, language_id, stdin=None):
     """
@@ -120,6 +459,7 @@ def execute_code_judge0(source_code, language_id, stdin=None):
     }
     if stdin:
         payload["stdin"] = stdin
+    import requests
     response = requests.post(url, json=payload, headers=headers)
     if response.status_code != 201:
         raise Exception(f"Judge0 API error: {response.status_code} {response.text}")
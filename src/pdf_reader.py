@@ -2,13 +2,30 @@
 pdf_reader.py
 -------------
 Extracts text from PDF and TXT files for downstream embedding.
-- Uses PyMuPDF (fitz) for PDFs
+- Uses PyMuPDF (fitz) for PDFs, imported on first use
 - Handles plain text files
+- Parallel, recursive folder ingestion yielding (path, page_no, text) records
+  page by page and in input order, with an mtime/size cache so unchanged
+  files are not parsed again
 """
 
-import fitz 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import logging
+import multiprocessing
 import os
-from typing import List
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_CACHE_DIR = ".cache/extracted"
+# 0 = extract in this process; N > 0 = pool of N extraction processes
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# PDF pages parsed per pool task
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "16"))
 
 def extract_text_from_pdf(pdf_path: str) -> str:
     """
@@ -19,6 +36,7 @@ def extract_text_from_pdf(pdf_path: str) -> str:
         raise FileNotFoundError(f"File not found: {pdf_path}")
     if not pdf_path.lower().endswith(".pdf"):
         raise ValueError("File is not a PDF.")
+    import fitz
     doc = fitz.open(pdf_path)
     text = "\n".join([page.get_text() for page in doc])
     doc.close()
@@ -49,5 +67,234 @@ def extract_texts_from_folder(folder_path: str, exts: List[str] = [".pdf", ".txt
             texts.append(extract_text_from_txt(fpath))
     return texts
 
+def iter_pdf_pages(pdf_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_no, text) for pages [start, stop) of a PDF (page_no is 1-based), one page at a time.
+    """
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"File not found: {pdf_path}")
+    import fitz
+    with fitz.open(pdf_path) as doc:
+        for page in doc.pages(start, doc.page_count if stop is None else min(stop, doc.page_count)):
+            yield page.number + 1, page.get_text()
+
+def iter_folder_files(folder_path: str, exts: List[str] = [".pdf", ".txt"]) -> Iterator[str]:
+    """
+    Yields paths of all matching files under folder_path, recursively, in sorted order.
+    """
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        for fname in sorted(files):
+            if os.path.splitext(fname)[1].lower() in exts:
+                yield os.path.join(root, fname)
+
+def pdf_page_count(pdf_path: str) -> int:
+    """
+    Returns the number of pages of a PDF without extracting any text.
+    """
+    import fitz
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+def iter_file_pages(path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_no, text) for pages [start, stop) of a PDF, or (1, text) for a TXT file.
+    """
+    if path.lower().endswith(".pdf"):
+        yield from iter_pdf_pages(path, start, stop)
+    else:
+        yield 1, extract_text_from_txt(path)
+
+def _page_ranges(path: str, pages_per_task: int) -> List[Tuple[int, Optional[int]]]:
+    if not path.lower().endswith(".pdf"):
+        return [(0, None)]
+    count = pdf_page_count(path)
+    return [(start, start + pages_per_task) for start in range(0, count, pages_per_task)]
+
+def _extract_pages(path: str, start: int, stop: Optional[int]) -> Tuple[List[Tuple[int, str]], float]:
+    """
+    Worker: extracts pages [start, stop) of one file, returns (pages, seconds).
+    """
+    began = time.perf_counter()
+    pages = list(iter_file_pages(path, start, stop))
+    return pages, time.perf_counter() - began
+
+class ExtractionCache:
+    """
+    On-disk cache of extracted pages, one JSON-lines file per source file
+    (a header line, then one line per page), valid while the source's mtime
+    and size are unchanged. Entries are written and read page by page.
+    """
+
+    def __init__(self, cache_dir: str = EXTRACT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _entry_path(self, path: str) -> str:
+        key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + ".jsonl")
+
+    @staticmethod
+    def signature(path: str) -> List[int]:
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def get(self, path: str) -> Optional[Iterator[Tuple[int, str]]]:
+        """
+        Returns an iterator over the cached (page_no, text) pages, or None on a miss.
+        """
+        entry_path = self._entry_path(path)
+        if not os.path.exists(entry_path):
+            return None
+        with open(entry_path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+        if header.get("signature") != self.signature(path):
+            return None
+        return self._iter_entry(entry_path)
+
+    @staticmethod
+    def _iter_entry(entry_path: str) -> Iterator[Tuple[int, str]]:
+        with open(entry_path, "r", encoding="utf-8") as f:
+            f.readline()
+            for line in f:
+                page_no, text = json.loads(line)
+                yield page_no, text
+
+    def writer(self, path: str) -> "CacheWriter":
+        """
+        Starts an entry for path; pages are appended with add() and published by commit().
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return CacheWriter(self._entry_path(path), {"path": os.path.abspath(path), "signature": self.signature(path)})
+
+    def put(self, path: str, pages: Iterable[Tuple[int, str]]) -> None:
+        writer = self.writer(path)
+        for page_no, text in pages:
+            writer.add(page_no, text)
+        writer.commit()
+
+class CacheWriter:
+    """
+    Writes one cache entry to a temp file, renamed into place on commit().
+    """
+
+    def __init__(self, entry_path: str, header: Dict):
+        self.entry_path = entry_path
+        self.tmp_path = entry_path + ".tmp"
+        self._file = open(self.tmp_path, "w", encoding="utf-8")
+        self._file.write(json.dumps(header) + "\n")
+
+    def add(self, page_no: int, text: str) -> None:
+        self._file.write(json.dumps([page_no, text]) + "\n")
+
+    def commit(self) -> None:
+        self._file.close()
+        os.replace(self.tmp_path, self.entry_path)
+
+    def discard(self) -> None:
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+def iter_folder_pages(folder_path: str, exts: List[str] = [".pdf", ".txt"], workers: int = EXTRACT_WORKERS,
+                      cache: Optional[ExtractionCache] = None, skip_unchanged: bool = False,
+                      timings: Optional[List[Dict]] = None,
+                      pages_per_task: int = EXTRACT_PAGES_PER_TASK) -> Iterator[Tuple[str, int, str]]:
+    """
+    Extracts every PDF/TXT under folder_path (recursively) and yields
+    (path, page_no, text) records in file and page order, as pages are extracted;
+    no file is held in memory whole.
+    - workers > 0 parses ranges of pages_per_task pages on a process pool (at most
+      2 * workers ranges in flight), started on the first cache miss
+    - cache serves unchanged files without parsing; with skip_unchanged they are not yielded
+    - timings, if given, receives {"path", "pages", "seconds", "cached"} per file
+    """
+    def report(path: str, pages: int, seconds: float, cached: bool) -> None:
+        logger.info("extracted %s: %d pages in %.3fs%s", path, pages, seconds, " (cached)" if cached else "")
+        if timings is not None:
+            timings.append({"path": path, "pages": pages, "seconds": seconds, "cached": cached})
+
+    def cached_pages(path: str, pages: Iterator[Tuple[int, str]]) -> Iterator[Tuple[str, int, str]]:
+        start, count = time.perf_counter(), 0
+        for page_no, text in pages:
+            count += 1
+            if not skip_unchanged:
+                yield path, page_no, text
+        report(path, count, time.perf_counter() - start, True)
+
+    def extracted_pages(path: str, batches: Iterator[Tuple[List[Tuple[int, str]], float]]) -> Iterator[Tuple[str, int, str]]:
+        writer = cache.writer(path) if cache is not None else None
+        count, seconds = 0, 0.0
+        try:
+            for pages, batch_seconds in batches:
+                seconds += batch_seconds
+                for page_no, text in pages:
+                    count += 1
+                    if writer is not None:
+                        writer.add(page_no, text)
+                    yield path, page_no, text
+        except BaseException:
+            if writer is not None:
+                writer.discard()
+            raise
+        if writer is not None:
+            writer.commit()
+        report(path, count, seconds, False)
+
+    def local_batches(path: str) -> Iterator[Tuple[List[Tuple[int, str]], float]]:
+        # One page per batch, timed without the consumer's time in between
+        pages = iter_file_pages(path)
+        while True:
+            start = time.perf_counter()
+            page = next(pages, None)
+            if page is None:
+                return
+            yield [page], time.perf_counter() - start
+
+    pool = None
+    # Files in input order: (path, cached pages or None, futures of their page ranges)
+    window = deque()
+    in_flight = 0
+
+    def pool_batches(futures: deque) -> Iterator[Tuple[List[Tuple[int, str]], float]]:
+        nonlocal in_flight
+        while futures:
+            batch = futures.popleft().result()
+            in_flight -= 1
+            yield batch
+
+    def drain(limit: int) -> Iterator[Tuple[str, int, str]]:
+        # Emits whole files from the head of the window while more than limit ranges are in flight
+        while window and (window[0][1] is not None or in_flight > limit):
+            path, pages, futures = window.popleft()
+            if pages is not None:
+                yield from cached_pages(path, pages)
+            else:
+                yield from extracted_pages(path, pool_batches(futures))
+
+    try:
+        for path in iter_folder_files(folder_path, exts):
+            pages = cache.get(path) if cache is not None else None
+            if workers <= 0:
+                if pages is not None:
+                    yield from cached_pages(path, pages)
+                else:
+                    yield from extracted_pages(path, local_batches(path))
+                continue
+            if pages is not None:
+                window.append((path, pages, None))
+            else:
+                if pool is None:
+                    # spawn: the embedder may already hold torch threads, which fork does not survive
+                    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                futures = deque(pool.submit(_extract_pages, path, start, stop)
+                                for start, stop in _page_ranges(path, pages_per_task))
+                in_flight += len(futures)
+                window.append((path, None, futures))
+            yield from drain(2 * workers)
+        yield from drain(-1)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,209 @@
+"""
+pipeline.py
+-----------
+Asyncio answer pipeline shared by all sessions of a process.
+- One event loop on a background thread serves every question; Streamlit
+  script threads submit requests and consume the streamed answer
+- Retrieval (query embedding, index search) runs in a small thread pool;
+  Gemini is awaited with generate_content_async
+- At most PIPELINE_CONCURRENCY requests run at once (semaphore); up to
+  PIPELINE_QUEUE_SIZE wait in a bounded queue, and submit() rejects with
+  PipelineBusyError when it stays full (backpressure)
+- Queue wait, in-flight and throughput counters in stats()
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.generator import FALLBACK_ANSWER, generate_answer_stream_async, get_gemini_llm
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", "8"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+# Seconds submit() waits for a queue slot before rejecting the request
+PIPELINE_SUBMIT_TIMEOUT = float(os.getenv("PIPELINE_SUBMIT_TIMEOUT", "2"))
+RETRIEVAL_WORKERS = 4
+BUSY_ANSWER = "Too many questions are being answered right now. Please try again in a moment."
+
+_DONE = object()
+
+
+class PipelineBusyError(RuntimeError):
+    """
+    Raised by submit() when the request queue stays full for the submit timeout.
+    """
+
+
+class AnswerRequest:
+    """
+    A submitted question. context is set once retrieval finishes; stream()
+    yields the answer chunks as they arrive.
+    """
+
+    def __init__(self, question: str, retrieve: Optional[Callable[[str], List[str]]] = None,
+                 chat_history: Optional[List] = None, language: str = "English", summary: str = "",
+                 extra_context: Optional[List[str]] = None, timing: Optional[Dict] = None):
+        self.question = question
+        self.retrieve = retrieve
+        self.chat_history = chat_history or []
+        self.language = language
+        self.summary = summary
+        self.extra_context = extra_context or []
+        self.timing = timing if timing is not None else {}
+        self.context: List[str] = []
+        self.submitted_at = time.perf_counter()
+        self.done = threading.Event()
+        self._chunks: "queue.Queue" = queue.Queue()
+
+    def stream(self, timeout: Optional[float] = None) -> Iterator[str]:
+        """
+        Yields answer chunks until the answer is complete (blocking).
+        """
+        while True:
+            chunk = self._chunks.get(timeout=timeout)
+            if chunk is _DONE:
+                return
+            yield chunk
+
+
+class AnswerPipeline:
+    """
+    Bounded-concurrency asyncio pipeline: retrieve, then stream a Gemini answer.
+    """
+
+    def __init__(self, llm_factory: Callable[[], object] = get_gemini_llm,
+                 max_concurrency: int = PIPELINE_CONCURRENCY, queue_size: int = PIPELINE_QUEUE_SIZE,
+                 retrieval_workers: int = RETRIEVAL_WORKERS):
+        self.llm_factory = llm_factory
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=retrieval_workers, thread_name_prefix="pipeline-retrieval")
+        self._lock = threading.Lock()
+        self.metrics = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "in_flight": 0,
+                        "max_in_flight": 0, "queue_seconds": 0.0, "request_seconds": 0.0}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="answer-pipeline", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    async def _start(self) -> None:
+        # Loop-bound primitives must be created on the loop's thread
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._tasks = set()
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        while True:
+            request = await self._queue.get()
+            await self._semaphore.acquire()
+            task = asyncio.get_running_loop().create_task(self._process(request))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, request: AnswerRequest) -> None:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        queued = started - request.submitted_at
+        request.timing["queue_time"] = queued
+        with self._lock:
+            self.metrics["in_flight"] += 1
+            self.metrics["max_in_flight"] = max(self.metrics["max_in_flight"], self.metrics["in_flight"])
+            self.metrics["queue_seconds"] += queued
+        failed = False
+        try:
+            context = []
+            if request.retrieve is not None:
+                context = await loop.run_in_executor(self._executor, request.retrieve, request.question)
+            request.context = list(request.extra_context) + list(context)
+            # Building the model (first call) or a refused call must not block the loop
+            llm = await loop.run_in_executor(self._executor, self.llm_factory)
+            async for text in generate_answer_stream_async(llm, request.question, request.context, request.chat_history,
+                                                           request.language, timing=request.timing,
+                                                           summary=request.summary):
+                request._chunks.put(text)
+        except Exception as e:
+            failed = True
+            logger.warning("Answering %r failed: %s", request.question, e)
+            request._chunks.put(FALLBACK_ANSWER)
+        finally:
+            request._chunks.put(_DONE)
+            request.done.set()
+            self._semaphore.release()
+            with self._lock:
+                self.metrics["in_flight"] -= 1
+                self.metrics["failed" if failed else "completed"] += 1
+                self.metrics["request_seconds"] += time.perf_counter() - started
+
+    async def _stop(self) -> None:
+        tasks = [self._dispatcher, *self._tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _enqueue(self, request: AnswerRequest, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._queue.put(request), timeout)
+        except asyncio.TimeoutError:
+            raise PipelineBusyError(f"{self.queue_size} requests already waiting")
+
+    def submit(self, question: str, timeout: float = PIPELINE_SUBMIT_TIMEOUT, **kwargs) -> AnswerRequest:
+        """
+        Queues a question (kwargs as for AnswerRequest) and returns its request.
+        Raises PipelineBusyError if no queue slot frees up within timeout seconds.
+        """
+        request = AnswerRequest(question, **kwargs)
+        try:
+            asyncio.run_coroutine_threadsafe(self._enqueue(request, timeout), self._loop).result()
+        except PipelineBusyError:
+            with self._lock:
+                self.metrics["rejected"] += 1
+            raise
+        with self._lock:
+            self.metrics["submitted"] += 1
+        return request
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.metrics)
+        stats["queued"] = self._queue.qsize()
+        finished = stats["completed"] + stats["failed"]
+        stats["avg_queue_seconds"] = stats["queue_seconds"] / finished if finished else 0.0
+        return stats
+
+    def close(self) -> None:
+        """
+        Stops the event loop and the retrieval pool; queued requests are dropped.
+        """
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False)
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> AnswerPipeline:
+    """
+    Returns the process-wide answer pipeline (singleton).
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = AnswerPipeline()
+        return _pipeline
+
+if __name__ == "__main__":
+    pass
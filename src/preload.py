@@ -0,0 +1,84 @@
+"""
+preload.py
+----------
+Background warm-up of the heavy dependencies that src/ imports lazily.
+- The Gemini SDK, the langchain FAISS vectorstore, PyMuPDF and pandas are
+  imported on first use, so importing app.py renders the page quickly
+- preload_in_background() imports them on a daemon thread once per process,
+  after the page has rendered, so the first question rarely pays for them
+- Per-module import times in preload_stats() (missing optional packages are
+  recorded, not raised)
+"""
+
+import importlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+PRELOAD_ENABLED = os.getenv("PRELOAD", "1") == "1"
+# In the order they are needed: answering, loading the index, uploads, stats cube rebuilds
+PRELOAD_MODULES = ("google.generativeai", "langchain_community.vectorstores.faiss", "fitz", "pandas")
+
+_lock = threading.Lock()
+_started = False
+_timings: Dict[str, object] = {}
+_done = threading.Event()
+
+
+def _preload(modules: Sequence[str]) -> None:
+    start = time.perf_counter()
+    for name in modules:
+        module_start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            seconds = time.perf_counter() - module_start
+        except Exception as e:
+            logger.debug("Preloading %s failed: %s", name, e)
+            seconds = f"unavailable ({type(e).__name__})"
+        with _lock:
+            _timings[name] = seconds
+    logger.info("Preloaded %d modules in %.2fs", len(modules), time.perf_counter() - start)
+    _done.set()
+
+
+def preload_in_background(modules: Sequence[str] = PRELOAD_MODULES, enabled: bool = PRELOAD_ENABLED) -> bool:
+    """
+    Starts importing modules on a daemon thread, once per process.
+    Returns True if this call started the thread.
+    """
+    global _started
+    if not enabled:
+        return False
+    with _lock:
+        if _started:
+            return False
+        _started = True
+    threading.Thread(target=_preload, args=(tuple(modules),), name="preload", daemon=True).start()
+    return True
+
+
+def wait_for_preload(timeout: Optional[float] = None) -> bool:
+    """
+    Blocks until the preload thread has finished (or timeout); True if it has.
+    """
+    return _done.wait(timeout)
+
+
+def preload_stats() -> Dict:
+    """
+    Returns {"done": bool, "modules": {name: import seconds or "unavailable (...)"}}.
+    """
+    with _lock:
+        modules = dict(_timings)
+    return {"done": _done.is_set(), "modules": modules}
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    preload_in_background()
+    wait_for_preload()
+    for name, seconds in preload_stats()["modules"].items():
+        print(f"{name:<45}{seconds if isinstance(seconds, str) else f'{seconds:.3f}s'}")
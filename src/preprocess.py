@@ -2,17 +2,51 @@
 preprocess.py
 --------------
 Cleans and preprocesses the loan dataset for embedding.
-- Loads CSV
+- Loads CSV with explicit column dtypes
 - Cleans column names
 - Handles missing values
 - Chunks long text fields
+- Vectorized row-to-text conversion and a streaming (chunked read_csv) mode
+- Structured row documents ("field: value" text + typed metadata for filters)
 """
 
+from itertools import repeat
+import numpy as np
 import pandas as pd
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import os
 
 CHUNK_SIZE = 300
+# Rows per block when streaming a CSV with read_csv(chunksize=...)
+CSV_BLOCK_ROWS = 100_000
+# Categorical loan columns copied into row metadata for filtered retrieval
+METADATA_FIELDS = ["loan_id", "gender", "married", "dependents", "education", "self_employed",
+                   "credit_history", "property_area", "loan_status"]
+# Column dtypes by cleaned name, passed to read_csv so every block of a streamed
+# CSV (and the whole file) parses alike; other columns are read as strings
+CSV_DTYPES = {"loan_id": "str", "gender": "str", "married": "str", "dependents": "str", "education": "str",
+              "self_employed": "str", "applicantincome": "float64", "coapplicantincome": "float64",
+              "loanamount": "float64", "loan_amount_term": "float64", "credit_history": "float64",
+              "property_area": "str", "loan_status": "str"}
+# Household income (applicant + coapplicant) buckets: [low, high) bounds and labels
+INCOME_BINS = [0, 2500, 5000, 10000, float("inf")]
+INCOME_LABELS = ["low", "medium", "high", "very_high"]
+
+def _clean_name(col: str) -> str:
+    return col.strip().replace(" ", "_").lower()
+
+def csv_dtypes(csv_path: str) -> Dict[str, str]:
+    """
+    Maps the CSV's raw column names to CSV_DTYPES (by cleaned name), "str" for unknown columns.
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+    return {col: CSV_DTYPES.get(_clean_name(col), "str") for col in header}
+
+def _clean_frame(df: pd.DataFrame) -> pd.DataFrame:
+    # Clean column names
+    df.columns = [_clean_name(col) for col in df.columns]
+    # Fill missing values with empty string (for text fields)
+    return df.fillna("")
 
 def load_and_clean_csv(csv_path: str) -> pd.DataFrame:
     """
@@ -20,12 +54,8 @@ def load_and_clean_csv(csv_path: str) -> pd.DataFrame:
     """
     if not os.path.exists(csv_path):
         raise FileNotFoundError(f"File not found: {csv_path}")
-    df = pd.read_csv(csv_path)
-    # Clean column names
-    df.columns = [col.strip().replace(" ", "_").lower() for col in df.columns]
-    # Fill missing values with empty string (for text fields)
-    df = df.fillna("")
-    return df
+    df = pd.read_csv(csv_path, dtype=csv_dtypes(csv_path))
+    return _clean_frame(df)
 
 def chunk_text(text: str, max_length: int = 300) -> List[str]:
     """
@@ -39,15 +69,160 @@ def chunk_text(text: str, max_length: int = 300) -> List[str]:
             chunks.append(chunk)
     return chunks
 
+def _row_strings(df: pd.DataFrame, fields: List[str]) -> List[str]:
+    """
+    Joins the selected fields of every row with spaces, column by column.
+    Mirrors how iterrows() stringifies values: rows are built from df.values,
+    so an all-numeric frame is upcast to one common dtype first.
+    """
+    present = [field for field in fields if field in df.columns]
+    if not present or df.empty:
+        return [""] * len(df)
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in df.dtypes):
+        df = pd.DataFrame(df.values, columns=df.columns, index=df.index)
+    columns = [df[field].astype(str) for field in present]
+    return columns[0].str.cat(columns[1:], sep=" ").tolist() if len(columns) > 1 else columns[0].tolist()
+
 def dataframe_to_chunks(df: pd.DataFrame, fields: List[str], max_length: int = CHUNK_SIZE) -> List[str]:
     """
     Converts selected fields from each row into text chunks.
     """
     all_chunks = []
-    for _, row in df.iterrows():
-        combined = " ".join([str(row[field]) for field in fields if field in row])
-        all_chunks.extend(chunk_text(combined, max_length=max_length))
+    for combined in _row_strings(df, fields):
+        words = combined.split()
+        # Fast path: a row shorter than max_length words is a single chunk
+        if len(words) <= max_length:
+            if words:
+                all_chunks.append(" ".join(words))
+        else:
+            all_chunks.extend(chunk_text(combined, max_length=max_length))
     return all_chunks
 
+def _typed(value):
+    """
+    Converts a cleaned cell to a plain metadata value: None for blanks,
+    int for whole floats (e.g. credit_history 1.0 -> 1), Python scalars otherwise.
+    """
+    if value is None or value == "":
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+def _typed_values(values: pd.Series) -> List:
+    """
+    _typed over a whole column, without a Python call per cell where the
+    column is numeric (or numeric with blanks) or all strings.
+    """
+    if pd.api.types.is_bool_dtype(values.dtype) or pd.api.types.is_integer_dtype(values.dtype):
+        return values.tolist()
+    if pd.api.types.is_float_dtype(values.dtype):
+        numbers = values.to_numpy(dtype="float64", na_value=np.nan)
+    else:
+        items = values.tolist()
+        kinds = set(map(type, items))
+        if kinds <= {str}:
+            return [item if item != "" else None for item in items]
+        # Numbers with "" for blanks, as left by fillna("") on a numeric column with gaps
+        if not kinds <= {str, float, int} or any(item != "" for item in items if type(item) is str):
+            return [_typed(item) for item in items]
+        numbers = np.array([np.nan if type(item) is str else item for item in items], dtype="float64")
+    present = ~np.isnan(numbers)
+    whole = present & (np.mod(numbers, 1, where=present, out=np.zeros_like(numbers)) == 0)
+    typed = np.empty(len(numbers), dtype=object)
+    typed[:] = numbers.tolist()
+    typed[whole] = numbers[whole].astype(np.int64).tolist()
+    typed[~present] = None
+    return typed.tolist()
+
+def income_buckets(df: pd.DataFrame) -> List[Optional[str]]:
+    """
+    Buckets household income (applicantincome + coapplicantincome) into INCOME_LABELS.
+    """
+    income = pd.Series(0.0, index=df.index)
+    for col in ("applicantincome", "coapplicantincome"):
+        if col in df.columns:
+            income = income + pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+    buckets = pd.cut(income, bins=INCOME_BINS, labels=INCOME_LABELS, right=False)
+    return buckets.astype(object).where(buckets.notna(), None).tolist()
+
+def _document_texts(df: pd.DataFrame, fields: List[str]) -> pd.Series:
+    """
+    Builds the "field: value | ..." text of every row column by column,
+    skipping blank values ("" for rows where every field is blank).
+    """
+    parts = []
+    for field in fields:
+        values = df[field].astype(str)
+        # Every non-blank part ends with the separator; the trailing one is cut below
+        parts.append((field + ": " + values + " | ").where(values != "", ""))
+    texts = parts[0].str.cat(parts[1:]) if len(parts) > 1 else parts[0]
+    return texts.str[:-3].where(texts != "", "")
+
+def dataframe_to_documents(df: pd.DataFrame, fields: List[str], max_length: int = CHUNK_SIZE,
+                           source: str = "loan_csv") -> List[Tuple[str, Dict]]:
+    """
+    Converts each row into a "field: value | ..." text plus typed metadata
+    (METADATA_FIELDS, income_bucket, source) usable as retrieval filters.
+    Texts are built column-wise; only metadata dicts and overlong rows are per row.
+    """
+    present = [field for field in fields if field in df.columns]
+    if not present or df.empty:
+        return []
+    texts = _document_texts(df, present).tolist()
+    meta_fields = [field for field in METADATA_FIELDS if field in df.columns] + ["income_bucket", "source"]
+    meta_columns = [_typed_values(df[field]) for field in meta_fields[:-2]]
+    meta_columns += [income_buckets(df), repeat(source)]
+
+    documents = []
+    for text, values in zip(texts, zip(*meta_columns)):
+        if not text:
+            continue
+        metadata = dict(zip(meta_fields, values))
+        # A text of at most max_length characters cannot have more than max_length words
+        if len(text) <= max_length or len(text.split()) <= max_length:
+            documents.append((text, metadata))
+        else:
+            documents.extend((chunk, metadata) for chunk in chunk_text(text, max_length=max_length))
+    return documents
+
+def iter_csv_blocks(csv_path: str, block_rows: int = CSV_BLOCK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Streams a CSV as cleaned DataFrame blocks of block_rows rows, parsed with
+    the same explicit dtypes (csv_dtypes) as load_and_clean_csv.
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"File not found: {csv_path}")
+    for block in pd.read_csv(csv_path, chunksize=block_rows, dtype=csv_dtypes(csv_path)):
+        yield _clean_frame(block)
+
+def iter_csv_chunks(csv_path: str, fields: Optional[List[str]] = None, exclude: Iterable[str] = (),
+                    max_length: int = CHUNK_SIZE, block_rows: int = CSV_BLOCK_ROWS) -> Iterator[str]:
+    """
+    Streams text chunks from a CSV without loading it whole: reads block_rows rows
+    at a time, cleans them like load_and_clean_csv and converts them like
+    dataframe_to_chunks. fields defaults to every column not in exclude.
+    Blocks are parsed with explicit dtypes, so the output does not depend on block_rows.
+    """
+    exclude = set(exclude)
+    for block in iter_csv_blocks(csv_path, block_rows):
+        block_fields = fields or [col for col in block.columns if col not in exclude]
+        yield from dataframe_to_chunks(block, block_fields, max_length=max_length)
+
+def iter_csv_documents(csv_path: str, fields: Optional[List[str]] = None, exclude: Iterable[str] = (),
+                       max_length: int = CHUNK_SIZE, block_rows: int = CSV_BLOCK_ROWS) -> Iterator[Tuple[str, Dict]]:
+    """
+    Streaming counterpart of dataframe_to_documents (see iter_csv_chunks).
+    """
+    exclude = set(exclude)
+    for block in iter_csv_blocks(csv_path, block_rows):
+        block_fields = fields or [col for col in block.columns if col not in exclude]
+        yield from dataframe_to_documents(block, block_fields, max_length=max_length)
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,193 @@
+"""
+prompt_builder.py
+-----------------
+Token-budgeted prompt assembly for answer generation.
+- Static template segments are defined once and their token counts cached
+- Fits retrieved context and chat history into PROMPT_TOKEN_BUDGET by
+  priority: question and instructions always, then context in retrieval
+  order, then the most recent turns (long past answers truncated), then
+  any context that still fits
+- Counts tokens with tiktoken, falling back to the local estimator
+- Logs prompt tokens per request
+"""
+
+from functools import lru_cache
+import logging
+import os
+import sys
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.chunker import get_token_counter
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+PROMPT_TOKENIZER = "tiktoken"
+# Share of the free budget reserved for context before history is added
+CONTEXT_SHARE = 0.75
+HISTORY_TURNS = 4
+# Past answers are cut to this many tokens in the history
+HISTORY_ANSWER_TOKENS = 150
+# Below this many characters of context the general-knowledge template is used
+WEAK_CONTEXT_CHARS = 30
+
+LANGUAGE, CONTEXT, HISTORY, QUESTION = "{language}", "{context}", "{history}", "{question}"
+SLOTS = (LANGUAGE, CONTEXT, HISTORY, QUESTION)
+
+_FORMATTING = (
+    "IMPORTANT: Keep responses CONCISE and FOCUSED. Maximum 150-200 words.\n\n"
+    "FORMATTING REQUIREMENTS:\n"
+    "1. Use clear headings with ##\n"
+    "2. Use bullet points (•) for lists\n"
+    "3. Use bold text (**text**) for emphasis\n"
+    "4. Keep sections short and to the point\n"
+    "5. Avoid unnecessary explanations\n"
+)
+
+# Enhanced RAG + LLM integration with concise formatting
+RAG_TEMPLATE = (
+    "You are a knowledgeable loan assistant. Use the provided context information "
+    "AND your own expertise to give comprehensive but CONCISE answers. Please answer in ", LANGUAGE, ".\n\n",
+    _FORMATTING + "6. Focus on the most important information\n\n"
+    "Retrieved Context:\n", CONTEXT,
+    "\n\nRecent conversation:\n", HISTORY,
+    "\n\nUser Question: ", QUESTION,
+    "\n\nInstructions:\n"
+    "1. Use the context information as your primary source\n"
+    "2. Supplement with your own knowledge if needed\n"
+    "3. Be specific and concise\n"
+    "4. Focus on the most relevant information\n"
+    "5. Keep the response under 200 words\n"
+    "6. Use clear, structured formatting\n\n"
+    "Provide a CONCISE, well-structured answer:",
+)
+
+# Fallback to LLM's general knowledge when RAG context is insufficient
+GENERAL_TEMPLATE = (
+    "You are an expert loan advisor. Please answer in ", LANGUAGE, ".\n\n",
+    _FORMATTING + "\nRecent conversation:\n", HISTORY,
+    "\n\nUser Question: ", QUESTION,
+    "\n\nProvide a CONCISE, well-structured response:",
+)
+
+CONTEXT_SEPARATOR = "\n\n"
+HISTORY_SEPARATOR = "\n"
+SUMMARY_PREFIX = "Summary of earlier conversation: "
+
+
+_counters: Dict[str, Callable[[str], int]] = {}
+_counters_lock = threading.Lock()
+
+
+def cached_token_counter(tokenizer: str = PROMPT_TOKENIZER) -> Callable[[str], int]:
+    """
+    get_token_counter, loading the tokenizer (or failing to) once per process.
+    """
+    with _counters_lock:
+        if tokenizer not in _counters:
+            _counters[tokenizer] = get_token_counter(tokenizer)
+        return _counters[tokenizer]
+
+
+@lru_cache(maxsize=None)
+def _static_tokens(template: Tuple[str, ...], tokenizer: str) -> int:
+    """
+    Token count of a template's static segments (computed once per tokenizer).
+    """
+    count = cached_token_counter(tokenizer)
+    return sum(count(segment) for segment in template if segment not in SLOTS)
+
+
+def truncate_tokens(text: str, max_tokens: int, count: Callable[[str], int]) -> str:
+    """
+    Cuts text on a word boundary so that it has at most max_tokens tokens.
+    """
+    if max_tokens <= 0:
+        return ""
+    if count(text) <= max_tokens:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    # Binary search for the longest word prefix within the budget
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count(" ".join(words[:middle])) + 1 <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low]) + " …" if low else ""
+
+
+def _fill(template: Sequence[str], values: Dict[str, str]) -> str:
+    return "".join(values.get(segment, segment) for segment in template)
+
+
+def build_prompt(question: str, context: List[str], chat_history: Optional[List] = None, language: str = "English",
+                 budget: int = PROMPT_TOKEN_BUDGET, tokenizer: str = PROMPT_TOKENIZER,
+                 stats: Optional[Dict] = None, summary: str = "") -> str:
+    """
+    Builds the RAG prompt within budget tokens. summary (of turns no longer in
+    chat_history) goes before the turns if it fits. stats, if given, receives
+    prompt_tokens and the number of context chunks and history turns kept
+    and dropped.
+    """
+    count = cached_token_counter(tokenizer)
+    chat_history = list(chat_history or [])[-HISTORY_TURNS:]
+    chunks = [chunk.strip() for chunk in context if chunk and chunk.strip()]
+    weak = len("\n\n".join(chunks)) < WEAK_CONTEXT_CHARS
+    template = GENERAL_TEMPLATE if weak else RAG_TEMPLATE
+
+    free = budget - _static_tokens(template, tokenizer) - count(language) - count(question)
+    # Context, in retrieval order, up to its share of the budget
+    kept_chunks: List[Optional[str]] = [None] * len(chunks)
+    chunk_tokens = [count(chunk) + 1 for chunk in chunks] if not weak else []
+    context_budget = int(max(free, 0) * CONTEXT_SHARE)
+    used = 0
+    for i, tokens in enumerate(chunk_tokens):
+        if used + tokens <= context_budget:
+            kept_chunks[i] = chunks[i]
+            used += tokens
+    free -= used
+
+    # History, most recent turn first, with long answers truncated
+    turns: List[str] = []
+    for q, a in reversed(chat_history):
+        turn = f"User: {q}\nBot: {truncate_tokens(a, HISTORY_ANSWER_TOKENS, count)}"
+        tokens = count(turn) + 1
+        if tokens > free:
+            break
+        turns.insert(0, turn)
+        free -= tokens
+    kept_turns = len(turns)
+    # The summary of older turns only makes sense if no recent turn was dropped
+    if summary and kept_turns == len(chat_history):
+        summary_line = SUMMARY_PREFIX + summary
+        tokens = count(summary_line) + 1
+        if tokens <= free:
+            turns.insert(0, summary_line)
+            free -= tokens
+
+    # Whatever budget is left goes to context that did not fit its share
+    for i, tokens in enumerate(chunk_tokens):
+        if kept_chunks[i] is None and tokens <= free:
+            kept_chunks[i] = chunks[i]
+            free -= tokens
+
+    context_str = CONTEXT_SEPARATOR.join(chunk for chunk in kept_chunks if chunk is not None)
+    prompt = _fill(template, {LANGUAGE: language, CONTEXT: context_str,
+                              HISTORY: HISTORY_SEPARATOR.join(turns), QUESTION: question})
+    prompt_tokens = count(prompt)
+    kept = sum(chunk is not None for chunk in kept_chunks)
+    logger.info("prompt tokens: %d/%d (context %d/%d chunks, history %d/%d turns)",
+                prompt_tokens, budget, kept, len(chunks), kept_turns, len(chat_history))
+    if stats is not None:
+        stats.update({"prompt_tokens": prompt_tokens, "context_chunks": kept, "context_chunks_dropped": len(chunks) - kept,
+                      "history_turns": kept_turns, "history_turns_dropped": len(chat_history) - kept_turns,
+                      "history_summary": kept_turns < len(turns)})
+    return prompt
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,181 @@
+"""
+reranker.py
+-----------
+Optional cross-encoder reranking of retrieved chunks.
+- Over-fetched candidates are scored against the query by a small CPU
+  cross-encoder in batches and the best k are kept
+- Hard latency budget: if scoring (or loading the model) does not finish in
+  time the candidates keep their retrieval order; scoring finishes in the
+  background and is cached for the next identical query
+- At most one scoring job runs at a time: while one is still pending, new
+  queries keep their retrieval order instead of queueing behind it
+- Scoring errors fall back to the retrieval order as well
+- Scores cached per (query, chunk id) in a bounded LRU
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+RERANK_ENABLED = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates fetched for reranking and chunks kept afterwards (smaller prompt than without reranking)
+RERANK_CANDIDATES = 20
+RERANK_TOP_K = 3
+RERANK_BATCH_SIZE = 8
+RERANK_BUDGET_SECONDS = float(os.getenv("RERANK_BUDGET_SECONDS", "0.3"))
+RERANK_CACHE_SIZE = 8192
+
+
+def _chunk_id(doc: Document) -> str:
+    # Docstore id when there is one; content hash otherwise (e.g. legacy documents)
+    return getattr(doc, "id", None) or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+class Reranker:
+    """
+    Thread-safe cross-encoder reranker with a score cache. The model is loaded
+    on first use; if it cannot be loaded, rerank() keeps the retrieval order.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE,
+                 budget_seconds: float = RERANK_BUDGET_SECONDS, cache_size: int = RERANK_CACHE_SIZE, model=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_seconds = budget_seconds
+        self.cache_size = cache_size
+        self._model = model
+        self._model_failed = False
+        self._lock = threading.Lock()
+        # Model loading can take seconds; it must not block cache lookups on the request thread
+        self._model_lock = threading.Lock()
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        # Scoring runs off the request thread so the budget holds even mid-batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._pending = None
+        self.metrics = {"calls": 0, "fallbacks": 0, "pairs_scored": 0, "cache_hits": 0, "score_seconds": 0.0,
+                        "busy_skips": 0, "errors": 0}
+
+    def get_model(self):
+        if self._model is None and not self._model_failed:
+            with self._model_lock:
+                if self._model is None and not self._model_failed:
+                    try:
+                        from sentence_transformers import CrossEncoder
+                        self._model = CrossEncoder(self.model_name, device="cpu")
+                    except Exception as e:
+                        self._model_failed = True
+                        logger.warning("Cross-encoder %s unavailable (%s); reranking disabled", self.model_name, e)
+        return self._model
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def _store(self, keys: List[Tuple[str, str]], scores) -> None:
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._scores[key] = float(score)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def _score(self, query: str, keys: List[Tuple[str, str]], texts: List[str]) -> None:
+        # Loads the model on first use, so that also happens within the budget
+        model = self.get_model()
+        if model is None:
+            return
+        start = time.perf_counter()
+        for offset in range(0, len(texts), self.batch_size):
+            batch_keys = keys[offset:offset + self.batch_size]
+            batch_texts = texts[offset:offset + self.batch_size]
+            scores = model.predict([(query, text) for text in batch_texts], batch_size=self.batch_size,
+                                   show_progress_bar=False)
+            self._store(batch_keys, scores)
+        with self._lock:
+            self.metrics["pairs_scored"] += len(texts)
+            self.metrics["score_seconds"] += time.perf_counter() - start
+
+    def rerank(self, query: str, docs: List[Document], k: int, budget_seconds: Optional[float] = None,
+               timings: Optional[Dict] = None) -> List[Document]:
+        """
+        Returns the k best docs by cross-encoder score. Falls back to the first k
+        docs in their given order if the model is unavailable, busy with an
+        earlier query or fails, or the budget runs out.
+        """
+        budget = self.budget_seconds if budget_seconds is None else budget_seconds
+        with self._lock:
+            self.metrics["calls"] += 1
+        query_key = " ".join(query.split())
+        keys = [(query_key, _chunk_id(doc)) for doc in docs]
+        scores = [self._cached(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        with self._lock:
+            self.metrics["cache_hits"] += len(docs) - len(missing)
+
+        fallback = False
+        if missing:
+            with self._lock:
+                # A job that outlived its budget is still scoring: do not queue behind it
+                future = None
+                if self._pending is None or self._pending.done():
+                    future = self._executor.submit(self._score, query, [keys[i] for i in missing],
+                                                   [docs[i].page_content for i in missing])
+                    self._pending = future
+                else:
+                    self.metrics["busy_skips"] += 1
+            if future is not None:
+                try:
+                    future.result(timeout=budget)
+                    scores = [self._cached(key) for key in keys]
+                except FutureTimeout:
+                    pass
+                except Exception as e:
+                    logger.warning("Reranking failed (%s); keeping retrieval order", e)
+                    with self._lock:
+                        self.metrics["errors"] += 1
+            # Model unavailable, busy, failed, budget exceeded or scores evicted in the meantime
+            fallback = any(score is None for score in scores)
+        if timings is not None:
+            timings["rerank_fallback"] = fallback
+        if fallback:
+            with self._lock:
+                self.metrics["fallbacks"] += 1
+            return docs[:k]
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order[:k]]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["cached_scores"] = len(self._scores)
+            return stats
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Reranker:
+    """
+    Returns the process-wide reranker (singleton).
+    """
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+        return _reranker
+
+if __name__ == "__main__":
+    pass
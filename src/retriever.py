@@ -2,57 +2,1042 @@
 retriever.py
 ------------
 Loads the FAISS index and retrieves top-k relevant chunks for a query.
-- Uses the same embedding model as for indexing
-- Easy to use in RAG pipeline
+- Uses the same embedding model (and backend, EMBED_BACKEND) as for indexing
+- Keeps the model and index resident once per process (shared by all sessions)
+- Serves the index memory-mapped with documents read from SQLite on demand
+  (see src/docstore.py), so startup is fast and processes share pages
+- Bounded LRU cache of query embeddings (float32), optionally persisted and
+  warmed up with common questions at startup
+- Hot-swaps the index when the files on disk change; the old docstore is
+  closed once the searches still using it have finished
+- Query-time accuracy/speed knobs for approximate indexes (IVF nprobe, HNSW efSearch)
+- Compact float16/int8 indexes: coarse search on the quantized codes, then
+  exact rescoring of the top candidates from memory-mapped float32 vectors
+- Metadata filters (e.g. property_area, education) resolved through a
+  bitmap inverted index, so filtered queries only scan matching vectors
+- Hybrid retrieval: BM25 (src/bm25.py) and FAISS candidates fused with
+  reciprocal rank fusion, with a per-stage timing breakdown
+- Lexical-only fast path while the embedding model is still loading
+- Optional cross-encoder reranking of over-fetched candidates (src/reranker.py)
+- MMR (maximal marginal relevance) selection over candidate embeddings, so
+  near-identical chunks do not crowd out the context (IVF indexes get an id
+  map at load so they can return their stored vectors; IVF-PQ ones are approximate)
+- Per-session overlay index for uploaded documents, merged with the base index
+- Concurrent queries micro-batched (src/batcher.py): one embedding forward
+  pass and one index.search for the whole batch
 - Enhanced retrieval for better RAG + LLM performance
 """
 
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from typing import List
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import faiss
+import numpy as np
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import atexit
+import hashlib
+import logging
 import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.chunker import chunk_document
+from src.docstore import DOCSTORE_FILE, INDEX_FILE, load_exact_vectors, load_vectorstore
+from src.bm25 import BM25_FILE, BM25Index
+from src.reranker import RERANK_CANDIDATES, RERANK_ENABLED, get_reranker
+from src.batcher import MICROBATCH_ENABLED, MicroBatcher
+from src.embedding_backend import EMBED_BACKEND, embedding_id, embedding_id_of, get_embeddings
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+logger = logging.getLogger(__name__)
 
 FAISS_INDEX_PATH = "embeddings"
 EMBED_MODEL = "all-MiniLM-L6-v2"
+INDEX_FILES = (INDEX_FILE, DOCSTORE_FILE)
+# Seconds between two on-disk change checks of the index files
+INDEX_CHECK_INTERVAL = 5.0
+# IVF lists probed per query and HNSW candidate list size (higher = better recall, slower)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Document metadata fields that can be used as retrieval filters
+FILTER_FIELDS = ("gender", "married", "dependents", "education", "self_employed", "credit_history",
+                 "property_area", "loan_status", "income_bucket", "source")
+# "hybrid" (BM25 + vectors, RRF), "vector" or "lexical"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_MODES = ("hybrid", "vector", "lexical")
+# Candidates taken from each ranker before fusion, and the RRF rank constant
+HYBRID_CANDIDATES = 20
+RRF_K = 60
+# MMR: trade-off between relevance (1.0) and diversity (0.0), and the candidate pool size
+MMR_ENABLED = os.getenv("MMR", "1") == "1"
+MMR_LAMBDA = 0.7
+MMR_CANDIDATES = 20
+# Compact (quantized) indexes: candidates fetched per result for exact rescoring
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+# Answer hybrid queries lexically until the embedding model has loaded
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "1") == "1"
+# Query embeddings kept in memory (384 float32 values, ~1.5 KB each)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+# Set to a file path (e.g. .cache/query_embeddings.npz) to keep the cache across restarts
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH") or None
+# Pre-embedded at startup (the example questions shown in the app)
+COMMON_QUESTIONS = (
+    "What are the current home loan interest rates?",
+    "Why was my loan rejected even with good income?",
+    "Is credit history important for loan approval?",
+    "What increases the chances of getting a home loan?",
+)
+
+
+def _filter_key(value):
+    # Filters match strings case-insensitively
+    return value.lower() if isinstance(value, str) else value
+
+
+class MetadataIndex:
+    """
+    Inverted index from (field, value) to a bitmap (NumPy bool array) over the
+    FAISS vector positions. Built once per loaded index.
+    """
+
+    def __init__(self, vectorstore: "FAISS", fields=FILTER_FIELDS):
+        self.size = vectorstore.index.ntotal
+        self.fields = set(fields)
+        postings: Dict[Tuple[str, object], List[int]] = {}
+        for position, metadata in self._iter_metadata(vectorstore):
+            for field in fields:
+                value = metadata.get(field)
+                if value is not None:
+                    postings.setdefault((field, _filter_key(value)), []).append(position)
+        self.bitmaps: Dict[Tuple[str, object], np.ndarray] = {}
+        for key, positions in postings.items():
+            bitmap = np.zeros(self.size, dtype=bool)
+            bitmap[positions] = True
+            self.bitmaps[key] = bitmap
+
+    @staticmethod
+    def _iter_metadata(vectorstore: "FAISS"):
+        # SQLite docstores stream metadata in one query instead of a lookup per document
+        if hasattr(vectorstore.docstore, "iter_metadata"):
+            yield from vectorstore.docstore.iter_metadata()
+            return
+        for position, doc_id in vectorstore.index_to_docstore_id.items():
+            doc = vectorstore.docstore.search(doc_id)
+            yield position, getattr(doc, "metadata", None) or {}
+
+    def match(self, filters: Dict) -> np.ndarray:
+        """
+        Returns the sorted vector positions matching every filter.
+        A list/tuple/set value matches any of its values.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for field, wanted in filters.items():
+            if field not in self.fields:
+                raise ValueError(f"Unsupported filter field: {field}. Use one of {sorted(self.fields)}.")
+            values = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            field_mask = np.zeros(self.size, dtype=bool)
+            for value in values:
+                bitmap = self.bitmaps.get((field, _filter_key(value)))
+                if bitmap is not None:
+                    field_mask |= bitmap
+            mask &= field_mask
+        return np.flatnonzero(mask)
+
+
+def configure_search(index, nprobe: int = FAISS_NPROBE, ef_search: int = FAISS_EF_SEARCH):
+    """
+    Applies the query-time knobs to an IVF or HNSW index (no-op for flat indexes).
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = max(1, min(nprobe, ivf.nlist))
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = max(1, ef_search)
+    return index
+
+
+def _selector_params(index, selector):
+    # IVF and HNSW indexes reject plain SearchParameters and would otherwise drop their knobs
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def search_positions(index, query_vector, k: int, positions: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Nearest-neighbour search returning (distances, positions), optionally
+    restricted to a subset of vector positions. For flat indexes only the
+    subset is scanned; other index types use a FAISS ID selector.
+    """
+    query = np.asarray(query_vector, dtype="float32").reshape(1, -1)
+    if positions is None:
+        distances, hits = index.search(query, k)
+    elif len(positions) == 0:
+        return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+    elif isinstance(index, faiss.IndexFlatL2):
+        vectors = faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+        subset_distances = ((vectors[positions] - query) ** 2).sum(axis=1)
+        k = min(k, len(positions))
+        top = np.argpartition(subset_distances, k - 1)[:k]
+        top = top[np.argsort(subset_distances[top])]
+        return subset_distances[top], positions[top]
+    else:
+        params = _selector_params(index, faiss.IDSelectorBatch(positions.astype("int64")))
+        distances, hits = index.search(query, k, params=params)
+    keep = hits[0] != -1
+    return distances[0][keep], hits[0][keep]
+
+
+def rescore(exact_vectors: np.ndarray, query_vector, positions: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Re-ranks candidate positions by exact L2 distance to the query using the
+    (memory-mapped) float32 vectors; returns the best k (distances, positions).
+    """
+    if len(positions) == 0:
+        return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+    query = np.asarray(query_vector, dtype="float32").ravel()
+    # Sorted positions read the memory-mapped file sequentially
+    order = np.argsort(positions)
+    candidates = np.asarray(positions, dtype="int64")[order]
+    distances = ((np.asarray(exact_vectors[candidates], dtype="float32") - query) ** 2).sum(axis=1)
+    top = np.argsort(distances, kind="stable")[:k]
+    return distances[top], candidates[top]
+
+
+def _query_key(query: str) -> str:
+    # Exact match up to surrounding/repeated whitespace
+    return " ".join(query.split())
+
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe LRU cache of query string -> embedding (float32 array).
+    Optionally loaded from and saved to a .npz file for warm restarts.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, path: Optional[str] = QUERY_CACHE_PATH,
+                 model_name: str = EMBED_MODEL):
+        self.max_entries = max_entries
+        self.path = path
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._dirty = False
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "loaded": 0}
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        key = _query_key(query)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                self.metrics["misses"] += 1
+                return None
+            self._vectors.move_to_end(key)
+            self.metrics["hits"] += 1
+            return vector
+
+    def put(self, query: str, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype="float32").ravel()
+        with self._lock:
+            self._vectors[_query_key(query)] = vector
+            self._vectors.move_to_end(_query_key(query))
+            self._dirty = True
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+                self.metrics["evictions"] += 1
+        return vector
+
+    def __contains__(self, query: str) -> bool:
+        with self._lock:
+            return _query_key(query) in self._vectors
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def set_model(self, model_name: str) -> None:
+        """
+        Switches to another embedding model id (e.g. after a backend fallback):
+        drops the entries of the old one and loads the persisted ones of the new one.
+        """
+        with self._lock:
+            if model_name == self.model_name:
+                return
+            self.model_name = model_name
+            self._vectors.clear()
+            self._dirty = False
+        self.load()
+
+    def load(self) -> int:
+        """
+        Loads persisted entries (least recently used first); returns how many were loaded.
+        A file written for another embedding model is ignored.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model"]) != self.model_name:
+                    return 0
+                queries, vectors = data["queries"], data["vectors"]
+                for query, vector in zip(queries.tolist(), vectors):
+                    self.put(query, vector)
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning("Ignoring unreadable query embedding cache %s: %s", self.path, e)
+            return 0
+        with self._lock:
+            self._dirty = False
+            self.metrics["loaded"] = len(self._vectors)
+        return len(self._vectors)
+
+    def save(self) -> None:
+        """
+        Writes the cache to path (atomically) if it changed since the last load/save.
+        """
+        with self._lock:
+            if not self.path or not self._dirty or not self._vectors:
+                return
+            queries = np.array(list(self._vectors.keys()))
+            vectors = np.stack(list(self._vectors.values()))
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, model=np.array(self.model_name), queries=queries, vectors=vectors)
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["entries"] = len(self._vectors)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            return stats
+
+
+def reciprocal_rank_fusion(rankings: List[List], rrf_k: int = RRF_K) -> List[Tuple[object, float]]:
+    """
+    Fuses ranked lists of keys: score(key) = sum over lists of 1 / (rrf_k + rank).
+    Returns (key, score) pairs, best first.
+    """
+    scores: Dict[object, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def mmr_select(query_vector, vectors: np.ndarray, k: int, lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    """
+    Maximal marginal relevance: greedily picks k rows of vectors maximizing
+    lambda * sim(query, v) - (1 - lambda) * max sim(v, already picked),
+    with cosine similarities. Returns row indices in pick order.
+    """
+    vectors = np.asarray(vectors, dtype="float32")
+    if len(vectors) == 0 or k <= 0:
+        return []
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype="float32").ravel()
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    relevance = vectors @ query
+    pairwise = vectors @ vectors.T
+    picked = [int(np.argmax(relevance))]
+    redundancy = pairwise[picked[0]].copy()
+    for _ in range(min(k, len(vectors)) - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[picked] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return picked
+
+
+def enable_reconstruct(index) -> None:
+    """
+    Builds the direct map (vector id -> inverted list slot, 8 bytes per vector)
+    an IVF index needs to return stored vectors; the lists stay memory-mapped.
+    No-op for other index types, which can always reconstruct.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.no():
+        ivf.make_direct_map()
+
+
+def reconstruct_vectors(index, positions) -> Optional[np.ndarray]:
+    """
+    Returns the stored vectors at positions, or None if the index cannot
+    reconstruct them (e.g. IVF without a direct map).
+    """
+    try:
+        return index.reconstruct_batch(np.asarray(positions, dtype="int64"))
+    except RuntimeError:
+        return None
+
+
+@contextmanager
+def _stage(timings: Optional[Dict], name: str):
+    # Adds the block's wall time to timings[name + "_time"] (seconds)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            key = f"{name}_time"
+            timings[key] = timings.get(key, 0.0) + time.perf_counter() - start
+
+
+class _ResidentEmbeddings(Embeddings):
+    """
+    Embeddings handle given to the loaded vectorstore; resolves the resident
+    model only when called, so loading the index never waits for the model.
+    """
+
+    def __init__(self, resident: "ResidentRetriever"):
+        self.resident = resident
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.resident.get_embedding().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.resident.embed_query(text).tolist()
+
+
+class ResidentRetriever:
+    """
+    Process-wide holder for the embedding model and the FAISS vectorstore.
+    The model is loaded once; the index is reloaded (hot-swapped) only when
+    the index files on disk change. Safe to share across threads.
+    Searches lease the vectorstore (leased_vectorstore); a swapped-out
+    vectorstore's docstore is closed once its last lease is released.
+    """
+
+    def __init__(self, index_path: str = FAISS_INDEX_PATH, model_name: str = EMBED_MODEL,
+                 check_interval: float = INDEX_CHECK_INTERVAL, nprobe: int = FAISS_NPROBE,
+                 ef_search: int = FAISS_EF_SEARCH, microbatch: bool = MICROBATCH_ENABLED,
+                 backend: str = EMBED_BACKEND):
+        self.index_path = index_path
+        self.model_name = model_name
+        self.backend = backend
+        self.check_interval = check_interval
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.generation = 0
+        self._lock = threading.RLock()
+        # Separate lock so index loads and lexical queries never wait for the model
+        self._model_lock = threading.Lock()
+        self._embedding = None
+        self._vectorstore = None
+        self._signature = None
+        self.index_version = None
+        self._last_check = 0.0
+        self._metadata_index = None
+        self._lexical_index = None
+        self._exact_vectors = None
+        # Leases per vectorstore id, and swapped-out vectorstores waiting for theirs to end
+        self._leases: Dict[int, int] = {}
+        self._retired: Dict[int, "FAISS"] = {}
+        self.query_cache = QueryEmbeddingCache(model_name=embedding_id(model_name, backend))
+        self.microbatch = microbatch
+        self._batcher = MicroBatcher(self._embed_search_batch, name="query-microbatch")
+        self.metrics = {
+            "model_loads": 0,
+            "model_load_seconds": 0.0,
+            "index_loads": 0,
+            "index_load_seconds": 0.0,
+            "hot_swaps": 0,
+            "docstores_closed": 0,
+            "requests": 0,
+            "reuses": 0,
+        }
+
+    def _index_signature(self) -> Tuple:
+        """
+        Returns (mtime_ns, size) of every index file; changes when the index is rebuilt.
+        """
+        signature = []
+        for fname in INDEX_FILES:
+            stat = os.stat(os.path.join(self.index_path, fname))
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def get_embedding(self) -> Embeddings:
+        """
+        Returns the shared embedding model, loading it on first use.
+        """
+        if self._embedding is None:
+            with self._model_lock:
+                if self._embedding is None:
+                    start = time.perf_counter()
+                    embedding = get_embeddings(self.backend, self.model_name)
+                    # Key cached query vectors by the backend that loaded, not the one configured
+                    self.query_cache.set_model(embedding_id_of(embedding, self.model_name))
+                    self._embedding = embedding
+                    self.metrics["model_loads"] += 1
+                    self.metrics["model_load_seconds"] += time.perf_counter() - start
+        return self._embedding
+
+    def embedding_loaded(self) -> bool:
+        return self._embedding is not None
+
+    def index_built(self) -> bool:
+        """
+        True if the index files exist (they are built by src/embedder.py, not committed).
+        """
+        return all(os.path.exists(os.path.join(self.index_path, fname)) for fname in INDEX_FILES)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Returns the query embedding, computing it only on a cache miss.
+        """
+        vector = self.query_cache.get(query)
+        if vector is None:
+            if self.microbatch:
+                return self._batcher((query, None, 0))[0]
+            vector = self.query_cache.put(query, self.get_embedding().embed_query(query))
+        return vector
+
+    def embed_and_search(self, query: str, k: int, vectorstore: "FAISS") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns (query embedding, L2 distances, positions) of the k nearest
+        vectors in vectorstore, micro-batched with concurrent callers.
+        """
+        if not self.microbatch:
+            vector = self.embed_query(query)
+            return (vector,) + search_positions(vectorstore.index, vector, k)
+        return self._batcher((query, vectorstore, k))
+
+    def _embed_search_batch(self, items: List[Tuple[str, Optional["FAISS"], int]]) -> List[Tuple]:
+        """
+        Batch worker: embeds all uncached queries in one forward pass, then runs
+        one index.search per vectorstore for the items with k > 0.
+        """
+        vectors = [self.query_cache.get(query) for query, _, _ in items]
+        missing = list(dict.fromkeys(query for (query, _, _), vector in zip(items, vectors) if vector is None))
+        if missing:
+            embedded = {query: self.query_cache.put(query, vector)
+                        for query, vector in zip(missing, self.get_embedding().embed_documents(missing))}
+            vectors = [vector if vector is not None else embedded[query]
+                       for (query, _, _), vector in zip(items, vectors)]
+        empty = (np.empty(0, dtype="float32"), np.empty(0, dtype="int64"))
+        results = [(vector,) + empty for vector in vectors]
+        groups: Dict[int, List[int]] = {}
+        for i, (_, vectorstore, k) in enumerate(items):
+            if vectorstore is not None and k > 0:
+                groups.setdefault(id(vectorstore), []).append(i)
+        for members in groups.values():
+            index = items[members[0]][1].index
+            queries = np.stack([vectors[i] for i in members]).astype("float32")
+            distances, hits = index.search(queries, max(items[i][2] for i in members))
+            for row, i in enumerate(members):
+                k = items[i][2]
+                keep = hits[row, :k] != -1
+                results[i] = (vectors[i], distances[row, :k][keep], hits[row, :k][keep])
+        return results
+
+    def warm_up(self, questions=COMMON_QUESTIONS) -> int:
+        """
+        Pre-embeds questions missing from the query cache in one batch and
+        persists the cache. Returns the number of questions embedded.
+        """
+        missing = [question for question in dict.fromkeys(questions) if question not in self.query_cache]
+        if missing:
+            for question, vector in zip(missing, self.get_embedding().embed_documents(missing)):
+                self.query_cache.put(question, vector)
+        self.query_cache.save()
+        return len(missing)
+
+    def _load_vectorstore(self, signature: Tuple):
+        start = time.perf_counter()
+        vectorstore = load_vectorstore(self.index_path, _ResidentEmbeddings(self))
+        configure_search(vectorstore.index, self.nprobe, self.ef_search)
+        # Before the index is shared: MMR reads candidate vectors back from it
+        enable_reconstruct(vectorstore.index)
+        lexical_path = os.path.join(self.index_path, BM25_FILE)
+        lexical_index = BM25Index.load(lexical_path) if os.path.exists(lexical_path) else None
+        if lexical_index is None:
+            logger.warning("No %s in %s; hybrid retrieval falls back to vectors only", BM25_FILE, self.index_path)
+        exact_vectors = load_exact_vectors(self.index_path)
+        with self._lock:
+            self._lexical_index = (vectorstore, lexical_index)
+            self._exact_vectors = (vectorstore, exact_vectors)
+            if self._vectorstore is not None:
+                self.metrics["hot_swaps"] += 1
+                self._retire(self._vectorstore)
+            self._vectorstore = vectorstore
+            self._signature = signature
+            # Same for every process that loads these files, unlike the local generation counter
+            self.index_version = hashlib.sha1(repr(signature).encode("utf-8")).hexdigest()[:16]
+            self.generation += 1
+            self.metrics["index_loads"] += 1
+            self.metrics["index_load_seconds"] += time.perf_counter() - start
+        return vectorstore
+
+    def get_vectorstore(self) -> "FAISS":
+        """
+        Returns the resident vectorstore, (re)loading it if missing or changed on disk.
+        """
+        with self._lock:
+            self.metrics["requests"] += 1
+            now = time.monotonic()
+            if self._vectorstore is not None and now - self._last_check < self.check_interval:
+                self.metrics["reuses"] += 1
+                return self._vectorstore
+            self._last_check = now
+            try:
+                signature = self._index_signature()
+            except FileNotFoundError:
+                # The embedder swaps the index directory by rename; keep serving the old one
+                if self._vectorstore is not None:
+                    self.metrics["reuses"] += 1
+                    return self._vectorstore
+                raise FileNotFoundError(f"FAISS index not found at {self.index_path}. Please run 'python src/embedder.py' to build the index.")
+            if self._vectorstore is not None and signature == self._signature:
+                self.metrics["reuses"] += 1
+                return self._vectorstore
+            return self._load_vectorstore(signature)
+
+    def acquire_vectorstore(self) -> "FAISS":
+        """
+        Returns the resident vectorstore and leases it: its docstore stays open,
+        even across a hot swap, until release_vectorstore is called.
+        """
+        with self._lock:
+            vectorstore = self.get_vectorstore()
+            self._leases[id(vectorstore)] = self._leases.get(id(vectorstore), 0) + 1
+            return vectorstore
+
+    def release_vectorstore(self, vectorstore: "FAISS") -> None:
+        with self._lock:
+            key = id(vectorstore)
+            self._leases[key] -= 1
+            if self._leases[key] == 0:
+                del self._leases[key]
+                if key in self._retired:
+                    self._close(self._retired.pop(key))
+
+    @contextmanager
+    def leased_vectorstore(self):
+        """
+        Yields the resident vectorstore, leased for the duration of the block.
+        """
+        vectorstore = self.acquire_vectorstore()
+        try:
+            yield vectorstore
+        finally:
+            self.release_vectorstore(vectorstore)
+
+    def _retire(self, vectorstore: "FAISS") -> None:
+        # Called with the lock held after a hot swap: close now, or when the last lease ends
+        if id(vectorstore) in self._leases:
+            self._retired[id(vectorstore)] = vectorstore
+        else:
+            self._close(vectorstore)
+
+    def _close(self, vectorstore: "FAISS") -> None:
+        close = getattr(vectorstore.docstore, "close", None)
+        if close is not None:
+            close()
+            self.metrics["docstores_closed"] += 1
+
+    def get_index_version(self) -> str:
+        """
+        Returns an identifier of the index files currently served (changes on rebuild).
+        """
+        self.get_vectorstore()
+        return self.index_version
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+        """
+        Changes nprobe / efSearch for the served index and future reloads.
+        """
+        with self._lock:
+            if nprobe is not None:
+                self.nprobe = nprobe
+            if ef_search is not None:
+                self.ef_search = ef_search
+            if self._vectorstore is not None:
+                configure_search(self._vectorstore.index, self.nprobe, self.ef_search)
+
+    def reload(self) -> "FAISS":
+        """
+        Forces a reload of the index from disk.
+        """
+        with self._lock:
+            self._last_check = time.monotonic()
+            return self._load_vectorstore(self._index_signature())
+
+    def get_metadata_index(self, vectorstore: "FAISS") -> MetadataIndex:
+        """
+        Returns the filter bitmaps for this vectorstore, building them once per index load.
+        """
+        with self._lock:
+            cached = self._metadata_index
+            if cached is not None and cached[0] is vectorstore:
+                return cached[1]
+            metadata_index = MetadataIndex(vectorstore)
+            self._metadata_index = (vectorstore, metadata_index)
+            return metadata_index
+
+    def get_lexical_index(self, vectorstore: "FAISS") -> Optional[BM25Index]:
+        """
+        Returns the BM25 index saved with this vectorstore, or None if there is none.
+        """
+        with self._lock:
+            loaded = self._lexical_index
+            return loaded[1] if loaded is not None and loaded[0] is vectorstore else None
+
+    def get_exact_vectors(self, vectorstore: "FAISS") -> Optional[np.ndarray]:
+        """
+        Returns the memory-mapped exact vectors of a compact vectorstore, or
+        None if its index stores exact vectors.
+        """
+        with self._lock:
+            loaded = self._exact_vectors
+            return loaded[1] if loaded is not None and loaded[0] is vectorstore else None
+
+    def document_at(self, vectorstore: "FAISS", position: int) -> Document:
+        return vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(position)])
+
+    def choose_mode(self, mode: str = RETRIEVAL_MODE) -> str:
+        """
+        Returns the mode to run: hybrid becomes lexical while the model is not
+        loaded yet (LEXICAL_FAST_PATH); loading then starts in the background.
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unsupported retrieval mode: {mode}. Use one of {RETRIEVAL_MODES}.")
+        if mode == "hybrid" and LEXICAL_FAST_PATH and not self.embedding_loaded():
+            warm_up_in_background(resident=self)
+            return "lexical"
+        return mode
+
+    def search(self, query: str, k: int = 8, filters: Optional[Dict] = None,
+               query_vector: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        """
+        Returns up to k (document, L2 distance) pairs, nearest first.
+        filters ({field: value or [values]}) restrict the search to matching documents.
+        Pass query_vector to reuse an existing query embedding. Compact indexes
+        are rescored with the exact vectors.
+        """
+        with self.leased_vectorstore() as vectorstore:
+            vector = query_vector if query_vector is not None else self.embed_query(query)
+            exact_vectors = self.get_exact_vectors(vectorstore)
+            if not filters and exact_vectors is None:
+                return vectorstore.similarity_search_with_score_by_vector(vector, k=k)
+            positions = self.get_metadata_index(vectorstore).match(filters) if filters else None
+            if exact_vectors is None:
+                distances, hits = search_positions(vectorstore.index, vector, k, positions)
+            else:
+                distances, hits = search_positions(vectorstore.index, vector, k * RESCORE_FACTOR, positions)
+                distances, hits = rescore(exact_vectors, vector, hits, k)
+            return [(vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(position)]), float(distance))
+                    for distance, position in zip(distances, hits)]
+
+    def stats(self) -> Dict:
+        """
+        Returns load/reuse metrics for monitoring.
+        """
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["generation"] = self.generation
+            stats["leased_vectorstores"] = len(self._leases)
+            stats["retired_vectorstores"] = len(self._retired)
+            stats["index_version"] = self.index_version
+            if self._vectorstore is not None:
+                stats["index_type"] = type(self._vectorstore.index).__name__
+            requests = stats["requests"]
+            stats["reuse_ratio"] = stats["reuses"] / requests if requests else 0.0
+        stats["query_cache"] = self.query_cache.stats()
+        stats["microbatch"] = self._batcher.stats()
+        return stats
+
+
+# Process-wide registry of resident retrievers, keyed by (index_path, model_name)
+_residents: Dict[Tuple[str, str], ResidentRetriever] = {}
+_residents_lock = threading.Lock()
+
+
+def get_resident_retriever(index_path: str = FAISS_INDEX_PATH, model_name: str = EMBED_MODEL) -> ResidentRetriever:
+    """
+    Returns the process-wide ResidentRetriever for this index and model (singleton).
+    """
+    key = (os.path.abspath(index_path), model_name)
+    with _residents_lock:
+        resident = _residents.get(key)
+        if resident is None:
+            resident = ResidentRetriever(index_path=index_path, model_name=model_name)
+            _residents[key] = resident
+        return resident
+
+
+_warm_up_started = set()
+
+
+def warm_up_in_background(questions=COMMON_QUESTIONS, resident: Optional[ResidentRetriever] = None) -> None:
+    """
+    Starts resident.warm_up(questions) on a daemon thread, once per retriever.
+    """
+    resident = resident or get_resident_retriever()
+    with _residents_lock:
+        if id(resident) in _warm_up_started:
+            return
+        _warm_up_started.add(id(resident))
+
+    def run():
+        try:
+            embedded = resident.warm_up(questions)
+            logger.info("Query embedding cache warmed up with %d questions", embedded)
+        except Exception as e:
+            logger.warning("Query embedding warm-up failed: %s", e)
+
+    threading.Thread(target=run, name="query-cache-warm-up", daemon=True).start()
 
 
 def load_faiss_retriever(index_path: str = FAISS_INDEX_PATH, model_name: str = EMBED_MODEL):
     """
-    Loads the FAISS index and returns a retriever object.
+    Returns a retriever over the resident FAISS index. The retriever outlives
+    any single search, so its vectorstore stays leased (open) for good.
+    """
+    return get_resident_retriever(index_path, model_name).acquire_vectorstore().as_retriever()
+
+
+class SessionOverlay:
+    """
+    Small per-session FAISS index of uploaded documents, searched together with
+    the shared base index. Uploads only embed their own chunks; the base index
+    is never copied or re-embedded.
+    """
+
+    def __init__(self, resident: Optional[ResidentRetriever] = None):
+        self.resident = resident or get_resident_retriever()
+        self.vectorstore: Optional["FAISS"] = None
+        self.sources: List[str] = []
+        self._chunks: List[str] = []
+        self._lexical_index: Optional[BM25Index] = None
+        self._metadata_index: Optional[MetadataIndex] = None
+
+    def add_document(self, text: str, source: str) -> int:
+        """
+        Chunks and embeds an uploaded document into the overlay.
+        Returns the number of chunks added (0 if this source was already added).
+        """
+        if source in self.sources:
+            return 0
+        chunks = chunk_document(text)
+        if not chunks:
+            return 0
+        embedding = self.resident.get_embedding()
+        vectors = embedding.embed_documents(chunks)
+        if self.vectorstore is None:
+            from langchain_community.vectorstores import FAISS
+            self.vectorstore = FAISS(embedding_function=embedding, index=faiss.IndexFlatL2(len(vectors[0])),
+                                     docstore=InMemoryDocstore(), index_to_docstore_id={})
+        self.vectorstore.add_embeddings(list(zip(chunks, vectors)),
+                                        metadatas=[{"source": "upload", "path": source}] * len(chunks),
+                                        ids=[str(uuid.uuid4()) for _ in chunks])
+        self.sources.append(source)
+        # Overlays are small: rebuild the lexical and filter indexes on every upload
+        self._chunks.extend(chunks)
+        self._lexical_index = BM25Index.build(self._chunks)
+        self._metadata_index = MetadataIndex(self.vectorstore)
+        return len(chunks)
+
+    def _positions(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        return self._metadata_index.match(filters) if filters else None
+
+    def vector_search(self, query_vector, k: int = 8, filters: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (L2 distances, positions) of the nearest uploaded chunks.
+        """
+        if self.vectorstore is None:
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+        return search_positions(self.vectorstore.index, query_vector, k, self._positions(filters))
+
+    def lexical_search(self, query: str, k: int = 8, filters: Optional[Dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (BM25 scores, positions) of the best matching uploaded chunks.
+        """
+        if self._lexical_index is None:
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+        return self._lexical_index.search(query, k, self._positions(filters))
+
+    def document_at(self, position: int) -> Document:
+        return self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[int(position)])
+
+    def search(self, query_vector: List[float], k: int = 8, filters: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """
+        Returns up to k (document, L2 distance) pairs from the uploaded documents.
+        """
+        distances, positions = self.vector_search(query_vector, k, filters)
+        return [(self.document_at(position), float(distance)) for distance, position in zip(distances, positions)]
+
+
+def search_with_overlay(query: str, k: int = 8, resident: Optional[ResidentRetriever] = None,
+                        overlay: Optional[SessionOverlay] = None, filters: Optional[Dict] = None,
+                        mode: str = RETRIEVAL_MODE, timings: Optional[Dict] = None,
+                        mmr: bool = False) -> List[Tuple[Document, float]]:
+    """
+    Searches the base index and the session overlay and returns up to k
+    (document, score) pairs, best first.
+    - "vector": one query embedding, FAISS hits merged by L2 distance (score = distance)
+    - "lexical": BM25 hits fused with RRF (score = fused score)
+    - "hybrid": BM25 and FAISS candidates fused with RRF (score = fused score)
+    mmr picks the k results from a larger candidate pool by maximal marginal
+    relevance (needs the query embedding, so not in lexical mode).
+    timings, if given, receives per-stage seconds (embed, vector_search, rescore,
+    lexical_search, fusion, mmr, fetch, retrieval) and the mode that ran;
+    without filters, embed includes the (micro-batched) base index search.
     """
-    if not os.path.exists(index_path):
-        raise FileNotFoundError(f"FAISS index not found at {index_path}. Please run 'python src/embedder.py' to build the index.")
-    
-    embedding = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': 'cpu'})
-    vectorstore = FAISS.load_local(index_path, embedding, allow_dangerous_deserialization=True)
-    return vectorstore.as_retriever()
+    resident = resident or get_resident_retriever()
+    start = time.perf_counter()
+    mode = resident.choose_mode(mode)
+    # The lease keeps the docstore open until the documents are fetched, even if the index is hot-swapped meanwhile
+    with resident.leased_vectorstore() as vectorstore:
+        return _search_leased(query, k, resident, vectorstore, overlay, filters, mode, timings, mmr, start)
+
+
+def _search_leased(query: str, k: int, resident: ResidentRetriever, vectorstore: "FAISS",
+                   overlay: Optional[SessionOverlay], filters: Optional[Dict], mode: str,
+                   timings: Optional[Dict], mmr: bool, start: float) -> List[Tuple[Document, float]]:
+    lexical_index = resident.get_lexical_index(vectorstore)
+    if lexical_index is None:
+        mode = "vector"
+    positions = resident.get_metadata_index(vectorstore).match(filters) if filters else None
+    exact_vectors = resident.get_exact_vectors(vectorstore)
+    mmr = mmr and mode != "lexical"
+    pool = max(MMR_CANDIDATES, 2 * k) if mmr else k
+    candidates = pool if mode == "vector" else max(pool, HYBRID_CANDIDATES)
+    # Compact indexes over-fetch, then rescore exactly
+    fetch = candidates * RESCORE_FACTOR if exact_vectors is not None else candidates
 
+    # Rankings hold (store, position) keys; the overlay has its own positions
+    rankings, distances = [], {}
+    if mode != "lexical":
+        base_hits = None
+        with _stage(timings, "embed"):
+            if positions is None:
+                # Unfiltered base search runs in the micro-batch, together with the embedding
+                vector, base_distances, base_hits = resident.embed_and_search(query, fetch, vectorstore)
+            else:
+                vector = resident.embed_query(query)
+        with _stage(timings, "vector_search"):
+            if base_hits is None:
+                base_distances, base_hits = search_positions(vectorstore.index, vector, fetch, positions)
+        if exact_vectors is not None:
+            with _stage(timings, "rescore"):
+                base_distances, base_hits = rescore(exact_vectors, vector, base_hits, candidates)
+        with _stage(timings, "vector_search"):
+            hits = [(("base", int(p)), float(d)) for d, p in zip(base_distances, base_hits)]
+            if overlay is not None:
+                overlay_distances, overlay_hits = overlay.vector_search(vector, candidates, filters)
+                hits += [(("overlay", int(p)), float(d)) for d, p in zip(overlay_distances, overlay_hits)]
+        hits.sort(key=lambda hit: hit[1])
+        distances = dict(hits)
+        rankings.append([key for key, _ in hits])
+    if mode != "vector":
+        with _stage(timings, "lexical_search"):
+            _, base_hits = lexical_index.search(query, candidates, positions)
+            rankings.append([("base", int(p)) for p in base_hits])
+            if overlay is not None:
+                _, overlay_hits = overlay.lexical_search(query, candidates, filters)
+                rankings.append([("overlay", int(p)) for p in overlay_hits])
 
-def retrieve_top_k(query: str, k: int = 8) -> List[str]:
+    with _stage(timings, "fusion"):
+        if mode == "vector":
+            ranked = [(key, distances[key]) for key in rankings[0][:pool]]
+        else:
+            ranked = reciprocal_rank_fusion(rankings)[:pool]
+    if mmr and len(ranked) > k:
+        with _stage(timings, "mmr"):
+            vectors = _candidate_vectors(resident, vectorstore, overlay, [key for key, _ in ranked])
+            if vectors is not None:
+                ranked = [ranked[i] for i in mmr_select(vector, vectors, k)]
+            elif timings is not None:
+                timings["mmr_skipped"] = True
+    ranked = ranked[:k]
+    with _stage(timings, "fetch"):
+        results = [(resident.document_at(vectorstore, position) if store == "base" else overlay.document_at(position), score)
+                   for (store, position), score in ranked]
+    if timings is not None:
+        timings["retrieval_time"] = time.perf_counter() - start
+        timings["retrieval_mode"] = mode
+    return results
+
+
+def _candidate_vectors(resident: ResidentRetriever, vectorstore: "FAISS", overlay: Optional[SessionOverlay],
+                       keys: List[Tuple[str, int]]) -> Optional[np.ndarray]:
+    # Saved exact vectors or those the index can reconstruct (see enable_reconstruct).
+    # None when unavailable: MMR is skipped rather than re-embedding the candidates
+    # on the request path
+    vectors = [None] * len(keys)
+    exact_vectors = resident.get_exact_vectors(vectorstore)
+    for store in ("base", "overlay"):
+        rows = [i for i, (key_store, _) in enumerate(keys) if key_store == store]
+        if not rows:
+            continue
+        index = vectorstore.index if store == "base" else overlay.vectorstore.index
+        if store == "base" and exact_vectors is not None:
+            stored = exact_vectors[np.asarray([keys[i][1] for i in rows], dtype="int64")]
+        else:
+            stored = reconstruct_vectors(index, [keys[i][1] for i in rows])
+        if stored is None:
+            return None
+        for i, row in zip(rows, stored):
+            vectors[i] = row
+    return np.asarray(vectors, dtype="float32")
+
+
+def retrieve_top_k(query: str, k: int = 8, resident: Optional[ResidentRetriever] = None,
+                   filters: Optional[Dict] = None, overlay: Optional[SessionOverlay] = None,
+                   mode: str = RETRIEVAL_MODE, timings: Optional[Dict] = None,
+                   rerank: Optional[bool] = None, mmr: Optional[bool] = None) -> List[str]:
     """
     Enhanced retrieval for RAG + LLM. Retrieves more chunks for better context coverage.
     Returns a list of text chunks with improved relevance.
+    filters, e.g. {"property_area": "Rural", "education": "Graduate"}, restrict
+    the search to documents with matching metadata. overlay adds the session's
+    uploaded documents. mode and timings are passed to search_with_overlay.
+    rerank (default RERANK_ENABLED) over-fetches RERANK_CANDIDATES chunks and
+    keeps the k best by cross-encoder score, within the reranker's latency budget.
+    mmr (default MMR_ENABLED) diversifies the chunks by maximal marginal relevance.
     """
-    retriever = load_faiss_retriever()
-    docs = retriever.invoke(query)
-    
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    mmr = MMR_ENABLED if mmr is None else mmr
+    fetch_k = max(k, RERANK_CANDIDATES) if rerank else k
+    docs = [doc for doc, _ in search_with_overlay(query, k=fetch_k, resident=resident, overlay=overlay,
+                                                  filters=filters, mode=mode, timings=timings, mmr=mmr)]
+    if rerank:
+        with _stage(timings, "rerank"):
+            docs = get_reranker().rerank(query, docs, k, timings=timings)
+
     # Enhanced retrieval strategy:
     # 1. Get more chunks for better coverage
     # 2. Filter out very short or irrelevant chunks
     # 3. Ensure diverse context for the LLM
-    
+
     relevant_chunks = []
     for doc in docs[:k]:
         content = doc.page_content.strip()
         # Filter out very short chunks that might not be useful
         if len(content) > 20 and not content.isspace():
             relevant_chunks.append(content)
-    
+
     # If we don't have enough relevant chunks, return what we have
     if not relevant_chunks:
         return [doc.page_content for doc in docs[:k]]
-    
+
     return relevant_chunks
 
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    pass
@@ -0,0 +1,354 @@
+"""
+stats.py
+--------
+Precomputed aggregate statistics over the loan dataset.
+- Builds group-by cubes (counts, approvals, loan amount, income) over the
+  categorical columns at index time and caches them on disk
+- Routes aggregate questions ("approval rate by credit history",
+  "average loan amount for self-employed applicants") to exact answers
+  without the LLM, or returns the numbers as context for it
+- A question is answered directly only when every qualifier in it maps to a
+  cube dimension; "not"/"non"/"without" before a value selects the other value
+  of a two-valued dimension
+- Questions with qualifiers the cube cannot express (a bank, a loan type, a
+  place, "not rural") are left to the LLM without numbers, which would
+  describe a different group of applicants
+"""
+
+from itertools import combinations
+import json
+import os
+import re
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATA_CSV = "data/loan_data.csv.csv"
+STATS_CACHE_PATH = "embeddings/stats_cube.json"
+# Categorical columns the cube is grouped by (loan_status is the measured outcome)
+CUBE_DIMENSIONS = ["gender", "married", "dependents", "education", "self_employed",
+                   "credit_history", "property_area", "income_bucket"]
+# Largest number of dimensions combined in one group-by
+CUBE_MAX_DIMS = 3
+MEASURES = ["count", "approved", "loan_amount_sum", "loan_amount_n", "income_sum", "income_n"]
+
+# Phrases naming a metric, checked in order
+METRIC_PATTERNS = [
+    ("rejection_rate", re.compile(r"\b(rejection|denial|decline) rates?\b|\bpercent(age)? .*\brejected\b")),
+    ("approval_rate", re.compile(r"\b(approval|acceptance|success) rates?\b|\bpercent(age)? .*\bapproved\b|\bhow likely .*\bapproved\b")),
+    ("avg_loan_amount", re.compile(r"\b(average|mean|avg|typical) (loan )?(amount|size)s?\b")),
+    ("avg_income", re.compile(r"\b(average|mean|avg|typical) (household |applicant )?incomes?\b")),
+    ("count", re.compile(r"\b(how many|number of|count of) (loan )?(applicants|applications|loans|people|borrowers)\b")),
+]
+# Phrases naming a dimension value; longer/negated phrases come first
+VALUE_PATTERNS = [
+    (re.compile(r"\bsemi[- ]?urban\b"), "property_area", "Semiurban"),
+    (re.compile(r"\brural\b"), "property_area", "Rural"),
+    (re.compile(r"\burban\b"), "property_area", "Urban"),
+    (re.compile(r"\b(non[- ]?graduates?|not graduates?|undergraduates?)\b"), "education", "Not Graduate"),
+    (re.compile(r"\bgraduates?\b"), "education", "Graduate"),
+    (re.compile(r"\bself[- ]?employed\b"), "self_employed", "Yes"),
+    (re.compile(r"\b(salaried|employed)\b"), "self_employed", "No"),
+    (re.compile(r"\b(unmarried|single)\b"), "married", "No"),
+    (re.compile(r"\bmarried\b"), "married", "Yes"),
+    (re.compile(r"\b(female|females|women)\b"), "gender", "Female"),
+    (re.compile(r"\b(male|males|men)\b"), "gender", "Male"),
+    (re.compile(r"\b(no|without|bad|poor) credit( history)?\b"), "credit_history", "0"),
+    (re.compile(r"\b(good|with|clean) credit( history)?\b"), "credit_history", "1"),
+    (re.compile(r"\b(no|zero|0|without) (dependents?|children|kids)\b"), "dependents", "0"),
+    (re.compile(r"\b((3|three) or more|3\+|more than (2|two)|3|three|4|four|5|five) (dependents|children|kids)\b"), "dependents", "3+"),
+    (re.compile(r"\b(2|two) (dependents|children|kids)\b"), "dependents", "2"),
+    (re.compile(r"\b(1|one|a single) (dependent|child|kid)\b"), "dependents", "1"),
+    (re.compile(r"\b(low)[- ]income\b"), "income_bucket", "low"),
+    (re.compile(r"\b(medium|middle)[- ]income\b"), "income_bucket", "medium"),
+    (re.compile(r"\bvery high[- ]income\b"), "income_bucket", "very_high"),
+    (re.compile(r"\bhigh[- ]income\b"), "income_bucket", "high"),
+]
+# Both values of the two-valued dimensions, so a negated value maps to the other one
+COMPLEMENTS = {
+    "self_employed": ("Yes", "No"), "married": ("Yes", "No"), "education": ("Graduate", "Not Graduate"),
+    "gender": ("Male", "Female"), "credit_history": ("1", "0"),
+}
+# A negation right before a value phrase: "not self-employed", "non-urban", "without good credit"
+NEGATION_PATTERN = re.compile(r"(\b(not|non|without|never)|n't)(\s+(a|an|from|in|living in|located in))?[\s-]*$")
+# "by <dimension>" / "per <dimension>" / "across <dimension>"
+GROUP_PATTERNS = [
+    (re.compile(r"\b(by|per|across|for each|vs\.?|versus) (property )?area\b|\bby (location|region)\b"), "property_area"),
+    (re.compile(r"\b(by|per|across|for each|vs\.?|versus) credit( history)?\b"), "credit_history"),
+    (re.compile(r"\b(by|per|across|for each|vs\.?|versus) education\b"), "education"),
+    (re.compile(r"\b(by|per|across|for each|vs\.?|versus) (gender|sex)\b"), "gender"),
+    (re.compile(r"\b(by|per|across|for each|vs\.?|versus) (marital status|marriage)\b"), "married"),
+    (re.compile(r"\b(by|per|across|for each|vs\.?|versus) (employment|self[- ]?employment)\b"), "self_employed"),
+    (re.compile(r"\b(by|per|across|for each|vs\.?|versus) (number of )?dependents\b"), "dependents"),
+    (re.compile(r"\b(by|per|across|for each|vs\.?|versus) income( bucket| level)?\b"), "income_bucket"),
+]
+# Words that qualify nothing. Any other word left after parsing (a bank, a loan
+# type, a place, a number) is outside the dataset, so the cube does not answer
+GENERIC_WORDS = frozenset("""
+a an the what whats is are was were be been being of for in on at to with and or among between
+do does did how much many there overall total all each every it its they their them who whose which
+this that these those me us tell show give get got have has having compare comparison compared
+vs versus by per across breakdown split group groups status history area areas level levels
+loan loans applicant applicants application applications people person borrower borrowers
+rate rates percent percentage approved rejected approval rejection chance chances odds likely
+average mean avg typical amount amounts size sizes income incomes dataset data please
+why so low high lower higher explain
+""".split())
+# Questions asking for reasons or advice get the numbers as context, not a canned answer
+EXPLAIN_PATTERN = re.compile(r"^\s*(why|how (can|do|should|to)|what (can|should)|explain|should)\b")
+
+DIMENSION_LABELS = {
+    "gender": "Gender", "married": "Married", "dependents": "Dependents", "education": "Education",
+    "self_employed": "Self-employed", "credit_history": "Credit history", "property_area": "Property area",
+    "income_bucket": "Income bucket",
+}
+METRIC_LABELS = {
+    "approval_rate": "Approval rate", "rejection_rate": "Rejection rate",
+    "avg_loan_amount": "Average loan amount", "avg_income": "Average household income", "count": "Applicants",
+}
+
+
+def _dimension_value(value) -> str:
+    """
+    Normalizes a cell to its cube key: "" for blanks, "1" for 1.0, str otherwise.
+    """
+    if value is None or value == "" or (isinstance(value, float) and value != value):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _csv_signature(csv_path: str) -> List[int]:
+    stat = os.stat(csv_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def build_stats_cube(csv_path: str = DATA_CSV, dimensions: List[str] = CUBE_DIMENSIONS,
+                     max_dims: int = CUBE_MAX_DIMS) -> Dict:
+    """
+    Aggregates the loan CSV over every combination of up to max_dims dimensions.
+    Returns {"signature", "dimensions", "groups": {"dim1|dim2": {"v1|v2": {measure: value}}}}.
+    """
+    # pandas is only needed to (re)build the cube, not to answer from the cached one
+    import pandas as pd
+    from src.preprocess import income_buckets, load_and_clean_csv
+
+    df = load_and_clean_csv(csv_path)
+    base = pd.DataFrame(index=df.index)
+    for dim in dimensions:
+        if dim == "income_bucket":
+            base[dim] = [bucket or "" for bucket in income_buckets(df)]
+        elif dim in df.columns:
+            base[dim] = df[dim].map(_dimension_value)
+    dimensions = [dim for dim in dimensions if dim in base.columns]
+
+    loan_amount = pd.to_numeric(df["loanamount"], errors="coerce") if "loanamount" in df.columns else pd.Series(float("nan"), index=df.index)
+    income = pd.Series(0.0, index=df.index)
+    for col in ("applicantincome", "coapplicantincome"):
+        if col in df.columns:
+            income = income + pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+    base["count"] = 1
+    base["approved"] = (df["loan_status"].astype(str).str.upper() == "Y").astype(int) if "loan_status" in df.columns else 0
+    base["loan_amount_sum"] = loan_amount.fillna(0.0)
+    base["loan_amount_n"] = loan_amount.notna().astype(int)
+    base["income_sum"] = income
+    base["income_n"] = 1
+
+    groups = {"": {"": {m: float(base[m].sum()) for m in MEASURES}}}
+    for size in range(1, max_dims + 1):
+        for dims in combinations(dimensions, size):
+            summed = base.groupby(list(dims), sort=True)[MEASURES].sum()
+            cells = {}
+            for key, row in zip(summed.index, summed.itertuples(index=False)):
+                key = key if isinstance(key, tuple) else (key,)
+                cells["|".join(key)] = {m: float(v) for m, v in zip(MEASURES, row)}
+            groups["|".join(dims)] = cells
+    return {"signature": _csv_signature(csv_path), "dimensions": dimensions, "groups": groups}
+
+
+def save_stats_cube(cube: Dict, cache_path: str = STATS_CACHE_PATH) -> None:
+    """
+    Writes the cube as JSON (temp file + rename).
+    """
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cube, f)
+    os.replace(tmp_path, cache_path)
+
+
+def load_stats_cube(csv_path: str = DATA_CSV, cache_path: str = STATS_CACHE_PATH) -> Dict:
+    """
+    Loads the cached cube, rebuilding it when missing or older than the CSV.
+    """
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cube = json.load(f)
+        if cube.get("signature") == _csv_signature(csv_path):
+            return cube
+    cube = build_stats_cube(csv_path)
+    save_stats_cube(cube, cache_path)
+    return cube
+
+
+_cube = None
+_cube_lock = threading.Lock()
+
+
+def get_stats_cube() -> Dict:
+    """
+    Returns the process-wide stats cube (singleton), loading it on first use.
+    """
+    global _cube
+    with _cube_lock:
+        if _cube is None or _cube.get("signature") != _csv_signature(DATA_CSV):
+            _cube = load_stats_cube()
+        return _cube
+
+
+class StatsAnswer:
+    """
+    Result of routing a question to the stats cube.
+    - answer: markdown answer that can be shown without the LLM
+    - facts: the exact numbers as plain lines, for injection into the LLM context
+    - direct: True when the answer can be returned as-is
+    """
+
+    def __init__(self, answer: str, facts: List[str], direct: bool):
+        self.answer = answer
+        self.facts = facts
+        self.direct = direct
+
+
+def parse_stats_query(question: str) -> Optional[Tuple[str, Dict[str, str], Optional[str], List[str]]]:
+    """
+    Extracts (metric, filters, group_by, unparsed) from an aggregate question,
+    or None. "X vs Y" values of one dimension become a group-by; unparsed lists
+    the qualifiers that map to no cube dimension.
+    """
+    text = question.lower()
+    metric = next((name for name, pattern in METRIC_PATTERNS if pattern.search(text)), None)
+    if metric is None:
+        return None
+    match = dict(METRIC_PATTERNS)[metric].search(text)
+    text = text[:match.start()] + " " + text[match.end():]
+    group_by = None
+    for pattern, dim in GROUP_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            group_by = dim
+            text = text[:match.start()] + " " + text[match.end():]
+            break
+    values: Dict[str, List[str]] = {}
+    unparsed = []
+    for pattern, dim, value in VALUE_PATTERNS:
+        match = pattern.search(text)
+        while match:
+            start = match.start()
+            negation = NEGATION_PATTERN.search(text[:start])
+            if negation:
+                start = negation.start()
+                if dim in COMPLEMENTS:
+                    value_pair = COMPLEMENTS[dim]
+                    value = value_pair[1 - value_pair.index(value)]
+                else:
+                    # "not rural" is two areas at once, which no cube cell holds
+                    unparsed.append("not " + match.group(0))
+            if not negation or dim in COMPLEMENTS:
+                if value not in values.setdefault(dim, []):
+                    values[dim].append(value)
+            # Consume the phrase so "non-graduate" does not also match "graduate"
+            text = text[:start] + " " + text[match.end():]
+            match = pattern.search(text)
+    compared = [dim for dim, dim_values in values.items() if len(dim_values) > 1]
+    if group_by is None and len(compared) == 1:
+        group_by = compared[0]
+    filters = {}
+    for dim, dim_values in values.items():
+        if dim == group_by:
+            continue
+        if len(dim_values) > 1:
+            # Several values of a dimension that is not the group-by: no single filter is right
+            unparsed.append(" vs ".join(dim_values))
+            continue
+        filters[dim] = dim_values[0]
+    unparsed += [word for word in re.findall(r"[a-z0-9+]+", text) if word not in GENERIC_WORDS]
+    return metric, filters, group_by, unparsed
+
+
+def _metric_value(metric: str, cell: Dict) -> Optional[float]:
+    if metric == "count":
+        return cell["count"]
+    if metric in ("approval_rate", "rejection_rate"):
+        if not cell["count"]:
+            return None
+        rate = cell["approved"] / cell["count"]
+        return rate if metric == "approval_rate" else 1.0 - rate
+    if metric == "avg_loan_amount":
+        return cell["loan_amount_sum"] / cell["loan_amount_n"] if cell["loan_amount_n"] else None
+    if metric == "avg_income":
+        return cell["income_sum"] / cell["income_n"] if cell["income_n"] else None
+    return None
+
+
+def _format_metric(metric: str, value: Optional[float]) -> str:
+    if value is None:
+        return "n/a"
+    if metric in ("approval_rate", "rejection_rate"):
+        return f"{value:.1%}"
+    if metric == "avg_loan_amount":
+        # LoanAmount is recorded in thousands
+        return f"{value:,.1f}k"
+    if metric == "avg_income":
+        return f"{value:,.0f}"
+    return f"{int(value):,}"
+
+
+def answer_stats_query(question: str, cube: Optional[Dict] = None) -> Optional[StatsAnswer]:
+    """
+    Answers an aggregate question from the precomputed cube, or returns None
+    when the question is not an aggregate the cube can answer exactly: every
+    qualifier in it must map to a cube dimension. Questions asking why or how
+    get the numbers as context (direct=False) instead of a canned answer.
+    """
+    parsed = parse_stats_query(question)
+    if parsed is None:
+        return None
+    metric, filters, group_by, unparsed = parsed
+    if unparsed:
+        return None
+    cube = cube or get_stats_cube()
+    dims = sorted(set(filters) | ({group_by} if group_by else set()), key=cube["dimensions"].index)
+    cells = cube["groups"].get("|".join(dims))
+    if cells is None:
+        return None
+
+    scope = ", ".join(f"{DIMENSION_LABELS[d]} = {v}" for d, v in filters.items()) or "all applicants"
+    title = METRIC_LABELS[metric] + (f" by {DIMENSION_LABELS[group_by].lower()}" if group_by else "")
+    facts, bullets = [], []
+    for key, cell in sorted(cells.items()):
+        values = dict(zip(dims, key.split("|"))) if dims else {}
+        if any(values.get(d) != v for d, v in filters.items()):
+            continue
+        formatted = _format_metric(metric, _metric_value(metric, cell))
+        label = f"{DIMENSION_LABELS[group_by]} = {values[group_by] or 'unknown'}" if group_by else scope
+        fact = f"Loan dataset: {METRIC_LABELS[metric]} for {scope}" + (f", {label}" if group_by else "") + f": {formatted}"
+        if metric == "count":
+            bullets.append(f"• **{label}**: {formatted}")
+            facts.append(fact)
+        else:
+            bullets.append(f"• **{label}**: {formatted} (n={int(cell['count']):,})")
+            facts.append(fact + f" across {int(cell['count']):,} applicants")
+    if not facts:
+        facts.append(f"Loan dataset: {METRIC_LABELS[metric]} for {scope}: no matching applicants in the loan dataset")
+        bullets.append(f"• No applicants in the loan dataset match **{scope}**.")
+
+    answer = f"## {title}\n" + (f"_Filtered to {scope}._\n\n" if filters and group_by else "\n") + "\n".join(bullets)
+    answer += "\n\n_Computed exactly from the loan dataset._"
+    return StatsAnswer(answer=answer, facts=facts, direct=not EXPLAIN_PATTERN.search(question.lower()))
+
+if __name__ == "__main__":
+    save_stats_cube(build_stats_cube())
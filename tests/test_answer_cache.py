@@ -0,0 +1,131 @@
+"""
+SemanticAnswerCache: similarity threshold, TTL/LRU eviction, invalidation on
+index rebuilds, and the shared SQLite store with its pruning.
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from src.answer_cache import SemanticAnswerCache
+
+
+def unit(*values) -> np.ndarray:
+    vector = np.array(values, dtype="float32")
+    return vector / np.linalg.norm(vector)
+
+
+def rotated(vector: np.ndarray, cosine: float) -> np.ndarray:
+    # A unit vector at the given cosine similarity to vector (vector lies in the first two axes)
+    other = np.array([-vector[1], vector[0], 0.0], dtype="float32")
+    return cosine * vector + np.sqrt(1 - cosine ** 2) * other
+
+
+@pytest.fixture
+def base() -> np.ndarray:
+    return unit(1.0, 0.0, 0.0)
+
+
+def test_threshold_hit_and_miss(base):
+    cache = SemanticAnswerCache(threshold=0.95, store_path=None)
+    cache.put("What is CIBIL?", base, "English", "v1", "A credit score.", ["ctx"], cost_seconds=2.0)
+    hit = cache.lookup(rotated(base, 0.97), "English", "v1")
+    assert hit is not None and hit.answer == "A credit score." and hit.context == ["ctx"]
+    assert cache.lookup(rotated(base, 0.90), "English", "v1") is None
+    # Language and index version are part of the key
+    assert cache.lookup(base, "Hindi", "v1") is None
+    assert cache.lookup(base, "English", "v2") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["seconds_saved"]) == (1, 3, 2.0)
+
+
+def test_best_match_wins(base):
+    cache = SemanticAnswerCache(threshold=0.9, store_path=None)
+    cache.put("far", rotated(base, 0.91), "English", "v1", "far answer")
+    cache.put("near", rotated(base, 0.99), "English", "v1", "near answer")
+    assert cache.lookup(base, "English", "v1").answer == "near answer"
+
+
+def test_ttl_expires_entries(base):
+    cache = SemanticAnswerCache(ttl=0.05, store_path=None)
+    cache.put("q", base, "English", "v1", "a")
+    assert cache.lookup(base, "English", "v1") is not None
+    time.sleep(0.1)
+    assert cache.lookup(base, "English", "v1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_evicts_least_recently_used():
+    cache = SemanticAnswerCache(max_entries=2, store_path=None)
+    vectors = [unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1)]
+    cache.put("a", vectors[0], "English", "v1", "A")
+    cache.put("b", vectors[1], "English", "v1", "B")
+    assert cache.lookup(vectors[0], "English", "v1").answer == "A"
+    cache.put("c", vectors[2], "English", "v1", "C")
+    assert cache.lookup(vectors[1], "English", "v1") is None
+    assert cache.lookup(vectors[0], "English", "v1").answer == "A"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_keeps_only_the_current_index_version(base, tmp_path):
+    cache = SemanticAnswerCache(store_path=str(tmp_path / "answers.sqlite"))
+    cache.put("old", base, "English", "v1", "old answer")
+    cache.put("new", unit(0, 1, 0), "English", "v2", "new answer")
+    cache.invalidate(keep_index_version="v2")
+    assert cache.lookup(base, "English", "v1") is None
+    assert cache.lookup(unit(0, 1, 0), "English", "v2").answer == "new answer"
+    rows = sqlite3.connect(tmp_path / "answers.sqlite").execute("SELECT index_version FROM answers").fetchall()
+    assert rows == [("v2",)]
+
+
+def test_sqlite_store_is_shared_across_instances(base, tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    SemanticAnswerCache(store_path=path).put("q", base, "English", "v1", "shared", ["c1", "c2"], cost_seconds=1.5)
+    other = SemanticAnswerCache(store_path=path)
+    hit = other.lookup(rotated(base, 0.98), "English", "v1")
+    assert (hit.answer, hit.context, hit.cost_seconds) == ("shared", ["c1", "c2"], 1.5)
+    assert other.stats()["disk_hits"] == 1
+    # Promoted into memory: the next lookup does not read the file
+    os.remove(path)
+    assert other.lookup(base, "English", "v1").answer == "shared"
+
+
+def test_sqlite_store_is_pruned_on_insert(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    cache = SemanticAnswerCache(store_path=path, disk_max_entries=5)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((12, 16))
+    for i, vector in enumerate(vectors):
+        cache.put(f"q{i}", vector, "English", "v1", f"a{i}")
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 5
+    # The newest rows survive
+    assert {row[0] for row in conn.execute("SELECT question FROM answers")} == {f"q{i}" for i in range(7, 12)}
+    assert cache.stats()["disk_evictions"] == 7
+
+
+def test_disk_lookup_scans_only_recent_rows(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    writer = SemanticAnswerCache(store_path=path)
+    oldest = unit(1, 0, 0)
+    writer.put("oldest", oldest, "English", "v1", "old")
+    for i in range(3):
+        writer.put(f"q{i}", unit(0, 1, i + 1), "English", "v1", f"a{i}")
+    assert SemanticAnswerCache(store_path=path, disk_scan=3).lookup(oldest, "English", "v1") is None
+    assert SemanticAnswerCache(store_path=path, disk_scan=4).lookup(oldest, "English", "v1").answer == "old"
+
+
+def test_expired_rows_are_ignored_and_pruned(base, tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    SemanticAnswerCache(store_path=path, ttl=0.05).put("q", base, "English", "v1", "a")
+    time.sleep(0.1)
+    cache = SemanticAnswerCache(store_path=path, ttl=0.05)
+    assert cache.lookup(base, "English", "v1") is None
+    cache.put("fresh", unit(0, 1, 0), "English", "v1", "b")
+    assert sqlite3.connect(path).execute("SELECT question FROM answers").fetchall() == [("fresh",)]
@@ -0,0 +1,92 @@
+"""
+Request micro-batching: concurrent callers get their own results, items are
+grouped into batches, and failures reach every caller of the batch.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from src.batcher import MicroBatcher
+
+
+class RowProcessor:
+    """
+    Returns one row per item (the item's row of a matrix, computed as one
+    batch); each call waits for release, if given, and records its batch.
+    """
+
+    def __init__(self, release: threading.Event = None, error: Exception = None):
+        self.release = release
+        self.error = error
+        self.batches = []
+        self.started = threading.Event()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.started.set()
+        if self.release is not None:
+            self.release.wait(2.0)
+        if self.error is not None:
+            raise self.error
+        matrix = np.asarray(items, dtype=np.float32)[:, None] * np.arange(1, 4, dtype=np.float32)
+        return list(matrix)
+
+
+def test_concurrent_callers_get_their_own_rows():
+    processor = RowProcessor()
+    batcher = MicroBatcher(processor, max_batch_size=8, max_wait_ms=5)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(batcher, range(200)))
+    for item, row in enumerate(results):
+        np.testing.assert_array_equal(row, [item, 2 * item, 3 * item])
+    assert sorted(item for batch in processor.batches for item in batch) == list(range(200))
+    assert max(len(batch) for batch in processor.batches) <= 8
+    stats = batcher.stats()
+    assert (stats["items"], stats["batches"], stats["errors"]) == (200, len(processor.batches), 0)
+    assert sum(size * count for size, count in stats["batch_sizes"].items()) == 200
+
+
+def test_items_queued_during_a_batch_join_the_next_one():
+    release = threading.Event()
+    processor = RowProcessor(release=release)
+    batcher = MicroBatcher(processor, max_batch_size=32, max_wait_ms=0)
+    first = batcher.submit(0)
+    assert processor.started.wait(2.0)
+    waiting = [batcher.submit(item) for item in range(1, 6)]
+    release.set()
+    np.testing.assert_array_equal(first.result(timeout=2.0), [0, 0, 0])
+    assert [future.result(timeout=2.0)[0] for future in waiting] == [1, 2, 3, 4, 5]
+    assert processor.batches == [[0], [1, 2, 3, 4, 5]]
+
+
+def test_exceptions_reach_every_caller_of_the_batch():
+    release = threading.Event()
+    processor = RowProcessor(release=release, error=RuntimeError("model unavailable"))
+    batcher = MicroBatcher(processor, max_batch_size=32, max_wait_ms=0)
+    first = batcher.submit(0)
+    assert processor.started.wait(2.0)
+    futures = [batcher.submit(item) for item in range(1, 4)]
+    release.set()
+    for future in [first] + futures:
+        with pytest.raises(RuntimeError, match="model unavailable"):
+            future.result(timeout=2.0)
+    assert batcher.stats()["errors"] == 2
+
+    # The worker survives: later items are processed normally
+    processor.error = None
+    np.testing.assert_array_equal(batcher(7), [7, 14, 21])
+
+
+def test_short_results_fail_instead_of_hanging():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(item) for item in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError, match=r"results for \d items"):
+            future.result(timeout=2.0)
@@ -0,0 +1,106 @@
+"""
+Per-session chat memory: turns pushed out of the window (by turn count or by
+tokens) are summarized, clear() discards everything, stats track both.
+"""
+
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.chat_memory import SessionMemory, _get_executor, extractive_summary, memory_stats
+
+
+class RecordingSummarizer:
+    """
+    Summarizes by appending the questions; records each call's turns.
+    """
+
+    def __init__(self, error: Exception = None):
+        self.calls = []
+        self.error = error
+
+    def __call__(self, summary, turns):
+        self.calls.append(list(turns))
+        if self.error is not None:
+            raise self.error
+        return " | ".join(filter(None, [summary] + [q for q, _ in turns]))
+
+
+def fill(memory, turns, start=0):
+    for i in range(start, start + turns):
+        memory.add_turn(f"question {i}?", f"Answer {i}. More detail follows.")
+
+
+def test_turns_beyond_max_turns_are_summarized():
+    summarizer = RecordingSummarizer()
+    memory = SessionMemory(max_turns=3, max_tokens=10_000, summarizer=summarizer, background=False)
+    fill(memory, 3)
+    assert summarizer.calls == []
+    assert memory.summary == ""
+
+    fill(memory, 2, start=3)
+    # The window now holds the last three turns; the oldest two were summarized one at a time
+    assert [q for q, _ in memory.history()] == ["question 2?", "question 3?", "question 4?"]
+    assert summarizer.calls == [[("question 0?", "Answer 0. More detail follows.")],
+                                [("question 1?", "Answer 1. More detail follows.")]]
+    assert memory.summary == "question 0? | question 1?"
+    stats = memory.stats()
+    assert (stats["turns"], stats["pending_turns"], stats["summarized_turns"]) == (3, 0, 2)
+
+
+def test_turns_beyond_max_tokens_are_summarized_but_the_newest_is_kept():
+    summarizer = RecordingSummarizer()
+    memory = SessionMemory(max_turns=100, max_tokens=40, summarizer=summarizer, background=False)
+    fill(memory, 10)
+    stats = memory.stats()
+    assert stats["tokens"] <= 40
+    assert stats["turns"] + stats["summarized_turns"] == 10
+    assert summarizer.calls
+    memory.add_turn("a long question " * 30, "a long answer " * 30)
+    assert [q for q, _ in memory.history()] == ["a long question " * 30]
+
+
+def test_failed_summaries_stay_pending():
+    memory = SessionMemory(max_turns=1, summarizer=RecordingSummarizer(RuntimeError("boom")), background=False)
+    fill(memory, 3)
+    stats = memory.stats()
+    assert (stats["turns"], stats["pending_turns"], stats["summarized_turns"]) == (1, 2, 0)
+    assert memory.summary == ""
+
+
+def test_background_summary_is_discarded_after_clear():
+    release = threading.Event()
+
+    def slow_summarizer(summary, turns):
+        release.wait(2.0)
+        return "stale summary"
+
+    memory = SessionMemory(max_turns=1, summarizer=slow_summarizer)
+    fill(memory, 2)
+    memory.clear()
+    release.set()
+    # The summary thread is single-worker: this returns once the stale summary was handled
+    _get_executor().submit(lambda: None).result(timeout=2.0)
+    memory.add_turn("after clear?", "Fresh answer.")
+    assert memory.history() == [("after clear?", "Fresh answer.")]
+    stats = memory.stats()
+    assert (stats["pending_turns"], stats["summarized_turns"], stats["summary_tokens"]) == (0, 0, 0)
+    assert memory.summary == ""
+
+
+def test_stats_and_process_totals():
+    memory = SessionMemory(max_turns=2, background=False)
+    fill(memory, 2)
+    stats = memory.stats()
+    assert stats["turns"] == 2
+    assert stats["stored_bytes"] == sum(len(q) + len(a) for q, a in memory.history())
+    totals = memory_stats()
+    assert totals["sessions"] >= 1
+    assert totals["turns"] >= 2
+
+
+def test_extractive_summary_keeps_questions_and_first_sentences():
+    summary = extractive_summary("", [("What is EMI?", "## EMI\n**EMI** is a monthly payment. It covers interest.")])
+    assert summary == "User asked: What is EMI? — Bot: EMI is a monthly payment."
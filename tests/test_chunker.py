@@ -0,0 +1,86 @@
+"""
+Token-aware chunking: sentence and heading boundaries, the token budget and
+overlap between consecutive chunks, measured with the local estimator.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.chunker import chunk_document, chunk_stats, estimate_tokens
+
+GUIDE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docs", "comprehensive_loan_guide.txt")
+
+SECTION = ("1. LOAN BASICS\n"
+           "A loan is money you borrow from a lender. You repay it with interest over an agreed term. "
+           "Most lenders check your credit score first. A score above 750 usually gets the best rates. "
+           "Lenders also look at your income and existing debts.\n"
+           "2. HOME LOANS\n"
+           "Home loans are secured by the property. Terms can run up to thirty years.")
+
+
+def chunks_of(text: str, max_tokens: int, overlap_tokens: int = 0):
+    return chunk_document(text, max_tokens=max_tokens, overlap_tokens=overlap_tokens, counter=estimate_tokens)
+
+
+def body(chunk: str):
+    return chunk.split("\n")[1:]
+
+
+def test_chunks_end_at_sentence_boundaries_within_the_budget():
+    chunks = chunks_of(SECTION, max_tokens=30)
+    assert len(chunks) > 2
+    for chunk in chunks:
+        assert estimate_tokens(chunk) <= 30
+        for line in body(chunk):
+            assert line.endswith(".")
+    # Every sentence survives whole, exactly once without overlap
+    sentences = [line for chunk in chunks for line in body(chunk)]
+    assert " ".join(sentences) == " ".join(SECTION.replace("1. LOAN BASICS\n", "").replace("2. HOME LOANS\n", "").split())
+
+
+def test_headings_start_chunks_and_prefix_them():
+    chunks = chunks_of(SECTION, max_tokens=30)
+    assert [chunk.split("\n")[0] for chunk in chunks] == ["1. LOAN BASICS"] * (len(chunks) - 1) + ["2. HOME LOANS"]
+    assert body(chunks[-1]) == ["Home loans are secured by the property.", "Terms can run up to thirty years."]
+
+
+@pytest.mark.parametrize("overlap", [8, 20])
+def test_overlap_repeats_trailing_sentences_of_the_same_section(overlap):
+    chunks = chunks_of(SECTION, max_tokens=30, overlap_tokens=overlap)
+    plain = chunks_of(SECTION, max_tokens=30)
+    overlapping = 0
+    for previous, current in zip(chunks, chunks[1:]):
+        if current.split("\n")[0] != previous.split("\n")[0]:
+            # Overlap never crosses a heading
+            assert not set(body(current)) & set(body(previous))
+            continue
+        carried = [line for line in body(current) if line in body(previous)]
+        if carried:
+            assert carried == body(previous)[-len(carried):]
+            assert sum(estimate_tokens(line) for line in carried) <= overlap
+            overlapping += 1
+        else:
+            # The last sentence alone is longer than the overlap
+            assert estimate_tokens(body(previous)[-1]) > overlap
+    # Every sentence of SECTION fits in 20 tokens
+    assert overlapping > 0 if overlap >= 20 else overlapping == 0
+    assert len(chunks) >= len(plain)
+
+
+def test_overlong_sentences_are_split_on_words():
+    sentence = " ".join(f"word{i}" for i in range(50)) + "."
+    chunks = chunks_of(sentence, max_tokens=10)
+    assert all(estimate_tokens(chunk) <= 10 for chunk in chunks)
+    assert " ".join(chunks).split() == sentence.split()
+
+
+def test_guide_chunks_fit_the_budget():
+    with open(GUIDE, encoding="utf-8") as f:
+        chunks = chunks_of(f.read(), max_tokens=120, overlap_tokens=20)
+    stats = chunk_stats(chunks, counter=estimate_tokens)
+    assert stats["chunks"] == len(chunks) > 5
+    assert stats["max"] <= 120
@@ -0,0 +1,61 @@
+"""
+MinHash deduplication: exact and near-duplicates, dedup groups and the
+bound on remembered chunks.
+"""
+
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.dedup import MinHashIndex, dedup_documents, minhash, similarity
+
+BASE = ("Home loan interest rates in India range from 8.35 to 9.5 percent per annum for salaried borrowers "
+        "with a credit score above 750, and lenders charge a processing fee of up to one percent of the loan amount.")
+NEAR = BASE.replace("up to one percent", "up to 1 percent")
+OTHER = "Personal loans are unsecured, so lenders look closely at income stability, existing EMIs and the credit report."
+
+
+def kept(documents, **kwargs):
+    return [text for text, _ in dedup_documents(documents, **kwargs)]
+
+
+def test_similarity_estimates_jaccard():
+    assert similarity(minhash(BASE), minhash(BASE)) == 1.0
+    assert similarity(minhash(BASE), minhash(NEAR)) >= 0.8
+    assert similarity(minhash(BASE), minhash(OTHER)) < 0.2
+
+
+def test_exact_and_near_duplicates_are_dropped():
+    stats = {}
+    documents = [(BASE, {}), (OTHER, {}), (BASE, {}), (NEAR, {})]
+    assert kept(documents, stats=stats) == [BASE, OTHER]
+    assert stats == {"kept": 2, "dropped": 2}
+
+
+def test_near_duplicates_below_the_threshold_are_kept():
+    assert kept([(BASE, {}), (NEAR, {})], threshold=1.0) == [BASE, NEAR]
+
+
+def test_only_documents_of_the_same_group_are_compared():
+    documents = [(BASE, {"area": "Urban"}), (BASE, {"area": "Rural"}), (NEAR, {"area": "Rural"})]
+    assert kept(documents, key=lambda metadata: metadata["area"]) == [BASE, BASE]
+
+
+def test_index_grows_past_its_initial_capacity():
+    index = MinHashIndex()
+    signatures = [minhash(f"loan {i} for applicant {i * 7} in branch {i % 13}") for i in range(1500)]
+    for signature in signatures:
+        assert index.find(signature) is None
+        assert index.add(signature)
+    assert len(index) == 1500
+    assert all(index.find(signature) is not None for signature in signatures[::100])
+
+
+def test_remembered_chunks_are_capped(caplog):
+    documents = [(f"{OTHER} Variant {i} with extra words number {i}.", {}) for i in range(3)]
+    with caplog.at_level(logging.WARNING, logger="src.dedup"):
+        # The third chunk is kept but not remembered, so its copy is not detected
+        assert kept(documents + [documents[0], documents[2]], max_entries=2) == [text for text, _ in documents] + [documents[2][0]]
+    assert sum("index full" in record.message for record in caplog.records) == 1
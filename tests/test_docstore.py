@@ -0,0 +1,110 @@
+"""
+Pickle-free persistence: legacy index.pkl migration round trip, the
+SQLite-backed position map of a reloaded index after deletes and the
+spilled exact-vector file of compact indexes.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from src.docstore import (DOCSTORE_FILE, LEGACY_DOCSTORE_FILE, PositionMap, SQLiteDocstore, VectorFileWriter,
+                          load_vectorstore, migrate_legacy_index, save_vectorstore)
+
+TEXTS = [f"chunk {i} about loan topic {i % 4}" for i in range(12)]
+
+
+@pytest.fixture
+def embedding():
+    return DeterministicFakeEmbedding(size=16)
+
+
+def build(embedding) -> FAISS:
+    return FAISS.from_texts(TEXTS, embedding, metadatas=[{"n": i, "source": "docs"} for i in range(len(TEXTS))])
+
+
+def contents(vectorstore: FAISS):
+    rows = []
+    for position in range(vectorstore.index.ntotal):
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+        rows.append((position, doc.page_content, doc.metadata))
+    return rows
+
+
+def test_legacy_pickle_migration_round_trip(embedding, tmp_path):
+    original = build(embedding)
+    original.save_local(str(tmp_path))
+    with pytest.raises(FileNotFoundError, match="legacy pickle"):
+        load_vectorstore(str(tmp_path), embedding)
+
+    assert migrate_legacy_index(str(tmp_path)) == len(TEXTS)
+    assert not os.path.exists(tmp_path / LEGACY_DOCSTORE_FILE)
+    assert os.path.exists(tmp_path / DOCSTORE_FILE)
+
+    for mmap in (True, False):
+        migrated = load_vectorstore(str(tmp_path), embedding, mmap=mmap)
+        assert contents(migrated) == contents(original)
+        assert ([doc.page_content for doc in migrated.similarity_search(TEXTS[5], k=3)]
+                == [doc.page_content for doc in original.similarity_search(TEXTS[5], k=3)])
+        if mmap:
+            migrated.docstore.close()
+
+
+def test_position_map_after_deletes(embedding, tmp_path):
+    save_vectorstore(build(embedding), str(tmp_path))
+    updatable = load_vectorstore(str(tmp_path), embedding, mmap=False)
+    removed = [updatable.index_to_docstore_id[position] for position in (0, 4, 11)]
+    updatable.delete(removed)
+    kept = [updatable.index_to_docstore_id[position] for position in range(updatable.index.ntotal)]
+    save_vectorstore(updatable, str(tmp_path))
+
+    docstore = SQLiteDocstore(str(tmp_path / DOCSTORE_FILE))
+    positions = PositionMap(docstore)
+    assert len(positions) == len(TEXTS) - 3
+    assert list(positions) == list(range(len(TEXTS) - 3))
+    assert [positions[position] for position in positions] == kept
+    with pytest.raises(KeyError):
+        positions[len(TEXTS) - 3]
+    assert all(doc_id not in positions.values() for doc_id in removed)
+    docstore.close()
+
+    served = load_vectorstore(str(tmp_path), embedding)
+    assert [meta["n"] for _, _, meta in contents(served)] == [i for i in range(len(TEXTS)) if i not in (0, 4, 11)]
+    found = served.similarity_search(TEXTS[4], k=len(TEXTS))
+    assert TEXTS[4] not in [doc.page_content for doc in found]
+    assert len(found) == len(TEXTS) - 3
+    served.docstore.close()
+
+
+def test_vector_file_round_trip(tmp_path):
+    path = str(tmp_path / "vectors.npy")
+    batches = [np.random.default_rng(i).normal(size=(rows, 8)) for i, rows in enumerate([5, 1, 17])]
+    writer = VectorFileWriter(path)
+    for batch in batches:
+        writer.append(batch)
+    vectors = writer.finish()
+    assert vectors.dtype == np.float32 and vectors.shape == (23, 8)
+    assert not vectors.flags.writeable
+    np.testing.assert_array_equal(vectors, np.concatenate(batches).astype("float32"))
+    # A standard .npy file: the reserved header holds the real shape
+    assert os.path.getsize(path) == VectorFileWriter.HEADER_BYTES + 23 * 8 * 4
+    np.testing.assert_array_equal(np.load(path), vectors)
+
+
+def test_vector_file_rejects_other_dimensions(tmp_path):
+    writer = VectorFileWriter(str(tmp_path / "vectors.npy"))
+    writer.append(np.zeros((2, 8)))
+    with pytest.raises(ValueError, match="Expected 8-d vectors"):
+        writer.append(np.zeros((2, 4)))
+    assert writer.finish().shape == (2, 8)
+
+
+def test_empty_vector_file(tmp_path):
+    vectors = VectorFileWriter(str(tmp_path / "vectors.npy")).finish()
+    assert vectors.shape == (0, 0)
@@ -0,0 +1,84 @@
+"""
+Incremental index builds against full rebuilds, with a deterministic fake
+embedding model standing in for MiniLM.
+"""
+
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+import src.embedder as E
+from src.docstore import load_vectorstore
+
+QUERIES = ["loan topic 1", "chunk 7 about income", "credit history", "new chunk 2"]
+
+
+@pytest.fixture(autouse=True)
+def fake_embedding(monkeypatch):
+    embedding = DeterministicFakeEmbedding(size=32)
+    monkeypatch.setattr(E, "get_embedding_model", lambda *args, **kwargs: embedding)
+    return embedding
+
+
+def documents(indices, prefix: str = "chunk"):
+    return [(f"{prefix} {i} about loan topic {i % 3}", {"source": "docs", "n": i}) for i in indices]
+
+
+def searches(index_path, embedding):
+    vectorstore = load_vectorstore(str(index_path), embedding)
+    try:
+        return [[(doc.page_content, round(score, 4)) for doc, score in vectorstore.similarity_search_with_score(query, k=5)]
+                for query in QUERIES]
+    finally:
+        vectorstore.docstore.close()
+
+
+def chunk_counts(index_path):
+    return {h: len(ids) for h, ids in E.load_manifest(str(index_path))["chunks"].items()}
+
+
+@pytest.mark.parametrize("storage", ["float32", "float16"])
+def test_incremental_build_matches_full_rebuild(storage, tmp_path, fake_embedding):
+    incremental, full = tmp_path / "incremental", tmp_path / "full"
+    first = documents(range(20))
+    assert E.build_incremental_faiss_index(first, str(incremental), index_type="flat", storage=storage) == {
+        "added": 20, "removed": 0, "unchanged": 0, "full_rebuild": 1}
+
+    # Drop 0-4, keep 5-19, add five new chunks and a duplicate of chunk 6
+    second = documents(range(5, 20)) + documents(range(5), prefix="new chunk") + documents([6])
+    stats = E.build_incremental_faiss_index(second, str(incremental), index_type="flat", storage=storage)
+    assert stats == {"added": 6, "removed": 5, "unchanged": 15, "full_rebuild": 0}
+
+    E.build_and_save_faiss_index(second, str(full), index_type="flat", storage=storage)
+    assert chunk_counts(incremental) == chunk_counts(full)
+    assert searches(incremental, fake_embedding) == searches(full, fake_embedding)
+
+    # Nothing changed: nothing is embedded or rewritten
+    assert E.build_incremental_faiss_index(second, str(incremental), index_type="flat", storage=storage) == {
+        "added": 0, "removed": 0, "unchanged": 21, "full_rebuild": 0}
+
+
+def test_changed_embedding_id_forces_full_rebuild(tmp_path):
+    E.build_incremental_faiss_index(documents(range(10)), str(tmp_path), index_type="flat", storage="float32")
+    manifest_path = tmp_path / E.MANIFEST_FILE
+    manifest = json.loads(manifest_path.read_text())
+    assert manifest["model"] == E.EMBED_MODEL
+    manifest["model"] = E.EMBED_MODEL + "+onnx_int8"
+    manifest_path.write_text(json.dumps(manifest))
+
+    stats = E.build_incremental_faiss_index(documents(range(10)), str(tmp_path), index_type="flat", storage="float32")
+    assert stats == {"added": 10, "removed": 0, "unchanged": 0, "full_rebuild": 1}
+    assert E.load_manifest(str(tmp_path))["model"] == E.EMBED_MODEL
+
+
+def test_fallback_backend_keeps_incremental_updates(monkeypatch, tmp_path):
+    # Built while the configured backend fell back to the reference one, and it still does
+    E.build_incremental_faiss_index(documents(range(10)), str(tmp_path), index_type="flat", storage="float32")
+    monkeypatch.setattr(E, "EMBED_BACKEND", "onnx")
+    stats = E.build_incremental_faiss_index(documents(range(11)), str(tmp_path), index_type="flat", storage="float32")
+    assert stats == {"added": 1, "removed": 0, "unchanged": 10, "full_rebuild": 0}
@@ -0,0 +1,120 @@
+"""
+Circuit breaker of GeminiClient and answer streaming, against FakeGenerativeModel.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.generator import (FALLBACK_ANSWER, CircuitOpenError, FakeGenerativeModel, GeminiClient, generate_answer,
+                           generate_answer_stream, generate_answer_stream_async)
+
+CONTEXT = ["Credit history is the strongest predictor of loan approval."]
+
+
+def make_client(model: FakeGenerativeModel, interval: float = 0.0, backoff: float = 0.05) -> GeminiClient:
+    return GeminiClient(lambda: model, health_check=lambda m: m.count_tokens("ping"),
+                        health_check_interval=interval, base_backoff=backoff, max_backoff=1.0)
+
+
+def wait_for(predicate, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_breaker_opens_half_opens_and_closes():
+    model = FakeGenerativeModel(reply="Approved.", fail_times=2)
+    client = make_client(model)
+    llm = client.get()
+    assert client.state == "closed"
+
+    assert generate_answer(llm, "Why?", CONTEXT, client=client) == FALLBACK_ANSWER
+    assert client.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.get()
+    assert client.stats()["rejected_calls"] == 1
+
+    # After the backoff the next call is a trial; failing it reopens with a longer backoff
+    assert wait_for(lambda: client.state == "half-open")
+    assert generate_answer(client.get(), "Why?", CONTEXT, client=client) == FALLBACK_ANSWER
+    assert client.state == "open"
+    assert client.stats()["consecutive_failures"] == 2
+
+    assert wait_for(lambda: client.state == "half-open")
+    assert generate_answer(client.get(), "Why?", CONTEXT, client=client) == "Approved."
+    assert client.state == "closed"
+    assert client.stats()["breaker_trips"] == 2
+
+
+def test_open_breaker_is_probed_after_backoff():
+    model = FakeGenerativeModel(fail_times=1)
+    # The regular interval is far away: only the backoff can schedule the probe
+    client = make_client(model, interval=60.0)
+    try:
+        llm = client.get()
+        generate_answer(llm, "Why?", CONTEXT, client=client)
+        assert client.state == "open"
+        assert wait_for(lambda: client.state == "closed")
+        assert client.stats()["health_checks"] == 1
+    finally:
+        client.close()
+
+
+def test_failed_build_opens_breaker():
+    def factory():
+        raise RuntimeError("no API key")
+
+    client = GeminiClient(factory, health_check_interval=0, base_backoff=10.0)
+    with pytest.raises(ValueError):
+        client.get()
+    with pytest.raises(CircuitOpenError):
+        client.get()
+
+
+def test_stream_yields_chunks_and_timing():
+    model = FakeGenerativeModel(reply="Good credit helps.")
+    client = make_client(model)
+    timing = {}
+    chunks = list(generate_answer_stream(client.get(), "Why?", CONTEXT, timing=timing, client=client))
+    assert "".join(chunks).strip() == "Good credit helps."
+    assert timing["chunks"] == 3
+    assert 0 <= timing["time_to_first_token"] <= timing["total_time"]
+    assert client.state == "closed"
+
+
+def test_stream_falls_back_and_records_failure():
+    model = FakeGenerativeModel(fail_times=1)
+    client = make_client(model)
+    timing = {}
+    assert list(generate_answer_stream(client.get(), "Why?", CONTEXT, timing=timing, client=client)) == [FALLBACK_ANSWER]
+    assert timing["chunks"] == 0
+    assert client.state == "open"
+
+
+def test_async_stream_matches_sync():
+    model = FakeGenerativeModel(reply="Income and credit history both matter.", chunk_latency=0.001)
+
+    async def collect():
+        return [chunk async for chunk in generate_answer_stream_async(model, "Why?", CONTEXT)]
+
+    assert asyncio.run(collect()) == list(generate_answer_stream(model, "Why?", CONTEXT))
+
+
+def test_async_stream_falls_back_and_records_failure():
+    model = FakeGenerativeModel(fail_times=1)
+    client = make_client(model)
+
+    async def collect():
+        return [chunk async for chunk in generate_answer_stream_async(client.get(), "Why?", CONTEXT, client=client)]
+
+    assert asyncio.run(collect()) == [FALLBACK_ANSWER]
+    assert client.state == "open"
@@ -0,0 +1,91 @@
+"""
+Folder ingestion: page-by-page records in input order, with and without the
+extraction pool and cache, and chunking that carries across page breaks.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from src.chunker import chunk_document, estimate_tokens, iter_chunks
+from src.pdf_reader import ExtractionCache, iter_folder_pages
+
+
+def write_pdf(path: str, pages) -> None:
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    doc.save(path)
+    doc.close()
+
+
+@pytest.fixture
+def folder(tmp_path):
+    root = tmp_path / "docs"
+    (root / "sub").mkdir(parents=True)
+    write_pdf(str(root / "a.pdf"), [f"Alpha page {i}." for i in range(1, 6)])
+    (root / "b.txt").write_text("Bravo text.", encoding="utf-8")
+    write_pdf(str(root / "sub" / "c.pdf"), [f"Charlie page {i}." for i in range(1, 4)])
+    return str(root)
+
+
+def records(folder: str, **kwargs):
+    return [(os.path.relpath(path, folder), page_no, text.strip())
+            for path, page_no, text in iter_folder_pages(folder, **kwargs)]
+
+
+EXPECTED = ([("a.pdf", i, f"Alpha page {i}.") for i in range(1, 6)] + [("b.txt", 1, "Bravo text.")]
+            + [(os.path.join("sub", "c.pdf"), i, f"Charlie page {i}.") for i in range(1, 4)])
+
+
+def test_pages_in_input_order_in_process(folder):
+    assert records(folder, workers=0) == EXPECTED
+
+
+def test_pages_in_input_order_on_the_pool(folder):
+    # Two-page tasks split a.pdf over several workers
+    assert records(folder, workers=2, pages_per_task=2) == EXPECTED
+
+
+def test_cache_hits_keep_input_order(folder, tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    timings = []
+    assert records(folder, workers=0, cache=cache, timings=timings) == EXPECTED
+    assert not any(t["cached"] for t in timings)
+    # Only the middle file is a hit; it must not overtake a.pdf on the pool
+    os.utime(os.path.join(folder, "a.pdf"), ns=(1, 1))
+    os.utime(os.path.join(folder, "sub", "c.pdf"), ns=(1, 1))
+    timings = []
+    assert records(folder, workers=2, pages_per_task=2, cache=cache, timings=timings) == EXPECTED
+    assert [(t["path"].endswith("b.txt"), t["cached"], t["pages"]) for t in timings] == [
+        (False, False, 5), (True, True, 1), (False, False, 3)]
+
+
+def test_skip_unchanged(folder, tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    records(folder, workers=0, cache=cache)
+    assert records(folder, workers=0, cache=cache, skip_unchanged=True) == []
+
+
+def test_pages_are_yielded_before_the_file_is_done(folder):
+    pages = iter_folder_pages(folder, workers=0)
+    path, page_no, _ = next(pages)
+    assert (os.path.basename(path), page_no) == ("a.pdf", 1)
+    pages.close()
+
+
+def test_chunks_carry_across_page_breaks():
+    pages = ["LOAN BASICS\nA loan is money you borrow. It is repaid with interest.",
+             "Interest is the cost of the loan. Rates vary by lender.\nELIGIBILITY",
+             "Lenders check income. They also check the credit score. Collateral may be needed."]
+    for max_tokens, overlap in [(12, 0), (12, 5), (200, 30)]:
+        streamed = list(iter_chunks(pages, max_tokens, overlap, counter=estimate_tokens))
+        assert streamed == chunk_document("\n".join(pages), max_tokens, overlap, counter=estimate_tokens)
+    # The section started on page 1 continues on page 2
+    assert any("Interest is the cost" in chunk and chunk.startswith("LOAN BASICS")
+               for chunk in iter_chunks(pages, 12, 5, counter=estimate_tokens))
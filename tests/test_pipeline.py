@@ -0,0 +1,95 @@
+"""
+AnswerPipeline backpressure, concurrency bound and cancellation, against FakeGenerativeModel.
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.generator import FakeGenerativeModel
+from src.pipeline import AnswerPipeline, PipelineBusyError
+
+
+def wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture
+def model() -> FakeGenerativeModel:
+    return FakeGenerativeModel(reply="Approved with good credit.")
+
+
+def test_answers_stream_with_context(model):
+    pipeline = AnswerPipeline(llm_factory=lambda: model, max_concurrency=2, queue_size=4)
+    try:
+        request = pipeline.submit("Why?", retrieve=lambda question: ["chunk"], extra_context=["fact"])
+        assert "".join(request.stream(timeout=5)).strip() == "Approved with good credit."
+        assert request.context == ["fact", "chunk"]
+        assert wait_for(lambda: pipeline.stats()["completed"] == 1)
+    finally:
+        pipeline.close()
+
+
+def test_full_queue_rejects_submissions(model):
+    gate = threading.Event()
+
+    def blocked_retrieve(question):
+        gate.wait(5)
+        return []
+
+    pipeline = AnswerPipeline(llm_factory=lambda: model, max_concurrency=1, queue_size=1)
+    try:
+        # One request in flight, one held by the dispatcher, one in the queue
+        requests = [pipeline.submit(f"q{i}", timeout=1, retrieve=blocked_retrieve) for i in range(2)]
+        assert wait_for(lambda: pipeline.stats()["in_flight"] == 1 and pipeline.stats()["queued"] == 0)
+        requests.append(pipeline.submit("q2", timeout=1, retrieve=blocked_retrieve))
+        with pytest.raises(PipelineBusyError):
+            pipeline.submit("q3", timeout=0.05, retrieve=blocked_retrieve)
+        gate.set()
+        for request in requests:
+            assert list(request.stream(timeout=5))
+        stats = pipeline.stats()
+        assert stats["rejected"] == 1
+        assert stats["completed"] == 3
+        assert stats["max_in_flight"] == 1
+    finally:
+        gate.set()
+        pipeline.close()
+
+
+def test_concurrency_is_bounded():
+    model = FakeGenerativeModel(latency=0.02)
+    pipeline = AnswerPipeline(llm_factory=lambda: model, max_concurrency=3, queue_size=32)
+    try:
+        requests = [pipeline.submit(f"q{i}") for i in range(12)]
+        for request in requests:
+            list(request.stream(timeout=5))
+        stats = pipeline.stats()
+        assert stats["completed"] == 12
+        assert 1 <= stats["max_in_flight"] <= 3
+    finally:
+        pipeline.close()
+
+
+def test_close_cancels_in_flight_requests():
+    model = FakeGenerativeModel(latency=30.0)
+    pipeline = AnswerPipeline(llm_factory=lambda: model, max_concurrency=1, queue_size=4)
+    request = pipeline.submit("Why?")
+    assert wait_for(lambda: model.calls == 1)
+    start = time.perf_counter()
+    pipeline.close()
+    # The stream ends (without an answer) instead of waiting for the slow model
+    assert list(request.stream(timeout=5)) == []
+    assert request.done.is_set()
+    assert time.perf_counter() - start < 5
+    assert not pipeline._thread.is_alive()
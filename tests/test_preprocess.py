@@ -0,0 +1,97 @@
+"""
+Vectorized dataframe_to_chunks / iter_csv_chunks against the original
+iterrows() conversion they replaced, and streamed row documents against
+the in-memory ones for several block sizes.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import pytest
+
+from src.preprocess import (chunk_text, dataframe_to_chunks, dataframe_to_documents, iter_csv_chunks,
+                            iter_csv_documents, load_and_clean_csv)
+
+DATA_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "loan_data.csv.csv")
+
+
+def iterrows_to_chunks(df: pd.DataFrame, fields, max_length: int = 300):
+    # The original row-by-row conversion
+    all_chunks = []
+    for _, row in df.iterrows():
+        combined = " ".join([str(row[field]) for field in fields if field in row])
+        all_chunks.extend(chunk_text(combined, max_length=max_length))
+    return all_chunks
+
+
+@pytest.fixture(scope="module")
+def loans() -> pd.DataFrame:
+    return load_and_clean_csv(DATA_CSV)
+
+
+def test_loan_csv_matches_iterrows(loans):
+    fields = [col for col in loans.columns if col != "loan_id"]
+    assert dataframe_to_chunks(loans, fields) == iterrows_to_chunks(loans, fields)
+
+
+def test_missing_fields_are_skipped(loans):
+    fields = ["gender", "no_such_column", "loan_status"]
+    assert dataframe_to_chunks(loans, fields) == iterrows_to_chunks(loans, fields)
+
+
+@pytest.mark.parametrize("frame", [
+    # All-numeric frames are upcast row-wise by iterrows (1 -> 1.0)
+    pd.DataFrame({"a": [1, 2, 3], "b": [0.5, 1.5, 2.5]}),
+    pd.DataFrame({"a": [1, 2], "b": [3, 4]}),
+    pd.DataFrame({"text": ["", "  ", "one two"], "n": [1, 2, 3]}),
+    pd.DataFrame({"a": pd.Series([], dtype=object)}),
+])
+def test_edge_frames_match_iterrows(frame):
+    fields = list(frame.columns)
+    assert dataframe_to_chunks(frame, fields) == iterrows_to_chunks(frame, fields)
+
+
+def test_long_rows_are_split_like_iterrows():
+    frame = pd.DataFrame({"text": [" ".join(f"w{i}" for i in range(25)), "short row"], "n": ["x", "y"]})
+    assert dataframe_to_chunks(frame, ["text", "n"], max_length=10) == iterrows_to_chunks(frame, ["text", "n"], 10)
+
+
+def test_streamed_csv_matches_in_memory(loans, tmp_path):
+    csv_path = tmp_path / "loans.csv"
+    pd.read_csv(DATA_CSV).to_csv(csv_path, index=False)
+    fields = [col for col in loans.columns if col != "loan_id"]
+    streamed = list(iter_csv_chunks(str(csv_path), exclude=["loan_id"], block_rows=50))
+    assert streamed == iterrows_to_chunks(loans, fields)
+
+
+@pytest.fixture(scope="module")
+def mixed_csv(tmp_path_factory):
+    # Early rows alone would infer dependents as int and loanamount as int
+    path = tmp_path_factory.mktemp("csv") / "mixed.csv"
+    path.write_text("Loan_ID,Dependents,LoanAmount,Credit_History,Property_Area,Notes\n"
+                    "LP1,0,158,1,Urban,7\n"
+                    "LP2,1,120,0,Rural,8\n"
+                    "LP3,3+,,,Semiurban,n/a\n"
+                    "LP4,,99.5,1,,\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("csv_name", ["data", "mixed"])
+def test_documents_do_not_depend_on_block_rows(csv_name, mixed_csv):
+    csv_path = DATA_CSV if csv_name == "data" else mixed_csv
+    in_memory = load_and_clean_csv(csv_path)
+    fields = [col for col in in_memory.columns if col != "loan_id"]
+    expected = dataframe_to_documents(in_memory, fields)
+    for block_rows in ((1, 2, 3, 10_000) if csv_name == "mixed" else (7, 50, 10_000)):
+        assert list(iter_csv_documents(csv_path, exclude=["loan_id"], block_rows=block_rows)) == expected
+
+
+def test_document_values_are_typed_consistently(mixed_csv):
+    documents = list(iter_csv_documents(mixed_csv, exclude=["loan_id"], block_rows=1))
+    assert [meta["dependents"] for _, meta in documents] == ["0", "1", "3+", None]
+    assert [meta["credit_history"] for _, meta in documents] == [1, 0, None, 1]
+    assert documents[0][0] == "dependents: 0 | loanamount: 158.0 | credit_history: 1.0 | property_area: Urban | notes: 7"
+    assert documents[3][0] == "loanamount: 99.5 | credit_history: 1.0"
@@ -0,0 +1,83 @@
+"""
+Token-budgeted prompt assembly: the prompt stays within the budget, context
+keeps retrieval order and the most recent turns win, measured with the local
+estimator.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.chunker import estimate_tokens
+from src.prompt_builder import HISTORY_TURNS, SUMMARY_PREFIX, build_prompt, truncate_tokens
+
+CONTEXT = [f"Chunk {i}: home loan rule number {i} says lenders check income, credit score and existing debts."
+           for i in range(40)]
+HISTORY = [(f"question {i} about loan tenure?", f"answer {i} " + "the bank explains the terms in detail " * 40)
+           for i in range(6)]
+QUESTION = "What credit score do I need for a home loan?"
+
+
+def build(budget, context=CONTEXT, history=HISTORY, **kwargs):
+    stats = {}
+    prompt = build_prompt(QUESTION, context, history, budget=budget, tokenizer="estimate", stats=stats, **kwargs)
+    return prompt, stats
+
+
+@pytest.mark.parametrize("budget", [400, 600, 900, 1500, 3000])
+def test_prompt_stays_within_the_budget(budget):
+    prompt, stats = build(budget)
+    assert stats["prompt_tokens"] == estimate_tokens(prompt)
+    assert stats["prompt_tokens"] <= budget
+    assert QUESTION in prompt
+    assert stats["context_chunks"] + stats["context_chunks_dropped"] == len(CONTEXT)
+    assert stats["history_turns"] + stats["history_turns_dropped"] == HISTORY_TURNS
+
+
+def test_context_keeps_retrieval_order_and_recent_turns_win():
+    prompt, stats = build(1000)
+    assert 0 < stats["history_turns"] < HISTORY_TURNS
+    assert 0 < stats["context_chunks"] < len(CONTEXT)
+    kept = [chunk for chunk in CONTEXT if chunk in prompt]
+    assert kept == CONTEXT[:len(kept)]
+    assert [prompt.index(chunk) for chunk in kept] == sorted(prompt.index(chunk) for chunk in kept)
+    # Dropped turns are the oldest ones
+    turns = [q for q, _ in HISTORY[-HISTORY_TURNS:] if q in prompt]
+    assert turns == [q for q, _ in HISTORY[-HISTORY_TURNS:]][HISTORY_TURNS - len(turns):]
+    assert stats["history_turns"] == len(turns)
+
+
+def test_long_answers_are_truncated_and_summary_fits_a_large_budget():
+    prompt, stats = build(3000, summary="the user compared loan tenures")
+    assert (stats["context_chunks_dropped"], stats["history_turns_dropped"]) == (0, 0)
+    assert stats["history_summary"] is True
+    assert SUMMARY_PREFIX + "the user compared loan tenures" in prompt
+    assert HISTORY[-1][1] not in prompt
+    assert HISTORY[0][0] not in prompt
+
+
+def test_summary_is_left_out_when_recent_turns_were_dropped():
+    prompt, stats = build(600, summary="the user compared loan tenures")
+    assert stats["history_turns_dropped"] > 0
+    assert SUMMARY_PREFIX not in prompt
+    assert stats["history_summary"] is False
+
+
+def test_weak_context_uses_the_general_template():
+    prompt, stats = build(3000, context=["", "  ", "EMI calc"])
+    assert "Retrieved Context" not in prompt
+    assert stats["context_chunks"] == 0
+    assert "EMI calc" not in prompt
+
+
+def test_truncate_tokens_cuts_on_words():
+    text = " ".join(f"word{i}" for i in range(100))
+    cut = truncate_tokens(text, 20, estimate_tokens)
+    assert estimate_tokens(cut) <= 20
+    assert cut.endswith(" …")
+    assert text.startswith(cut[:-2])
+    assert truncate_tokens("short text", 20, estimate_tokens) == "short text"
+    assert truncate_tokens(text, 0, estimate_tokens) == ""
@@ -0,0 +1,91 @@
+"""
+Cross-encoder reranking with a fake model: score order, the score cache and
+the latency budget (retrieval order when scoring is slow, busy or failing).
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+from src.reranker import Reranker
+
+
+class FakeCrossEncoder:
+    """
+    Scores a (query, text) pair by the number of query words in the text;
+    each predict() call takes delay seconds and raises error, if given.
+    """
+
+    def __init__(self, delay: float = 0.0, error: Exception = None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.done = threading.Event()
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        scores = [sum(word in text.lower().split() for word in query.lower().split()) for query, text in pairs]
+        self.done.set()
+        return scores
+
+
+DOCS = [Document(id=f"d{i}", page_content=text) for i, text in enumerate([
+    "Personal loans are unsecured.",
+    "Home loan interest starts near 8.5 percent.",
+    "Car loans need a down payment.",
+    "home loan rates depend on your credit score and the home value.",
+])]
+QUERY = "home loan rates"
+
+
+def contents(docs):
+    return [doc.page_content for doc in docs]
+
+
+def test_rerank_orders_by_score_and_caches_scores():
+    model = FakeCrossEncoder()
+    reranker = Reranker(model=model, batch_size=2, budget_seconds=1.0)
+    timings = {}
+    assert contents(reranker.rerank(QUERY, DOCS, 2, timings=timings)) == [DOCS[3].page_content, DOCS[1].page_content]
+    assert timings["rerank_fallback"] is False
+    assert model.calls == 2
+    # Whitespace-normalized repeat: served from the cache
+    assert contents(reranker.rerank(" home  loan rates", DOCS, 2)) == [DOCS[3].page_content, DOCS[1].page_content]
+    assert model.calls == 2
+    stats = reranker.stats()
+    assert (stats["pairs_scored"], stats["cache_hits"], stats["fallbacks"]) == (4, 4, 0)
+
+
+def test_budget_cutoff_keeps_retrieval_order_and_scores_in_background():
+    model = FakeCrossEncoder(delay=0.3)
+    reranker = Reranker(model=model, batch_size=8, budget_seconds=0.05)
+    timings = {}
+    start = time.perf_counter()
+    assert contents(reranker.rerank(QUERY, DOCS, 2, timings=timings)) == contents(DOCS[:2])
+    assert time.perf_counter() - start < 0.25
+    assert timings["rerank_fallback"] is True
+
+    # A different query arriving while that job still runs does not queue behind it
+    assert contents(reranker.rerank("car loans", DOCS, 2)) == contents(DOCS[:2])
+    assert reranker.stats()["busy_skips"] == 1
+
+    # The late scores are cached: the next identical query is reranked without waiting
+    assert model.done.wait(2.0)
+    reranker._pending.result()
+    assert contents(reranker.rerank(QUERY, DOCS, 2, budget_seconds=0.0)) == [DOCS[3].page_content, DOCS[1].page_content]
+    assert reranker.stats()["fallbacks"] == 2
+
+
+def test_scoring_errors_fall_back_to_retrieval_order():
+    reranker = Reranker(model=FakeCrossEncoder(error=RuntimeError("boom")), budget_seconds=1.0)
+    assert contents(reranker.rerank(QUERY, DOCS, 3)) == contents(DOCS[:3])
+    stats = reranker.stats()
+    assert (stats["errors"], stats["fallbacks"]) == (1, 1)
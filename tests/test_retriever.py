@@ -0,0 +1,313 @@
+"""
+Resident retriever over small indexes built with a deterministic fake
+embedding model: index hot swaps, filters, hybrid fusion, MMR, overlays,
+the query embedding cache and compact storage rescoring.
+"""
+
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.embeddings import Embeddings
+
+import src.embedder as E
+import src.retriever as R
+from src.chunker import chunk_document, estimate_tokens
+from src.docstore import read_index_mmap
+
+LOANS = [(f"Loan row {i}: property_area {area}, education {education}, applicant income {1000 * i}.",
+          {"source": "loan_csv", "property_area": area, "education": education})
+         for i, (area, education) in enumerate([("Urban", "Graduate"), ("Rural", "Graduate"), ("Semiurban", "Not Graduate"),
+                                                ("Rural", "Not Graduate"), ("Urban", "Not Graduate"), ("Rural", "Graduate")] * 4)]
+
+
+@pytest.fixture
+def embedding(monkeypatch):
+    fake = DeterministicFakeEmbedding(size=32)
+    monkeypatch.setattr(E, "get_embedding_model", lambda *args, **kwargs: fake)
+    monkeypatch.setattr(R, "get_embeddings", lambda *args, **kwargs: fake)
+    return fake
+
+
+def build(index_path, documents=LOANS, **kwargs) -> str:
+    E.build_and_save_faiss_index(documents, str(index_path), **{"index_type": "flat", "storage": "float32", **kwargs})
+    return str(index_path)
+
+
+def resident_for(index_path, **kwargs) -> R.ResidentRetriever:
+    resident = R.ResidentRetriever(index_path=str(index_path), check_interval=0.0, microbatch=False, **kwargs)
+    # Loaded up front, so hybrid queries do not take the lexical fast path
+    resident.get_embedding()
+    return resident
+
+
+def test_hot_swap_closes_old_docstore_after_its_last_lease(embedding, tmp_path):
+    resident = resident_for(build(tmp_path / "index"))
+    with resident.leased_vectorstore() as old:
+        build(tmp_path / "index", LOANS[:10])
+        new = resident.get_vectorstore()
+        assert new is not old and new.index.ntotal == 10
+        stats = resident.stats()
+        assert (stats["hot_swaps"], stats["retired_vectorstores"], stats["docstores_closed"]) == (1, 1, 0)
+        # The in-flight search can still fetch its documents from the old index
+        assert old.docstore.search(old.index_to_docstore_id[20]).page_content == LOANS[20][0]
+    stats = resident.stats()
+    assert (stats["leased_vectorstores"], stats["retired_vectorstores"], stats["docstores_closed"]) == (0, 0, 1)
+    with pytest.raises(sqlite3.ProgrammingError):
+        old.docstore.search(old.index_to_docstore_id[0])
+    assert resident.search(LOANS[3][0], k=1)[0][0].page_content == LOANS[3][0]
+
+
+def test_hot_swap_without_leases_closes_immediately(embedding, tmp_path):
+    resident = resident_for(build(tmp_path / "index"))
+    old = resident.get_vectorstore()
+    build(tmp_path / "index", LOANS[:10])
+    assert resident.get_vectorstore() is not old
+    assert resident.stats()["docstores_closed"] == 1
+
+
+def positions_where(predicate):
+    return [i for i, (_, metadata) in enumerate(LOANS) if predicate(metadata)]
+
+
+def test_metadata_bitmaps_match_filters(embedding, tmp_path):
+    resident = resident_for(build(tmp_path / "index"))
+    metadata_index = resident.get_metadata_index(resident.get_vectorstore())
+    assert metadata_index.match({"property_area": "rural"}).tolist() == positions_where(lambda m: m["property_area"] == "Rural")
+    assert metadata_index.match({"property_area": ["Urban", "Semiurban"], "education": "Graduate"}).tolist() == positions_where(
+        lambda m: m["property_area"] in ("Urban", "Semiurban") and m["education"] == "Graduate")
+    assert metadata_index.match({"property_area": "Downtown"}).tolist() == []
+    with pytest.raises(ValueError, match="Unsupported filter field"):
+        metadata_index.match({"colour": "red"})
+
+
+@pytest.mark.parametrize("mode", ["vector", "hybrid"])
+def test_filtered_search_returns_only_matching_documents(mode, embedding, tmp_path):
+    resident = resident_for(build(tmp_path / "index"))
+    filters = {"property_area": "Rural", "education": "Not Graduate"}
+    expected = {LOANS[i][0] for i in positions_where(lambda m: m["property_area"] == "Rural" and m["education"] == "Not Graduate")}
+    results = R.search_with_overlay(LOANS[0][0], k=10, resident=resident, filters=filters, mode=mode)
+    assert {doc.page_content for doc, _ in results} == expected
+    assert {doc.page_content for doc, _ in resident.search(LOANS[0][0], k=2, filters=filters)} <= expected
+
+
+UPLOAD = "MY BANK LETTER\nThe lender approved a top-up loan of 5 lakh. The interest rate is 9.1 percent per year."
+
+
+def test_overlay_results_merge_with_the_base_index(embedding, tmp_path, monkeypatch):
+    # The local estimator instead of the MiniLM tokenizer, which is not downloaded in tests
+    monkeypatch.setattr(R, "chunk_document", lambda text: chunk_document(text, max_tokens=12, counter=estimate_tokens))
+    resident = resident_for(build(tmp_path / "index"))
+    overlay = R.SessionOverlay(resident)
+    added = overlay.add_document(UPLOAD, "letter.txt")
+    assert added >= 1
+    assert overlay.add_document(UPLOAD, "letter.txt") == 0
+    chunk = overlay.document_at(0).page_content
+
+    results = R.search_with_overlay(chunk, k=5, resident=resident, overlay=overlay, mode="vector")
+    assert results[0][0].page_content == chunk and results[0][0].metadata["path"] == "letter.txt"
+    distances = [score for _, score in results]
+    assert distances == sorted(distances)
+    assert any(doc.metadata["source"] == "loan_csv" for doc, _ in results)
+
+    hybrid = R.search_with_overlay("top-up loan interest rate", k=5, resident=resident, overlay=overlay, mode="hybrid")
+    assert {doc.metadata["source"] for doc, _ in hybrid} == {"upload", "loan_csv"}
+    uploads_only = R.search_with_overlay("loan", k=5, resident=resident, overlay=overlay, filters={"source": "upload"})
+    assert len(uploads_only) == min(5, added) and {doc.metadata["source"] for doc, _ in uploads_only} == {"upload"}
+
+
+def test_query_cache_is_an_lru_keyed_on_normalized_text():
+    cache = R.QueryEmbeddingCache(max_entries=2, path=None)
+    cache.put("What is CIBIL?", [1.0, 0.0])
+    assert cache.get("  What is   CIBIL? ") is not None
+    cache.put("b", [0.0, 1.0])
+    cache.get("What is CIBIL?")
+    cache.put("c", [1.0, 1.0])
+    assert "What is CIBIL?" in cache and "b" not in cache and "c" in cache
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (2, 1, 1, 2)
+
+
+def test_query_cache_persists_per_model(tmp_path):
+    path = str(tmp_path / "queries.npz")
+    cache = R.QueryEmbeddingCache(path=path, model_name="model-a")
+    cache.put("q1", [0.5, 0.25])
+    cache.save()
+    restored = R.QueryEmbeddingCache(path=path, model_name="model-a")
+    assert restored.stats()["loaded"] == 1
+    np.testing.assert_array_equal(restored.get("q1"), np.array([0.5, 0.25], dtype="float32"))
+    assert len(R.QueryEmbeddingCache(path=path, model_name="model-b")) == 0
+
+
+def test_resident_embeds_each_query_once(embedding, tmp_path, monkeypatch):
+    calls, embed_query = [], DeterministicFakeEmbedding.embed_query
+    monkeypatch.setattr(DeterministicFakeEmbedding, "embed_query", lambda self, text: calls.append(text) or embed_query(self, text))
+    resident = resident_for(build(tmp_path / "index"))
+    first = resident.embed_query("home loan rates")
+    second = resident.embed_query(" home  loan rates ")
+    np.testing.assert_array_equal(first, second)
+    assert calls == ["home loan rates"]
+
+
+def test_reciprocal_rank_fusion_orders_by_summed_reciprocal_ranks():
+    fused = R.reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], rrf_k=60)
+    assert [key for key, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[1][1] == pytest.approx(1 / 63 + 1 / 61)
+    assert fused[2][1] == pytest.approx(1 / 62)
+
+
+def test_hybrid_search_fuses_vector_and_lexical_rankings(embedding, tmp_path):
+    resident = resident_for(build(tmp_path / "index"))
+    vectorstore = resident.get_vectorstore()
+    query = "applicant income 7000 Semiurban"
+    candidates = R.HYBRID_CANDIDATES
+    _, vector_hits = R.search_positions(vectorstore.index, resident.embed_query(query), candidates)
+    _, lexical_hits = resident.get_lexical_index(vectorstore).search(query, candidates)
+    expected = R.reciprocal_rank_fusion([[("base", int(p)) for p in vector_hits], [("base", int(p)) for p in lexical_hits]])[:5]
+
+    timings = {}
+    results = R.search_with_overlay(query, k=5, resident=resident, mode="hybrid", timings=timings)
+    assert [(doc.page_content, score) for doc, score in results] == [
+        (LOANS[position][0], pytest.approx(score)) for (_, position), score in expected]
+    # The loan with the exact income is the strongest lexical match and survives fusion
+    assert lexical_hits[0] == 7
+    assert LOANS[7][0] in [doc.page_content for doc, _ in results]
+    assert timings["retrieval_mode"] == "hybrid"
+    assert {"embed_time", "lexical_search_time", "fusion_time", "fetch_time"} <= set(timings)
+
+
+class TableEmbedding(Embeddings):
+    """
+    Fixed vectors per text, to place documents at chosen angles from the query.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def embed_documents(self, texts):
+        return [self.table[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.table[text]
+
+
+def unit(*values, dim: int = 32):
+    vector = np.zeros(dim, dtype="float32")
+    vector[:len(values)] = values
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def mmr_table():
+    # Three copies of the best match, and a slightly less relevant but different chunk
+    table = {"query": unit(1, 0, 0), "other": unit(0.8, -0.1, 0.6)}
+    table.update({f"duplicate {i}": unit(0.9, 0.436, 0) for i in range(3)})
+    # Unrelated fillers, orthogonal to everything above
+    table.update({f"filler {i}": unit(*([0] * (3 + i % 29) + [1])) for i in range(77)})
+    return table
+
+
+def test_mmr_select_prefers_diverse_rows():
+    table = mmr_table()
+    vectors = np.array([table["duplicate 0"], table["duplicate 1"], table["other"], table["filler 0"]])
+    assert R.mmr_select(table["query"], vectors, 2) == [0, 2]
+    assert R.mmr_select(table["query"], vectors, 2, lambda_mult=1.0) == [0, 1]
+    assert R.mmr_select(table["query"], vectors, 10) == [0, 2, 1, 3]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+def test_mmr_diversifies_results(index_type, tmp_path, monkeypatch):
+    table = mmr_table()
+    embedding = TableEmbedding(table)
+    monkeypatch.setattr(E, "get_embedding_model", lambda *args, **kwargs: embedding)
+    monkeypatch.setattr(R, "get_embeddings", lambda *args, **kwargs: embedding)
+    documents = [(text, {"source": "docs", "path": text}) for text in table if text != "query"]
+    resident = resident_for(build(tmp_path / "index", documents, index_type=index_type))
+    # Memory-mapped IVF indexes return their vectors too, so MMR is not skipped
+    assert (faiss.try_extract_index_ivf(resident.get_vectorstore().index) is not None) == (index_type == "ivf_flat")
+
+    plain = R.search_with_overlay("query", k=2, resident=resident, mode="vector", mmr=False)
+    assert [doc.page_content for doc, _ in plain] == ["duplicate 0", "duplicate 1"]
+    timings = {}
+    diverse = R.search_with_overlay("query", k=2, resident=resident, mode="vector", mmr=True, timings=timings)
+    assert [doc.page_content for doc, _ in diverse] == ["duplicate 0", "other"]
+    assert "mmr_time" in timings and "mmr_skipped" not in timings
+
+
+def test_candidate_vectors_of_memory_mapped_ivf(tmp_path):
+    vectors = np.random.default_rng(0).standard_normal((200, 8)).astype("float32")
+    ivf = faiss.IndexIVFFlat(faiss.IndexFlatL2(8), 8, 4)
+    ivf.train(vectors)
+    ivf.add(vectors)
+    faiss.write_index(ivf, str(tmp_path / "ivf.faiss"))
+    mapped = read_index_mmap(str(tmp_path / "ivf.faiss"))
+    assert R.reconstruct_vectors(mapped, [3, 150]) is None
+    R.enable_reconstruct(mapped)
+    np.testing.assert_array_equal(R.reconstruct_vectors(mapped, [3, 150]), vectors[[3, 150]])
+
+
+class BackendEmbedding(TableEmbedding):
+    def __init__(self, table, backend: str):
+        super().__init__(table)
+        self.backend = backend
+
+
+def test_query_cache_is_keyed_by_the_backend_that_loaded(tmp_path, monkeypatch):
+    path = str(tmp_path / "queries.npz")
+    reference = R.QueryEmbeddingCache(path=path, model_name=R.EMBED_MODEL)
+    reference.put("home loan rates", unit(1, 0))
+    reference.save()
+
+    def resident_with_backend(backend: str) -> R.ResidentRetriever:
+        resident = R.ResidentRetriever(index_path=str(tmp_path), microbatch=False, backend=backend)
+        assert resident.query_cache.model_name == R.EMBED_MODEL + "+" + backend
+        # The persisted cache, as QUERY_CACHE_PATH would give
+        resident.query_cache = R.QueryEmbeddingCache(path=path, model_name=resident.query_cache.model_name)
+        return resident
+
+    # onnx configured but fell back to torch: the torch vectors are valid
+    monkeypatch.setattr(R, "get_embeddings", lambda *args, **kwargs: TableEmbedding({}))
+    resident = resident_with_backend("onnx")
+    assert "home loan rates" not in resident.query_cache
+    resident.get_embedding()
+    assert resident.query_cache.model_name == R.EMBED_MODEL
+    np.testing.assert_array_equal(resident.embed_query("home loan rates"), np.array(unit(1, 0), dtype="float32"))
+
+    # onnx loaded: torch vectors must not be reused
+    monkeypatch.setattr(R, "get_embeddings", lambda *args, **kwargs: BackendEmbedding({"home loan rates": unit(0, 1)}, "onnx"))
+    resident = resident_with_backend("onnx")
+    resident.get_embedding()
+    assert resident.query_cache.model_name == R.EMBED_MODEL + "+onnx"
+    np.testing.assert_array_equal(resident.embed_query("home loan rates"), np.array(unit(0, 1), dtype="float32"))
+
+
+def test_rescore_orders_candidates_by_exact_distance():
+    vectors = np.array([unit(1, 0), unit(0, 1), unit(1, 1), unit(0, 0, 1)], dtype="float32")
+    distances, positions = R.rescore(vectors, unit(1, 0), np.array([3, 2, 0]), k=2)
+    assert positions.tolist() == [0, 2]
+    np.testing.assert_allclose(distances, [0.0, 2 - np.sqrt(2)], atol=1e-6)
+    assert R.rescore(vectors, unit(1, 0), np.array([], dtype="int64"), k=2)[1].size == 0
+
+
+@pytest.mark.parametrize("storage", ["int8", "float16"])
+def test_compact_storage_rescoring_agrees_with_float32(storage, embedding, tmp_path):
+    documents = [(f"Loan application {i} for branch {i % 7}, tenure {i % 30} years.", {"source": "loan_csv"})
+                 for i in range(300)]
+    exact = resident_for(build(tmp_path / "float32", documents))
+    compact = resident_for(build(tmp_path / storage, documents, storage=storage))
+    with compact.leased_vectorstore() as vectorstore:
+        assert compact.get_exact_vectors(vectorstore).shape == (300, 32)
+    for i in range(0, 300, 37):
+        query = documents[i][0]
+        expected, results = exact.search(query, k=5), compact.search(query, k=5)
+        assert [doc.page_content for doc, _ in results] == [doc.page_content for doc, _ in expected]
+        # Rescoring reports exact distances, not quantized ones
+        np.testing.assert_allclose([score for _, score in results], [score for _, score in expected], rtol=1e-5, atol=1e-5)
+        assert results[0][0].page_content == query
@@ -0,0 +1,95 @@
+"""
+Routing of aggregate questions to the stats cube: parsing, negation, and
+when the cube answers directly, as LLM context, or not at all.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import pytest
+
+from src.preprocess import load_and_clean_csv
+from src.stats import answer_stats_query, build_stats_cube, parse_stats_query
+
+DATA_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "loan_data.csv.csv")
+
+
+@pytest.fixture(scope="module")
+def cube():
+    return build_stats_cube(DATA_CSV)
+
+
+@pytest.fixture(scope="module")
+def loans() -> pd.DataFrame:
+    return load_and_clean_csv(DATA_CSV)
+
+
+def approval_rate(frame: pd.DataFrame) -> str:
+    return f"{(frame['loan_status'] == 'Y').mean():.1%}"
+
+
+@pytest.mark.parametrize("question, filters", [
+    ("approval rate of applicants who are not self-employed", {"self_employed": "No"}),
+    ("approval rate for non self-employed applicants", {"self_employed": "No"}),
+    ("approval rate for applicants who aren't married", {"married": "No"}),
+    ("approval rate for applicants who are not a graduate", {"education": "Not Graduate"}),
+    ("approval rate for non-graduates", {"education": "Not Graduate"}),
+    ("approval rate without good credit history", {"credit_history": "0"}),
+    ("approval rate for applicants not male", {"gender": "Female"}),
+])
+def test_negation_selects_the_other_value(question, filters):
+    metric, parsed_filters, group_by, unparsed = parse_stats_query(question)
+    assert (metric, parsed_filters, group_by, unparsed) == ("approval_rate", filters, None, [])
+
+
+def test_negated_answer_matches_the_data(cube, loans):
+    stats = answer_stats_query("approval rate of applicants who are not self-employed", cube)
+    assert stats.direct
+    expected = approval_rate(loans[loans["self_employed"] == "No"])
+    assert stats.facts == [f"Loan dataset: Approval rate for Self-employed = No: {expected} "
+                           f"across {(loans['self_employed'] == 'No').sum():,} applicants"]
+
+
+@pytest.mark.parametrize("question", [
+    # Negating a value of a many-valued dimension names several groups at once
+    "approval rate for non-urban applicants",
+    "approval rate for women not in rural areas",
+    # Two dimensions with several values each: neither can be the single group-by
+    "approval rate for urban and rural graduates vs non-graduates",
+    # Qualifiers outside the dataset
+    "approval rate at hdfc for graduates",
+    "average loan amount for car loans",
+])
+def test_unparsed_qualifiers_get_no_numbers(cube, question):
+    assert parse_stats_query(question)[3]
+    assert answer_stats_query(question, cube) is None
+
+
+def test_values_of_one_dimension_become_a_group_by(cube, loans):
+    metric, filters, group_by, unparsed = parse_stats_query("approval rate urban vs rural")
+    assert (filters, group_by, unparsed) == ({}, "property_area", [])
+    stats = answer_stats_query("approval rate urban vs rural", cube)
+    assert stats.direct
+    for area in ("Rural", "Semiurban", "Urban"):
+        assert f"Property area = {area}**: {approval_rate(loans[loans['property_area'] == area])}" in stats.answer
+
+
+def test_filter_combined_with_group_by(cube, loans):
+    stats = answer_stats_query("approval rate by credit history for graduates", cube)
+    assert stats.direct
+    graduates = loans[loans["education"] == "Graduate"]
+    assert approval_rate(graduates[graduates["credit_history"] == 1.0]) in stats.answer
+
+
+def test_explain_questions_get_the_numbers_as_context(cube):
+    stats = answer_stats_query("why is the approval rate for self-employed applicants low", cube)
+    assert not stats.direct
+    assert stats.facts and all(fact.startswith("Loan dataset: Approval rate for Self-employed = Yes") for fact in stats.facts)
+
+
+def test_non_aggregate_questions_are_not_routed(cube):
+    assert parse_stats_query("what documents do I need for a home loan") is None
+    assert answer_stats_query("what documents do I need for a home loan", cube) is None